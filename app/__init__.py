@@ -6,9 +6,7 @@ from __future__ import unicode_literals
 
 import os
 import flask_s3
-import boto3
 import sqlalchemy
-from botocore.client import Config
 from flasgger import Swagger
 from flask import Flask, session, request, g
 from flask_cors import CORS
@@ -21,11 +19,16 @@ from .database import db
 from .logic import ma, User
 from app.auth.controllers import auth_blueprint, bitstore_blueprint
 from app.auth.jwt import JWT
+from app.jobs.controllers import jobs_blueprint
 from app.package.controllers import package_blueprint
 from app.site.controllers import site_blueprint
 from app.profile.controllers import profile_blueprint
 from app.search.controllers import search_blueprint
+from app.storage import create_storage_client
+from app.storage.controllers import storage_blueprint
 from app.utils import InvalidUsage
+from app.utils.cache import ObjectCache
+from app.utils.rendering import MarkdownRenderer
 from flask import jsonify
 
 app_config = {
@@ -86,13 +89,20 @@ def create_app():
     app.register_blueprint(profile_blueprint)
     app.register_blueprint(search_blueprint)
     app.register_blueprint(bitstore_blueprint)
-    s3 = boto3.client('s3',
-                      region_name=app.config['AWS_REGION'],
-                      aws_access_key_id=app.config['AWS_ACCESS_KEY_ID'],
-                      config=Config(signature_version='s3v4'),
-                      aws_secret_access_key=app.config['AWS_SECRET_ACCESS_KEY']
-                      )
-    app.config['S3'] = s3
+    app.register_blueprint(storage_blueprint)
+    app.register_blueprint(jobs_blueprint)
+    app.config['S3'] = create_storage_client(app.config)
+    if app.config['BITSTORE_CACHE_SIZE']:
+        app.config['BITSTORE_CACHE'] = ObjectCache(
+            maxsize=app.config['BITSTORE_CACHE_SIZE'],
+            max_object_size=app.config['BITSTORE_CACHE_MAX_OBJECT_SIZE'],
+            maxbytes=app.config['BITSTORE_CACHE_MAX_BYTES'],
+            directory=app.config['BITSTORE_CACHE_DIR'])
+
+    app.config['MARKDOWN_RENDERER'] = MarkdownRenderer(
+        pool_size=app.config['MARKDOWN_POOL_SIZE'],
+        max_size=app.config['MARKDOWN_MAX_SIZE'],
+        timeout=app.config['MARKDOWN_TIMEOUT'])
 
     oauth = OAuth(app=app)
     CORS(app)
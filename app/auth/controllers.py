@@ -141,3 +141,91 @@ def authorize_upload():
     """
     payload = logic.generate_signed_url()
     return jsonify(payload), 200
+
+
+@bitstore_blueprint.route('/multipart/parts', methods=['POST'])
+def get_multipart_upload_parts():
+    """
+    Lists the received parts of a multipart upload and generates signed
+    URLs for the requested parts, e.g. to resume an interrupted upload.
+    ---
+    tags:
+        - package
+    parameters:
+        - in: body
+          name: data
+          type: map
+          required: true
+          description: publisher and package name (metadata), path,
+            upload_id and the part_numbers to sign
+    responses:
+        200:
+            description: Success
+            schema:
+                id: get_multipart_upload_parts
+                properties:
+                    uploaded:
+                        type: array
+                        description: PartNumber, ETag and Size of received parts
+                    parts:
+                        type: array
+                        description: part_number and signed url of parts
+        400:
+            description: Unauthorized or path and upload_id missing
+        404:
+            description: Upload not found
+    """
+    payload = logic.get_multipart_upload_parts()
+    return jsonify(payload), 200
+
+
+@bitstore_blueprint.route('/multipart/complete', methods=['POST'])
+def complete_multipart_upload():
+    """
+    Completes a multipart upload started by /api/datastore/authorize
+    ---
+    tags:
+        - package
+    parameters:
+        - in: body
+          name: data
+          type: map
+          required: true
+          description: publisher and package name (metadata), path,
+            upload_id and the PartNumber and ETag of every part
+    responses:
+        200:
+            description: Success
+        400:
+            description: Unauthorized or invalid parts
+        404:
+            description: Upload not found
+    """
+    payload = logic.complete_multipart_upload()
+    return jsonify(payload), 200
+
+
+@bitstore_blueprint.route('/multipart/abort', methods=['POST'])
+def abort_multipart_upload():
+    """
+    Aborts a multipart upload and discards its parts
+    ---
+    tags:
+        - package
+    parameters:
+        - in: body
+          name: data
+          type: map
+          required: true
+          description: publisher and package name (metadata), path
+            and upload_id
+    responses:
+        200:
+            description: Success
+        400:
+            description: Unauthorized
+        404:
+            description: Upload not found
+    """
+    payload = logic.abort_multipart_upload()
+    return jsonify(payload), 200
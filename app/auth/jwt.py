@@ -7,6 +7,7 @@ from __future__ import unicode_literals
 import datetime
 import jwt
 from app.bitstore import BitStore
+from app.storage.keys import is_valid_key
 from app.utils import InvalidUsage
 
 class JWT(object):
@@ -51,20 +52,52 @@ class JWT(object):
 
 
 class FileData(object):
+    # the presigned post policy only allows public-read, multipart
+    # uploads are restricted the same way
+    allowed_acls = ('public-read',)
 
     def __init__(self, package_name, publisher,
-                 relative_path, props):
+                 relative_path, props, unchanged=False,
+                 bitstore=None, signer=None):
         self.package_name = package_name
         self.publisher = publisher
         self.relative_path = relative_path
         self.props = props
-        self.bitstore = BitStore(publisher=publisher,
-                                 package=package_name)
+        self.unchanged = unchanged
+        self.bitstore = bitstore or BitStore(publisher=publisher,
+                                             package=package_name)
+        self.signer = signer
+        self.validate()
+
+    def validate(self):
+        """
+        Checks the client supplied path, size and acl of the file.
+        :raises InvalidUsage: 400 if any is invalid
+        """
+        if not is_valid_key(self.relative_path):
+            raise InvalidUsage('Invalid path {0}'.format(self.relative_path),
+                               400)
+        size = self.props.get('size')
+        if size is not None:
+            try:
+                valid = int(size) >= 0
+            except (TypeError, ValueError):
+                valid = False
+            if not valid or isinstance(size, bool):
+                raise InvalidUsage('Invalid size for {0}'
+                                   .format(self.relative_path), 400)
+        if 'acl' in self.props and \
+                self.props['acl'] not in self.allowed_acls:
+            raise InvalidUsage('Invalid acl for {0}, expected one of {1}'
+                               .format(self.relative_path,
+                                       ', '.join(self.allowed_acls)), 400)
 
     def _generate_bitstore_url(self):
         kwargs = {}
         if 'acl' in self.props:
             kwargs['acl'] = self.props['acl']
+        if self.signer is not None:
+            kwargs['signer'] = self.signer
         post = self.bitstore.\
             generate_pre_signed_post_object(self.relative_path,
                                             md5=self.props['md5'],
@@ -81,6 +114,21 @@ class FileData(object):
         if 'acl' in self.props:
             response['acl'] = self.props['acl']
 
+        if self.unchanged:
+            # already stored with the same content, nothing to upload
+            response['unchanged'] = True
+            return response
+
+        size = self.props.get('size')
+        if self.bitstore.is_multipart_upload(size):
+            kwargs = {}
+            if 'acl' in self.props:
+                kwargs['acl'] = self.props['acl']
+            response['multipart'] = self.bitstore.\
+                create_multipart_upload(self.relative_path, int(size),
+                                        md5=self.props['md5'], **kwargs)
+            return response
+
         post = self._generate_bitstore_url()
         response['upload_url'] = post['url']
         response['upload_query'] = post['fields']
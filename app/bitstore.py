@@ -4,11 +4,104 @@ from __future__ import print_function
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+import base64
+import binascii
 import json
+import re
+import time
+from itertools import islice
+from multiprocessing.pool import ThreadPool
 
 from flask import current_app as app
 from botocore.exceptions import ClientError
 
+from app.storage.signer import create_post_signer
+from app.utils.http import external_url
+
+# S3 accepts at most 1000 keys per delete_objects call
+DELETE_BATCH_SIZE = 1000
+# how often bulk operations log their progress, in objects
+PROGRESS_INTERVAL = 1000
+# S3 limits for multipart uploads
+MAX_UPLOAD_PARTS = 10000
+MIN_UPLOAD_PART_SIZE = 5 * 1024 * 1024
+# S3 error codes which are worth another attempt
+RETRYABLE_ERRORS = ('SlowDown', 'Throttling', 'RequestTimeout',
+                    'RequestTimeTooSkewed', 'InternalError',
+                    'ServiceUnavailable', '500', '503')
+HEX_MD5 = re.compile(r'^[0-9a-fA-F]{32}$')
+
+
+class BatchResult(object):
+    """
+    Summary of a bulk operation over many S3 objects. It evaluates to
+    True only if no object failed, so callers can keep treating it
+    as a status.
+    """
+
+    def __init__(self):
+        self.succeeded = 0
+        self.failed = {}
+
+    def add_failure(self, key, reason):
+        self.failed[key] = reason
+
+    def __nonzero__(self):
+        return not self.failed
+
+    __bool__ = __nonzero__
+
+    def __repr__(self):
+        return '<BatchResult succeeded={0} failed={1}>'\
+            .format(self.succeeded, len(self.failed))
+
+
+def chunked(iterable, size):
+    """
+    Splits any iterable into lists of at most `size` items
+    without consuming it up front.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def call_with_retries(func, retries, backoff, **kwargs):
+    """
+    Calls func with the given keyword arguments and retries it up to
+    `retries` times on transient S3 errors, sleeping `backoff` seconds
+    before the first retry and doubling it for every next one.
+    """
+    attempt = 0
+    while True:
+        try:
+            return func(**kwargs)
+        except ClientError as e:
+            if e.response['Error']['Code'] not in RETRYABLE_ERRORS \
+                    or attempt >= retries:
+                raise
+            time.sleep(backoff * 2 ** attempt)
+            attempt += 1
+
+
+def run_concurrently(func, items, workers):
+    """
+    Applies func to every item on a bounded pool of threads and yields
+    the results in completion order. func runs outside of the flask
+    application context, so anything it needs from the config has to
+    be resolved before.
+    """
+    pool = ThreadPool(processes=max(1, workers))
+    try:
+        for result in pool.imap_unordered(func, items):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
 
 class BitStore(object):
     """
@@ -30,6 +123,10 @@ class BitStore(object):
             return False
         return True
 
+    @property
+    def content_addressed(self):
+        return app.config['BITSTORE_CONTENT_ADDRESSED']
+
     def save_metadata(self, acl='public-read'):
         """
         This method put metadata object to S3
@@ -39,6 +136,9 @@ class BitStore(object):
         key = self.build_s3_key('datapackage.json')
         s3_client.put_object(Bucket=bucket_name, Key=key,
                              Body=self.body, ACL=acl)
+        cache = app.config.get('BITSTORE_CACHE')
+        if cache is not None:
+            cache.delete(bucket_name, key)
 
     def get_metadata_body(self):
         """
@@ -46,55 +146,235 @@ class BitStore(object):
         publisher and package
         :return: The String value of the datapackage.json or None of not found
         """
-        key = self.build_s3_key('datapackage.json')
+        key = self.resolve_key('datapackage.json')
         return self.get_s3_object(key)
 
     def get_s3_object(self, key):
         """
         This method retrieve any object from s3 for a given key.
+        Bodies are kept in the BITSTORE_CACHE read-through cache, a cached
+        body is revalidated with its ETag so that S3 only answers with
+        304 Not Modified if the object did not change.
         :param key: Object key to be retrieved
         :return: The String value of the object or None of not found
         """
+        bucket_name = app.config['S3_BUCKET_NAME']
+        s3_client = app.config['S3']
+        cache = app.config.get('BITSTORE_CACHE')
+        cached = None
+        if cache is not None:
+            cached = cache.get(bucket_name, key)
+
+        kwargs = dict(Bucket=bucket_name, Key=key)
+        if cached is not None:
+            kwargs['IfNoneMatch'] = cached[0]
         try:
-            bucket_name = app.config['S3_BUCKET_NAME']
-            s3_client = app.config['S3']
-            response = s3_client.get_object(Bucket=bucket_name, Key=key)
-            return response['Body'].read()
+            response = s3_client.get_object(**kwargs)
         except ClientError as e:
-            if e.response['Error']['Code'] != 'NoSuchKey':
+            code = e.response['Error']['Code']
+            if cached is not None and code in ('304', 'NotModified'):
+                return cached[1]
+            if code != 'NoSuchKey':
                 raise e
+            if cache is not None:
+                cache.delete(bucket_name, key)
             return None
 
+        body = response['Body'].read()
+        if cache is not None:
+            cache.set(bucket_name, key, response.get('ETag'), body)
+        return body
+
+    def save_manifest(self, filedata, upload_ids=None):
+        """
+        This method stores the list of files submitted for upload as the
+        manifest of this version, so that objects can later be looked up
+        without listing the prefix.
+        Every file records the `key` it is uploaded to and, if it is
+        uploaded in parts, the `upload_id`. The files are merged into the
+        existing manifest, so authorizing a subset of the files again
+        keeps the others, and the `uploaded` record of completed multipart
+        uploads is kept, see :meth:`complete_multipart_upload`.
+        :param filedata: Dict of relative path to file properties
+            (name, md5, type ...) as sent to /api/datastore/authorize
+        :param upload_ids: Dict of relative path to the id of its
+            multipart upload
+        """
+        upload_ids = upload_ids or {}
+        manifest = self.get_manifest() or {}
+        files = manifest.get('files') or {}
+        for path, props in filedata.items():
+            previous = files.get(path) or {}
+            files[path] = dict(props,
+                               key=self.build_upload_key(path,
+                                                         props.get('md5'),
+                                                         props.get('size')))
+            if path in upload_ids:
+                files[path]['upload_id'] = upload_ids[path]
+            if previous.get('uploaded'):
+                files[path]['uploaded'] = previous['uploaded']
+        manifest['files'] = files
+        self.save_manifest_body(manifest)
+
+    def save_manifest_body(self, manifest):
+        bucket_name = app.config['S3_BUCKET_NAME']
+        s3_client = app.config['S3']
+        key = self.build_s3_manifest_key()
+        s3_client.put_object(Bucket=bucket_name, Key=key,
+                             Body=json.dumps(manifest),
+                             ContentType='application/json',
+                             ACL='private')
+        cache = app.config.get('BITSTORE_CACHE')
+        if cache is not None:
+            cache.delete(bucket_name, key)
+
+    def get_manifest(self):
+        """
+        This method retrieve the upload manifest of this version.
+        :return: Dict with the `files` uploaded or None if there is no
+            manifest e.g. for packages uploaded before manifests existed
+        """
+        body = self.get_s3_object(self.build_s3_manifest_key())
+        if not body:
+            return None
+        return json.loads(body)
+
+    def get_manifest_keys(self):
+        """
+        This method lists the object keys of the files of this version
+        from its upload manifest, without listing the prefix.
+        :return: Sorted list of keys or None if there is no manifest
+        """
+        manifest = self.get_manifest()
+        if manifest is None:
+            return None
+        files = manifest.get('files') or {}
+        return sorted(set(props.get('key') or self.build_s3_key(path)
+                          for path, props in files.items()))
+
     def get_readme_object_key(self):
         """
         This method search for any readme object is present for the
         generated prefix by:
         >>> BitStore.build_s3_key()
+        The upload manifest is used if there is one, otherwise the prefix
+        is listed.
         :return: Value of the readme key if found else None
         :rtype: None or Str
         """
-        readme_key = 'None'
-        prefix = self.build_s3_key('')
-        bucket_name = app.config['S3_BUCKET_NAME']
-        s3_client = app.config['S3']
-        response = s3_client.list_objects_v2(Bucket=bucket_name, Prefix=prefix)
-        for content in response['Contents']:
-            if 'readme' in content['Key'].lower():
-                readme_key = content['Key']
+        manifest = self.get_manifest()
+        if manifest is not None:
+            paths = [path for path in manifest['files']
+                     if 'readme' in path.lower()]
+            if not paths:
+                return None
+            # prefer the top level README over nested ones
+            path = min(paths, key=lambda p: (len(p), p))
+            return manifest['files'][path].get('key') or \
+                self.build_s3_key(path)
+
+        readme_key = None
+        for ob in self.iter_objects(self.build_s3_key('')):
+            if 'readme' in ob['Key'].lower():
+                readme_key = ob['Key']
         return readme_key
 
+    def resolve_key(self, path):
+        """
+        This method finds the object key of a file of this version.
+        With BITSTORE_CONTENT_ADDRESSED files are stored by their md5, so
+        the key is looked up in the manifest; files missing from it (e.g.
+        uploaded before the layout was enabled) use the path based key.
+        :param path: The relative path of the file in the data package
+        :return: The object key
+        """
+        if self.content_addressed:
+            manifest = self.get_manifest()
+            if manifest is not None:
+                props = manifest['files'].get(path) or {}
+                if props.get('key'):
+                    return props['key']
+        return self.build_s3_key(path)
+
+    def get_unchanged_paths(self, filedata):
+        """
+        This method finds the files which are already stored with the
+        submitted content, so that only the changed ones are uploaded again.
+        The ETags of the stored objects are read with a single listing and
+        compared to the submitted md5s. Objects uploaded in parts have no
+        md5 ETag, so for them the `uploaded` record of the manifest is
+        compared instead: the object is unchanged if it is still the one
+        that upload completed, with the submitted md5 and size.
+        :param filedata: Dict of relative path to file properties
+            (name, md5, type ...) as sent to /api/datastore/authorize
+        :return: Set of the relative paths which are unchanged
+        """
+        md5s = {}
+        for path, props in filedata.items():
+            md5_hex = self.md5_to_hex(props.get('md5'))
+            if md5_hex is not None:
+                md5s[path] = md5_hex
+        if not md5s:
+            return set()
+
+        keys = dict((path, self.build_upload_key(
+            path, md5_hex, filedata[path].get('size')))
+            for path, md5_hex in md5s.items())
+        # files uploaded in parts are path based even if content addressed
+        blob_prefix = self.build_s3_blob_key('')
+        path_prefix = self.build_s3_key('')
+        prefixes = set(blob_prefix if key.startswith(blob_prefix)
+                       else path_prefix for key in keys.values())
+        objects = dict((ob['Key'], ob) for prefix in prefixes
+                       for ob in self.iter_objects(prefix))
+
+        unchanged = set()
+        uploads = None
+        for path, md5_hex in md5s.items():
+            ob = objects.get(keys[path])
+            if ob is None:
+                continue
+            etag = ob['ETag'].strip('"')
+            if etag == md5_hex:
+                unchanged.add(path)
+            elif '-' in etag:
+                if uploads is None:
+                    uploads = (self.get_manifest() or {}).get('files') or {}
+                uploaded = (uploads.get(path) or {}).get('uploaded') or {}
+                if uploaded.get('etag') == etag \
+                        and uploaded.get('md5') == md5_hex \
+                        and uploaded.get('size') == ob['Size'] \
+                        and str(filedata[path].get('size')) == \
+                        str(ob['Size']):
+                    unchanged.add(path)
+        return unchanged
+
     def get_all_metadata_name_for_publisher(self):
+        prefix = self.build_s3_base_prefix()
+        return [ob['Key'] for ob in self.iter_objects(prefix)]
+
+    def iter_objects(self, prefix):
+        """
+        This method lazily lists every object stored under the given prefix.
+        It follows list_objects_v2 continuation tokens, so it is not limited
+        to the first 1000 keys and only holds one page in memory at a time.
+        :param prefix: Key prefix to list
+        :return: Generator of object summaries (dicts with Key, Size, ETag..)
+        """
         bucket_name = app.config['S3_BUCKET_NAME']
         s3_client = app.config['S3']
-        keys = []
-        prefix = self.build_s3_base_prefix()
-        list_objects = s3_client.list_objects(Bucket=bucket_name,
-                                              Prefix=prefix)
-        if list_objects is not None and 'Contents' in list_objects:
-            for ob in s3_client.list_objects(Bucket=bucket_name,
-                                             Prefix=prefix)['Contents']:
-                keys.append(ob['Key'])
-        return keys
+        return self._iter_objects(s3_client, bucket_name, prefix)
+
+    @staticmethod
+    def _iter_objects(s3_client, bucket_name, prefix):
+        kwargs = dict(Bucket=bucket_name, Prefix=prefix)
+        while True:
+            response = s3_client.list_objects_v2(**kwargs)
+            for ob in response.get('Contents', []):
+                yield ob
+            if not response.get('IsTruncated'):
+                break
+            kwargs['ContinuationToken'] = response['NextContinuationToken']
 
     def build_s3_key(self, path):
         return "{prefix}/{path}"\
@@ -112,13 +392,90 @@ class BitStore(object):
             format(prefix=self.build_s3_base_prefix(),
                    version=self.version)
 
+    def build_s3_manifest_prefix(self):
+        return "{prefix}/_manifest/". \
+            format(prefix=self.build_s3_base_prefix())
+
+    def build_s3_manifest_key(self):
+        return "{prefix}{version}.json". \
+            format(prefix=self.build_s3_manifest_prefix(),
+                   version=self.version)
+
+    def build_s3_blob_key(self, md5_hex):
+        return "{prefix}/_blobs/{md5}". \
+            format(prefix=self.build_s3_base_prefix(),
+                   md5=md5_hex)
+
+    def build_upload_key(self, path, md5, size=None):
+        """
+        Key a file is uploaded to. With BITSTORE_CONTENT_ADDRESSED it is
+        the blob of its md5, so identical files are stored once per
+        package, otherwise (or if the md5 is unusable, or the file is
+        uploaded in parts) it is path based.
+        """
+        md5_hex = self.md5_to_hex(md5)
+        if self.content_addressed and md5_hex is not None \
+                and not self.is_multipart_upload(size):
+            return self.build_s3_blob_key(md5_hex)
+        return self.build_s3_key(path)
+
+    @staticmethod
+    def is_multipart_upload(size):
+        """
+        Files bigger than BITSTORE_MULTIPART_UPLOAD_THRESHOLD are uploaded
+        with :meth:`create_multipart_upload` instead of a presigned post.
+        :param size: The size of the file in bytes, None if unknown
+        """
+        if not size:
+            return False
+        return int(size) > app.config['BITSTORE_MULTIPART_UPLOAD_THRESHOLD']
+
     def build_s3_object_url(self, path):
+        """
+        Public URL of a file of this version. Blobs are not named after
+        the file, so with BITSTORE_CONTENT_ADDRESSED the URL points to the
+        API which redirects to the blob. This keeps relative paths in the
+        datapackage.json resolvable.
+        """
+        if self.content_addressed:
+            return external_url('package.get_package_file',
+                                publisher=self.publisher,
+                                package=self.package,
+                                version=self.version, path=path)
+        key = self.resolve_key(path)
         return '{base_url}/{key}'.\
             format(base_url=app.config['BITSTORE_URL'],
-                   key=self.build_s3_key(path))
+                   key=key)
+
+    @staticmethod
+    def md5_to_hex(md5):
+        """
+        Converts the base64 Content-MD5 sent by clients to hex.
+        :return: The hex digest or None if md5 is not a valid digest
+        """
+        if not md5 or not isinstance(md5, (bytes, type(''))):
+            return None
+        if HEX_MD5.match(md5):
+            return md5.lower()
+        try:
+            digest = base64.b64decode(md5)
+        except (TypeError, ValueError, binascii.Error):
+            return None
+        if len(digest) != 16:
+            return None
+        return binascii.hexlify(digest).decode('ascii')
+
+    @staticmethod
+    def create_post_signer():
+        """
+        Creates a signer for presigned posts to the bucket. It derives the
+        signing key once, so it should be shared by all files of a request.
+        """
+        return create_post_signer(app.config['S3'],
+                                  app.config['S3_BUCKET_NAME'])
 
     def generate_pre_signed_post_object(self, path, md5,
-                                        acl='public-read'):
+                                        acl='public-read', signer=None):
         """
         This method produce required data to upload file from client side
         for uploading data at client side. The Content-Type is set to
@@ -130,92 +487,422 @@ class BitStore(object):
         :param md5: The md5 hash of the file to be uploaded
 
         :param acl: The object ACL default is public_read
+        :param signer: Signer from :meth:`create_post_signer`, a new one
+            is created if not given
         :return: dict containing S3 url and post params
         """
+        key = self.build_upload_key(path, md5)
+        if signer is None:
+            signer = self.create_post_signer()
+        content_md5 = str(md5)
+        md5_condition = ["starts-with", "$Content-MD5", ""]
+        if key != self.build_s3_key(path):
+            # a blob is shared by every version referring to it, so its
+            # content has to be the md5 it is named after
+            content_md5 = base64.b64encode(binascii.unhexlify(
+                self.md5_to_hex(md5))).decode('ascii')
+            md5_condition = {"Content-MD5": content_md5}
+        post = signer.sign(key,
+                           fields={
+                               'acl': acl,
+                               'Content-MD5': content_md5,
+                               'Content-Type': 'text/plain'},
+                           conditions=[
+                               {"acl": "public-read"},
+                               ["starts-with", "$Content-Type", ""],
+                               md5_condition
+                           ])
+        return post
+
+    def create_multipart_upload(self, path, size, md5=None,
+                                acl='public-read'):
+        """
+        This method starts a multipart upload of a file, which the client
+        uploads with presigned part URLs and then completes or aborts
+        through the API. As with presigned posts the Content-Type is set
+        to text/plain.
+        The md5 of the whole file can not be verified for multipart
+        uploads, so they always go to the path based key, even with
+        BITSTORE_CONTENT_ADDRESSED. :meth:`build_upload_key` records the
+        same key in the manifest.
+        If the manifest records an upload of the same md5 and size for the
+        path which is still in progress, e.g. when a client authorizes
+        again to retry, that upload is resumed. Any other upload in
+        progress for the key is aborted, so none is left behind. Uploads
+        which are never completed nor authorized again are left to the
+        AbortIncompleteMultipartUpload lifecycle rule of the bucket, see
+        the README.
+
+        :param path: The relative path of the object
+        :param size: The size of the file in bytes
+        :param md5: The base64 md5 of the file sent by the client
+        :param acl: The object ACL default is public_read
+        :return: dict with the key, upload_id, part_size and the presigned
+            url of every part
+        """
         bucket_name = app.config['S3_BUCKET_NAME']
         s3_client = app.config['S3']
         key = self.build_s3_key(path)
-        post = s3_client.generate_presigned_post(Bucket=bucket_name,
-                                                 Key=key,
-                                                 Fields={
-                                                    'acl': acl,
-                                                    'Content-MD5': str(md5),
-                                                    'Content-Type': 'text/plain'},
-                                                 Conditions=[
-                                                  {"acl": "public-read"},
-                                                  ["starts-with", "$Content-Type", ""],
-                                                  ["starts-with", "$Content-MD5", ""]
-                                                 ])
-        return post
+        part_size = max(app.config['BITSTORE_MULTIPART_UPLOAD_PART_SIZE'],
+                        MIN_UPLOAD_PART_SIZE,
+                        -(-size // MAX_UPLOAD_PARTS))
+        in_progress = set(self.list_multipart_uploads(path))
+        previous = ((self.get_manifest() or {}).get('files') or {}) \
+            .get(path) or {}
+        if md5 and previous.get('upload_id') in in_progress \
+                and previous.get('md5') == md5 \
+                and str(previous.get('size')) == str(size):
+            upload_id = previous['upload_id']
+        else:
+            upload_id = s3_client.create_multipart_upload(
+                Bucket=bucket_name, Key=key, ACL=acl,
+                ContentType='text/plain')['UploadId']
+        for other_id in in_progress - set([upload_id]):
+            try:
+                self.abort_multipart_upload(path, other_id)
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'NoSuchUpload':
+                    raise
+        part_count = max(1, -(-size // part_size))
+        return dict(key=key, upload_id=upload_id, part_size=part_size,
+                    parts=self.generate_part_urls(path, upload_id,
+                                                  range(1, part_count + 1)))
+
+    def list_multipart_uploads(self, path):
+        """
+        This method lists the multipart uploads in progress for the path
+        based key of a file.
+        :return: List of the upload ids
+        """
+        bucket_name = app.config['S3_BUCKET_NAME']
+        s3_client = app.config['S3']
+        key = self.build_s3_key(path)
+        kwargs = dict(Bucket=bucket_name, Prefix=key)
+        upload_ids = []
+        while True:
+            response = s3_client.list_multipart_uploads(**kwargs)
+            upload_ids.extend(upload['UploadId']
+                              for upload in response.get('Uploads', [])
+                              if upload['Key'] == key)
+            if not response.get('IsTruncated'):
+                return upload_ids
+            kwargs['KeyMarker'] = response['NextKeyMarker']
+            kwargs['UploadIdMarker'] = response['NextUploadIdMarker']
+
+    def generate_part_urls(self, path, upload_id, part_numbers):
+        """
+        This method presigns the upload of parts of a multipart upload,
+        e.g. to resume an upload whose URLs expired.
+        :return: List of dicts with the part_number and url to PUT it to
+        """
+        bucket_name = app.config['S3_BUCKET_NAME']
+        s3_client = app.config['S3']
+        key = self.build_s3_key(path)
+        return [dict(part_number=part_number,
+                     url=s3_client.generate_presigned_url(
+                         'upload_part',
+                         Params=dict(Bucket=bucket_name, Key=key,
+                                     UploadId=upload_id,
+                                     PartNumber=part_number)))
+                for part_number in part_numbers]
+
+    def list_uploaded_parts(self, path, upload_id):
+        """
+        This method lists the parts of a multipart upload S3 received.
+        :return: List of dicts with the PartNumber, ETag and Size
+        """
+        bucket_name = app.config['S3_BUCKET_NAME']
+        s3_client = app.config['S3']
+        kwargs = dict(Bucket=bucket_name, Key=self.build_s3_key(path),
+                      UploadId=upload_id)
+        parts = []
+        while True:
+            response = s3_client.list_parts(**kwargs)
+            parts.extend(dict(PartNumber=part['PartNumber'],
+                              ETag=part['ETag'], Size=part['Size'])
+                         for part in response.get('Parts', []))
+            if not response.get('IsTruncated'):
+                return parts
+            kwargs['PartNumberMarker'] = response['NextPartNumberMarker']
+
+    def complete_multipart_upload(self, path, upload_id, parts):
+        """
+        This method assembles the uploaded parts into the object.
+        The ETag of an object uploaded in parts is not its md5, so the
+        completed upload is recorded as `uploaded` in the manifest entry
+        of the file: the ETag and size of the object and the md5 the upload
+        was authorized with. The size is checked against the authorized
+        one, so the record is only kept if they match.
+        :param parts: List of dicts with the PartNumber and ETag of
+            every part, as returned by S3 when the part was uploaded
+        """
+        bucket_name = app.config['S3_BUCKET_NAME']
+        s3_client = app.config['S3']
+        key = self.build_s3_key(path)
+        parts = sorted((dict(PartNumber=int(part['PartNumber']),
+                             ETag=part['ETag']) for part in parts),
+                       key=lambda part: part['PartNumber'])
+        response = s3_client.complete_multipart_upload(
+            Bucket=bucket_name, Key=key, UploadId=upload_id,
+            MultipartUpload=dict(Parts=parts))
+        cache = app.config.get('BITSTORE_CACHE')
+        if cache is not None:
+            cache.delete(bucket_name, key)
+        self.record_multipart_upload(path, upload_id, response['ETag'])
+
+    def record_multipart_upload(self, path, upload_id, etag):
+        manifest = self.get_manifest()
+        props = ((manifest or {}).get('files') or {}).get(path)
+        if not props or props.get('upload_id') != upload_id:
+            return
+        size = self.get_s3_object_size(self.build_s3_key(path))
+        if str(props.get('size')) == str(size):
+            props['uploaded'] = dict(etag=etag.strip('"'), size=size,
+                                     md5=self.md5_to_hex(props.get('md5')))
+        else:
+            props.pop('uploaded', None)
+        self.save_manifest_body(manifest)
+
+    def get_s3_object_size(self, key):
+        bucket_name = app.config['S3_BUCKET_NAME']
+        s3_client = app.config['S3']
+        return s3_client.head_object(Bucket=bucket_name,
+                                     Key=key)['ContentLength']
+
+    def abort_multipart_upload(self, path, upload_id):
+        bucket_name = app.config['S3_BUCKET_NAME']
+        s3_client = app.config['S3']
+        s3_client.abort_multipart_upload(Bucket=bucket_name,
+                                         Key=self.build_s3_key(path),
+                                         UploadId=upload_id)
 
     def delete_data_package(self):
         """
         This method will delete all objects with the prefix
         generated by :func:`~app.mod_api.models.build_s3_prefix`.
         This method is used for Hard delete data packages.
-        :return: Status True if able to delete or False if exception
+        Keys are deleted in batches of :data:`DELETE_BATCH_SIZE` which
+        run concurrently on ``BITSTORE_WORKERS`` threads.
+        :return: :class:`BatchResult`, falsy if any key failed to delete
         """
         bucket_name = app.config['S3_BUCKET_NAME']
         s3_client = app.config['S3']
 
-        keys = []
-        list_objects = s3_client.list_objects(Bucket=bucket_name,
-                                              Prefix=self.build_s3_base_prefix())
-        if list_objects is not None and 'Contents' in list_objects:
-            for ob in s3_client \
-                .list_objects(Bucket=bucket_name,
-                              Prefix=self.build_s3_base_prefix())['Contents']:
-                keys.append(dict(Key=ob['Key']))
+        retries = app.config['BITSTORE_RETRIES']
+        backoff = app.config['BITSTORE_RETRY_BACKOFF']
 
-        s3_client.delete_objects(Bucket=bucket_name, Delete=dict(Objects=keys))
-        return True
+        def delete_batch(keys):
+            try:
+                response = call_with_retries(
+                    s3_client.delete_objects, retries, backoff,
+                    Bucket=bucket_name,
+                    Delete=dict(Objects=[dict(Key=key) for key in keys],
+                                Quiet=True))
+            except ClientError as e:
+                return keys, [dict(Key=key, Message=str(e)) for key in keys]
+            return keys, response.get('Errors', [])
+
+        keys = (ob['Key']
+                for ob in self.iter_objects(self.build_s3_base_prefix()))
+        result = BatchResult()
+        for batch, errors in run_concurrently(delete_batch,
+                                              chunked(keys, DELETE_BATCH_SIZE),
+                                              app.config['BITSTORE_WORKERS']):
+            for error in errors:
+                result.add_failure(error['Key'],
+                                   error.get('Message') or error.get('Code'))
+            result.succeeded += len(batch) - len(errors)
+
+        if not result:
+            app.logger.error('Failed to delete %s of %s objects for %s/%s',
+                             len(result.failed),
+                             len(result.failed) + result.succeeded,
+                             self.publisher, self.package)
+        return result
 
 
-    def change_acl(self, acl):
+    def change_acl(self, acl, workers=None, keys=None):
         """
         This method will change access for all objects with the prefix
         generated by :func:`~app.mod_api.models.build_s3_prefix`.
         This method is used for Soft delete data packages.
-        :return: Status True if able to delete or False if exception
+        ACLs are rewritten concurrently and transient S3 errors are
+        retried with exponential backoff. Manifests always stay private.
+        :param acl: The canned ACL to set e.g. private or public-read
+        :param workers: Number of threads, defaults to BITSTORE_WORKERS
+        :param keys: Keys to change instead of all objects of the package,
+            e.g. from :meth:`get_manifest_keys`. They need not be listed,
+            and keys which do not exist, i.e. files authorized but never
+            uploaded, are skipped
+        :return: :class:`BatchResult`, falsy if any ACL failed to change
         """
         bucket_name = app.config['S3_BUCKET_NAME']
         s3_client = app.config['S3']
+        retries = app.config['BITSTORE_RETRIES']
+        backoff = app.config['BITSTORE_RETRY_BACKOFF']
+        skip_missing = keys is not None
 
-        keys = []
-        list_objects = s3_client.list_objects(Bucket=bucket_name,
-                                              Prefix=self.build_s3_base_prefix())
-        if list_objects is not None and 'Contents' in list_objects:
-            for ob in s3_client \
-                .list_objects(Bucket=bucket_name,
-                              Prefix=self.build_s3_base_prefix())['Contents']:
-                keys.append(ob['Key'])
-
-        for key in keys:
-            s3_client.put_object_acl(Bucket=bucket_name, Key=key,
-                                     ACL=acl)
-        return True
+        def put_acl(key):
+            try:
+                call_with_retries(s3_client.put_object_acl, retries, backoff,
+                                  Bucket=bucket_name, Key=key, ACL=acl)
+            except ClientError as e:
+                if skip_missing and \
+                        e.response['Error']['Code'] == 'NoSuchKey':
+                    return key, None
+                return key, str(e)
+            return key, None
+
+        if keys is None:
+            manifest_prefix = self.build_s3_manifest_prefix()
+            keys = (ob['Key']
+                    for ob in self.iter_objects(self.build_s3_base_prefix())
+                    if not ob['Key'].startswith(manifest_prefix))
+        result = BatchResult()
+        for key, error in run_concurrently(put_acl, keys,
+                                           workers or
+                                           app.config['BITSTORE_WORKERS']):
+            if error is None:
+                result.succeeded += 1
+            else:
+                result.add_failure(key, error)
+            done = result.succeeded + len(result.failed)
+            if done % PROGRESS_INTERVAL == 0:
+                app.logger.info('Changed ACL to %s for %s objects of %s/%s',
+                                acl, done, self.publisher, self.package)
+
+        if result:
+            app.logger.info('Changed ACL to %s for %s objects of %s/%s',
+                            acl, result.succeeded,
+                            self.publisher, self.package)
+        else:
+            app.logger.error('Failed to change ACL to %s for %s of %s '
+                             'objects of %s/%s', acl, len(result.failed),
+                             result.succeeded + len(result.failed),
+                             self.publisher, self.package)
+        return result
 
-    def copy_to_new_version(self, version):
+    def copy_to_new_version(self, version, workers=None):
+        """
+        This method copies all objects of the latest version to the given
+        version. The manifest is copied too, with BITSTORE_CONTENT_ADDRESSED
+        it is all there is to copy as both versions refer to the same
+        blobs. Objects are copied concurrently with server side
+        copy_object calls. Objects bigger than BITSTORE_MULTIPART_THRESHOLD
+        can not be copied in one request (the S3 limit is 5GB), so they are
+        copied with multipart upload_part_copy calls, running the parts
+        concurrently.
+        :param version: The version to copy the latest objects to
+        :param workers: Number of threads, defaults to BITSTORE_WORKERS
+        :return: :class:`BatchResult`, falsy if any object failed to copy
+        """
         bucket_name = app.config['S3_BUCKET_NAME']
         s3_client = app.config['S3']
-        latest_keys = []
-        list_objects = s3_client.list_objects(Bucket=bucket_name,
-                                              Prefix=self.build_s3_versioned_prefix())
-        if list_objects is not None and 'Contents' in list_objects:
-            for ob in s3_client \
-                .list_objects(Bucket=bucket_name,
-                              Prefix=self.build_s3_versioned_prefix())['Contents']:
-                latest_keys.append(ob['Key'])
-        for key in latest_keys:
-            versioned_key = key.replace('/latest/', '/{0}/'.format(version))
-            copy_source = {'Bucket': bucket_name, 'Key': key}
-            s3_client.copy_object(Bucket=bucket_name,
-                                  Key=versioned_key,
-                                  CopySource=copy_source)
-        return True
+        retries = app.config['BITSTORE_RETRIES']
+        backoff = app.config['BITSTORE_RETRY_BACKOFF']
+        threshold = app.config['BITSTORE_MULTIPART_THRESHOLD']
+        part_size = app.config['BITSTORE_MULTIPART_PART_SIZE']
+        workers = workers or app.config['BITSTORE_WORKERS']
+
+        def versioned_key(key):
+            return key.replace('/latest/', '/{0}/'.format(version))
+
+        def copy(ob):
+            try:
+                call_with_retries(s3_client.copy_object, retries, backoff,
+                                  Bucket=bucket_name,
+                                  Key=versioned_key(ob['Key']),
+                                  CopySource={'Bucket': bucket_name,
+                                              'Key': ob['Key']})
+            except ClientError as e:
+                return ob['Key'], str(e)
+            return ob['Key'], None
+
+        # the listing is consumed by the pool, which sets the big objects
+        # aside so that their parts can use all workers afterwards
+        large_objects = []
+
+        def small_objects(objects):
+            for ob in objects:
+                if ob['Size'] > threshold:
+                    large_objects.append(ob)
+                else:
+                    yield ob
+
+        objects = self.iter_objects(self.build_s3_versioned_prefix())
+        result = BatchResult()
+        manifest = self.get_manifest()
+        if manifest is not None:
+            tagged = BitStore(self.publisher, self.package, version)
+            try:
+                call_with_retries(tagged.save_manifest_body, retries, backoff,
+                                  manifest=manifest)
+            except ClientError as e:
+                result.add_failure(tagged.build_s3_manifest_key(), str(e))
+        for key, error in run_concurrently(copy, small_objects(objects),
+                                           workers):
+            if error is None:
+                result.succeeded += 1
+            else:
+                result.add_failure(key, error)
+
+        for ob in large_objects:
+            try:
+                self._multipart_copy(s3_client, bucket_name, ob['Key'],
+                                     versioned_key(ob['Key']), ob['Size'],
+                                     part_size, workers, retries, backoff)
+                result.succeeded += 1
+            except ClientError as e:
+                result.add_failure(ob['Key'], str(e))
+
+        if not result:
+            app.logger.error('Failed to copy %s of %s objects of %s/%s '
+                             'to version %s', len(result.failed),
+                             result.succeeded + len(result.failed),
+                             self.publisher, self.package, version)
+        return result
+
+    @staticmethod
+    def _multipart_copy(s3_client, bucket_name, source_key, key, size,
+                        part_size, workers, retries, backoff):
+        # S3 accepts at most MAX_UPLOAD_PARTS parts per upload
+        part_size = max(part_size, -(-size // MAX_UPLOAD_PARTS))
+        head = s3_client.head_object(Bucket=bucket_name, Key=source_key)
+        upload_id = s3_client.create_multipart_upload(
+            Bucket=bucket_name, Key=key,
+            ContentType=head.get('ContentType', 'binary/octet-stream'),
+            Metadata=head.get('Metadata', {}))['UploadId']
+
+        def copy_part(part):
+            part_number, first_byte = part
+            last_byte = min(first_byte + part_size, size) - 1
+            response = call_with_retries(
+                s3_client.upload_part_copy, retries, backoff,
+                Bucket=bucket_name, Key=key, UploadId=upload_id,
+                PartNumber=part_number,
+                CopySource={'Bucket': bucket_name, 'Key': source_key},
+                CopySourceRange='bytes={0}-{1}'.format(first_byte,
+                                                        last_byte))
+            return dict(PartNumber=part_number,
+                        ETag=response['CopyPartResult']['ETag'])
+
+        parts = enumerate(range(0, size, part_size), 1)
+        try:
+            uploaded = sorted(run_concurrently(copy_part, parts, workers),
+                              key=lambda p: p['PartNumber'])
+            s3_client.complete_multipart_upload(
+                Bucket=bucket_name, Key=key, UploadId=upload_id,
+                MultipartUpload=dict(Parts=uploaded))
+        except Exception:
+            s3_client.abort_multipart_upload(Bucket=bucket_name, Key=key,
+                                             UploadId=upload_id)
+            raise
 
     @staticmethod
     def extract_information_from_s3_url(url):
         information = url.split('metadata/')[1].split('/')
+        if information[2] == '_blobs':
+            # content addressed uploads always belong to the latest version
+            return information[0], information[1], 'latest'
         publisher, package, version = information[0], information[1], information[3]
         return publisher, package, version
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from flask import Blueprint, jsonify, _request_ctx_stack
+
+from app.auth.annotations import requires_auth
+from app.utils import InvalidUsage
+import app.logic as logic
+
+jobs_blueprint = Blueprint('jobs', __name__, url_prefix='/api/jobs')
+
+
+@jobs_blueprint.route("/<int:job_id>", methods=["GET"])
+@requires_auth
+def get_job_status(job_id):
+    """
+    Background job status.
+    Returns the status of a job queued by the user, e.g. the import of
+    a Data Package queued by /api/package/upload
+    ---
+    tags:
+        - jobs
+    parameters:
+        - in: path
+          name: job_id
+          type: integer
+          required: true
+          description: job id
+        - in: header
+          name: Authorization
+          type: string
+          required: true
+          description: JWT Token
+    responses:
+        200:
+            description: The job
+            schema:
+                id: get_job_status
+                properties:
+                    status:
+                        type: string
+                        description: queued, running, done or failed
+                    attempts:
+                        type: integer
+                    error:
+                        type: string
+                        description: Error of the last failed attempt
+        401:
+            description: Invalid Header for JWT
+        404:
+            description: Job not found
+    """
+    user_id = _request_ctx_stack.top.current_user['user']
+    job = logic.Job.get(job_id, user_id)
+    if job is None:
+        raise InvalidUsage('Job not found', 404)
+    return jsonify(job), 200
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import datetime
+
+import enum
+from sqlalchemy import ForeignKey, Index
+from app.database import db
+
+
+class JobStateEnum(enum.Enum):
+    queued = "QUEUED"
+    running = "RUNNING"
+    done = "DONE"
+    failed = "FAILED"
+
+
+class Job(db.Model):
+    """
+    This class is DB model for background jobs. The table is the queue:
+    workers claim queued jobs whose run_after has passed with
+    SELECT ... FOR UPDATE SKIP LOCKED, see :mod:`app.jobs.queue`
+    """
+    __tablename__ = 'job'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+    name = db.Column(db.TEXT, nullable=False)
+    payload = db.Column(db.JSON)
+    user_id = db.Column(db.Integer, ForeignKey('user.id', ondelete='SET NULL'))
+
+    status = db.Column(db.Enum(JobStateEnum, native_enum=False),
+                       nullable=False, default=JobStateEnum.queued)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_after = db.Column(db.DateTime, nullable=False,
+                          default=datetime.datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    # renewed by the worker while the job runs, see app.jobs.queue.lease
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    result = db.Column(db.JSON)
+    error = db.Column(db.TEXT)
+
+    __table_args__ = (
+        Index('ix_job_status_run_after', 'status', 'run_after'),
+    )
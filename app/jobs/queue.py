@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+# Background jobs backed by the `job` table. Tasks are plain functions
+# registered under a name with task(). enqueue() stores a job and work()
+# (`manager.py worker`) runs them. With JOB_QUEUE_EAGER the job is run
+# right away in the enqueuing process, which is what tests and local
+# development use.
+
+import datetime
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+from flask import current_app as app
+from sqlalchemy import and_, or_
+
+from app.database import db
+from app.jobs.models import Job, JobStateEnum
+
+tasks = {}
+
+
+def task(name):
+    """
+    Registers the decorated function as the task `name`. It is called with
+    the keyword arguments given to :func:`enqueue`, its return value must
+    be JSON serializable and is stored as the result of the job.
+    """
+    def wrapper(f):
+        tasks[name] = f
+        return f
+    return wrapper
+
+
+def enqueue(name, user_id=None, **payload):
+    """
+    Adds a job for the task `name` to the queue.
+    With JOB_QUEUE_EAGER the job runs before this returns and its errors
+    are raised to the caller.
+    :return: The :class:`~app.jobs.models.Job`
+    """
+    if name not in tasks:
+        raise KeyError('Unknown task {0}'.format(name))
+    job = Job(name=name, payload=payload, user_id=user_id,
+              max_attempts=app.config['JOB_MAX_ATTEMPTS'])
+    db.session.add(job)
+    db.session.commit()
+    if app.config['JOB_QUEUE_EAGER']:
+        claim(job)
+        run(job, propagate=True)
+    return job
+
+
+def claim_next():
+    """
+    Claims the next due job. Running jobs whose lease was not renewed for
+    JOB_LEASE_TIMEOUT are considered lost with their worker and are
+    claimed again, or marked failed if they used up their attempts.
+    FOR UPDATE SKIP LOCKED lets concurrent workers claim different jobs
+    without waiting for each other.
+    :return: The claimed :class:`~app.jobs.models.Job` or None
+    """
+    while True:
+        now = datetime.datetime.utcnow()
+        expired = now - datetime.timedelta(
+            seconds=app.config['JOB_LEASE_TIMEOUT'])
+        job = Job.query.filter(or_(
+            and_(Job.status == JobStateEnum.queued, Job.run_after <= now),
+            and_(Job.status == JobStateEnum.running,
+                 Job.heartbeat_at < expired))) \
+            .order_by(Job.run_after, Job.id) \
+            .with_for_update(skip_locked=True) \
+            .first()
+        if job is None:
+            db.session.commit()
+            return None
+        if job.status == JobStateEnum.running and \
+                job.attempts >= job.max_attempts:
+            job.status = JobStateEnum.failed
+            job.error = 'The worker running the job was lost'
+            job.finished_at = now
+            db.session.add(job)
+            db.session.commit()
+            continue
+        claim(job)
+        return job
+
+
+def claim(job):
+    job.status = JobStateEnum.running
+    job.attempts += 1
+    job.started_at = job.heartbeat_at = datetime.datetime.utcnow()
+    db.session.add(job)
+    db.session.commit()
+
+
+@contextmanager
+def lease(job):
+    """
+    Renews the lease of a claimed job every JOB_HEARTBEAT_INTERVAL
+    seconds while the block runs. The heartbeats are written from a
+    thread on connections of their own, so they are committed while the
+    task holds its transaction open. They stop once the job is claimed
+    again by another worker.
+    """
+    job_id, engine, logger = job.id, db.engine, app.logger
+    interval = app.config['JOB_HEARTBEAT_INTERVAL']
+    renew = Job.__table__.update() \
+        .where(and_(Job.id == job_id,
+                    Job.status == JobStateEnum.running,
+                    Job.attempts == job.attempts))
+    stopped = threading.Event()
+
+    def heartbeat():
+        while not stopped.wait(interval):
+            try:
+                engine.execute(
+                    renew.values(heartbeat_at=datetime.datetime.utcnow()))
+            except Exception:
+                logger.exception('Renewing the lease of job %s failed',
+                                 job_id)
+
+    thread = threading.Thread(target=heartbeat)
+    thread.daemon = True
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def run(job, propagate=False):
+    """
+    Runs a claimed job and records its outcome. Failed jobs are queued
+    again after JOB_RETRY_BACKOFF * 2^(attempts - 1) seconds until they
+    used up their attempts.
+    """
+    job_id, name, payload = job.id, job.name, job.payload or {}
+    try:
+        result = tasks[name](**payload)
+    except Exception as e:
+        db.session.rollback()
+        app.logger.exception('Job %s (%s) failed', job_id, name)
+        job = Job.query.get(job_id)
+        job.error = traceback.format_exc()
+        if job.attempts < job.max_attempts and not propagate:
+            job.status = JobStateEnum.queued
+            job.run_after = datetime.datetime.utcnow() + datetime.timedelta(
+                seconds=app.config['JOB_RETRY_BACKOFF'] *
+                2 ** (job.attempts - 1))
+        else:
+            job.status = JobStateEnum.failed
+            job.finished_at = datetime.datetime.utcnow()
+        db.session.add(job)
+        db.session.commit()
+        if propagate:
+            raise e
+        return job
+
+    job = Job.query.get(job_id)
+    job.status = JobStateEnum.done
+    job.result = result
+    job.error = None
+    job.finished_at = datetime.datetime.utcnow()
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def work(burst=False):
+    """
+    Runs jobs until interrupted, polling the queue every
+    JOB_POLL_INTERVAL seconds when it is empty.
+    :param burst: Return once the queue is empty
+    """
+    while True:
+        job = claim_next()
+        if job is not None:
+            with lease(job):
+                run(job)
+            continue
+        if burst:
+            return
+        time.sleep(app.config['JOB_POLL_INTERVAL'])
@@ -7,7 +7,7 @@ from __future__ import unicode_literals
 import json
 import os
 
-from BeautifulSoup import BeautifulSoup
+from botocore.exceptions import ClientError
 from flask import request, session
 from flask import current_app as app
 from sqlalchemy.orm.exc import NoResultFound
@@ -16,9 +16,10 @@ from app.auth.annotations import check_is_authorized, get_user_from_jwt
 from app.auth.jwt import JWT, FileData
 from app.database import db
 from app.bitstore import BitStore
+from app.jobs import queue
 from app.logic.search import DataPackageQuery
+from app.logic.serializers import get_serializer
 from app.utils import InvalidUsage
-from app.utils.helpers import text_to_markdown, dp_in_readme
 import app.models as models
 
 
@@ -38,7 +39,7 @@ class LogicBase(object):
     def serialize(cls, sqla_instance):
         if sqla_instance is None:
             return None
-        serialized = cls.schema().dump(sqla_instance).data
+        serialized = get_serializer(cls.schema).dump(sqla_instance)
         return serialized
 
     @classmethod
@@ -60,6 +61,7 @@ class PackageSchema(ma.ModelSchema):
 class PackageTagSchema(ma.ModelSchema):
     class Meta:
         model = models.PackageTag
+        exclude = ('search_vector',)
 
 
 
@@ -81,19 +83,19 @@ class PackageMetadataSchema(ma.Schema):
         return data.publisher.name
 
     def get_readme(self, data):
-        version = filter(lambda t: t.tag == 'latest', data.tags)[0]
-        readme_variables_replaced = dp_in_readme(version.readme or '', version.descriptor)
-        readme = text_to_markdown(readme_variables_replaced)
-        return readme
+        version = data.latest_tag
+        if version.readme_is_stale:
+            version.render_readme()
+        return version.readme_html
 
     def get_descriptor(self, data):
-        version = filter(lambda t: t.tag == 'latest', data.tags)[0]
+        version = data.latest_tag
         descriptor = validate_for_template(version.descriptor)
         descriptor['owner'] = data.publisher.name
         return version.descriptor
 
     def get_views(self, data):
-        version = filter(lambda t: t.tag == 'latest', data.tags)[0]
+        version = data.latest_tag
         descriptor = validate_for_template(version.descriptor)
         views = descriptor.get('views') or []
         return views
@@ -104,12 +106,10 @@ class PackageMetadataSchema(ma.Schema):
         return datapackage_json_url_in_s3
 
     def get_short_readme(self, data):
-        version = filter(lambda t: t.tag == 'latest', data.tags)[0]
-        readme_short_markdown = text_to_markdown(version.readme or '')
-        readme_short = ''.join(BeautifulSoup(readme_short_markdown).findAll(text=True)) \
-            .split('\n\n')[0].replace(' \n', '') \
-            .replace('\n', ' ').replace('/^ /', '')
-        return readme_short
+        version = data.latest_tag
+        if version.readme_is_stale:
+            version.render_readme()
+        return version.readme_short
 
 
 class Package(LogicBase):
@@ -120,6 +120,42 @@ class Package(LogicBase):
         data = models.Package.get_by_publisher(publisher, package)
         return cls.serialize(data)
 
+    @classmethod
+    def get_document(cls, publisher, package):
+        '''
+        Gets the metadata of the package as the JSON encoded document stored
+        when it was last written, building it if missing.
+        Returns (id, updated_at, document) of the latest tag or None if
+        the package is not found
+        '''
+        row = models.PackageTag.get_document(publisher, package)
+        if row is None or row.document is not None:
+            return row
+        instance = models.Package.get_by_publisher(publisher, package)
+        cls.build_document(instance)
+        db.session.commit()
+        return models.PackageTag.get_document(publisher, package)
+
+    @classmethod
+    def build_document(cls, instance):
+        '''
+        Stores the serialized metadata of the package on its latest tag, to
+        be served by get_document
+        '''
+        instance.latest_tag.document = json.dumps(cls.serialize(instance))
+
+    @classmethod
+    def get_many(cls, names):
+        '''
+        Gets the metadata of many packages in a fixed number of queries.
+        Packages not found are left out
+        :param names: List of (publisher name, package name) tuples
+        '''
+        instances = dict(((instance.publisher.name, instance.name), instance)
+                         for instance in models.Package.get_many(names))
+        return [cls.serialize(instances[name])
+                for name in names if name in instances]
+
     @classmethod
     def exists(cls, publisher, package):
         instance = models.Package.get_by_publisher(publisher, package)
@@ -130,6 +166,10 @@ class Package(LogicBase):
         pkg = models.Package.get_by_publisher(publisher, package)
         # TODO: should be able to db.session.delete(pkg) but deletes publishers!
         models.Package.query.filter(models.Package.id == pkg.id).delete()
+        # bulk deletes are not flushed, so the stamps are bumped here
+        models.VersionStamp.bump(db.session, [
+            models.VersionStamp.PACKAGES,
+            models.VersionStamp.publisher_stamp(pkg.publisher_id)])
         db.session.commit()
         return True
 
@@ -145,10 +185,15 @@ class Package(LogicBase):
             .filter(models.Package.id == package.id,
                     models.PackageTag.tag == tag).first()
 
-        update_props = ['descriptor', 'readme', 'package_id']
+        update_props = ['descriptor', 'readme', 'package_id',
+                        'readme_html', 'readme_short', 'readme_render_version',
+                        'document']
         if tag_instance is None:
             tag_instance = models.PackageTag()
 
+        if data_latest.readme_is_stale:
+            data_latest.render_readme()
+        cls.build_document(package)
         for update_prop in update_props:
             setattr(tag_instance, update_prop, getattr(data_latest, update_prop))
         tag_instance.tag = tag
@@ -176,7 +221,14 @@ class Package(LogicBase):
                 setattr(instance, key, value)
             else:
                 setattr(tag_instance, key, value)
+        if 'descriptor' in kwargs or 'readme' in kwargs \
+                or tag_instance.readme_is_stale:
+            tag_instance.render_readme()
+        if instance.status != models.PackageStateEnum.deleted:
+            tag_instance.update_search_vector(publisher_name)
         db.session.add(instance)
+        db.session.flush()
+        cls.build_document(instance)
         db.session.commit()
 
     @classmethod
@@ -184,6 +236,11 @@ class Package(LogicBase):
                             package_name, status=models.PackageStateEnum.active):
         pkg = models.Package.get_by_publisher(publisher_name, package_name)
         pkg.status = status
+        if status == models.PackageStateEnum.active:
+            pkg.latest_tag.update_search_vector(publisher_name)
+        else:
+            pkg.latest_tag.search_vector = None
+        cls.build_document(pkg)
         db.session.add(pkg)
         db.session.commit()
         return True
@@ -191,8 +248,9 @@ class Package(LogicBase):
     @classmethod
     def finalize_publish(cls, user_id, datapackage_url):
         '''
-        Gets the datapackage.json and README from S3 and imports into database.
-        Returns status "queued" if ok, else - None
+        Checks the user may publish the package and queues the import of
+        its datapackage.json and README from S3 into the database.
+        Returns the queued Job
         '''
         publisher, package, version = BitStore.extract_information_from_s3_url(datapackage_url)
         if Package.exists(publisher, package):
@@ -203,14 +261,37 @@ class Package(LogicBase):
         if not status:
             raise InvalidUsage('Not authorized to upload data', 400)
 
+        return queue.enqueue('package.import', user_id=user_id,
+                             publisher=publisher, package=package)
+
+    @classmethod
+    def import_package(cls, publisher, package):
+        '''
+        Gets the datapackage.json and README from S3, makes the objects
+        public and imports the package into database.
+        Runs as the background job `package.import`
+        '''
         bit_store = BitStore(publisher, package)
         b = bit_store.get_metadata_body()
         body = json.loads(b)
-        bit_store.change_acl('public-read')
-        readme = bit_store.get_s3_object(bit_store.get_readme_object_key())
+        # the manifest lists the objects of the version, packages uploaded
+        # before manifests existed are listed
+        acl_result = bit_store.change_acl(
+            'public-read', keys=bit_store.get_manifest_keys())
+        if not acl_result:
+            # fail the job so that it is retried
+            raise Exception('Failed to make {0} objects public'
+                            .format(len(acl_result.failed)))
+        readme_key = bit_store.get_readme_object_key()
+        readme = None
+        if readme_key:
+            readme = bit_store.get_s3_object(readme_key)
         Package.create_or_update(name=package, publisher_name=publisher,
                                  descriptor=body, readme=readme)
-        return "queued"
+        return dict(publisher=publisher, package=package)
+
+
+queue.task('package.import')(Package.import_package)
 
 
 class PackageTag(LogicBase):
@@ -221,6 +302,43 @@ class PackageTag(LogicBase):
         tag = models.PackageTag.get_by_tag(package_id, tag)
         return cls.serialize(tag)
 
+#####################################################
+# Jobs
+
+class JobSchema(ma.ModelSchema):
+    class Meta:
+        model = models.Job
+        fields = ('id', 'name', 'status', 'attempts', 'max_attempts',
+                  'created_at', 'started_at', 'finished_at', 'result',
+                  'error')
+
+    status = EnumField(models.JobStateEnum)
+    error = ma.Method('get_error')
+
+    def get_error(self, data):
+        # the traceback is kept for operators, users get the message
+        if not data.error:
+            return None
+        return data.error.strip().splitlines()[-1]
+
+
+class Job(LogicBase):
+    schema = JobSchema
+
+    @classmethod
+    def get(cls, job_id, user_id):
+        '''
+        Returns the job if it was queued by the user or the user is sysadmin
+        '''
+        job = models.Job.query.get(job_id)
+        if job is None:
+            return None
+        if job.user_id != user_id:
+            user = models.User.query.get(user_id)
+            if user is None or not user.sysadmin:
+                return None
+        return cls.serialize(job)
+
 #####################################################
 # Profiles - Publishers and Users
 
@@ -282,6 +400,15 @@ class Publisher(LogicBase):
         pub = models.Publisher.get_by_name(publisher)
         return cls.serialize(pub)
 
+    @classmethod
+    def get_version_stamp(cls, publisher):
+        '''
+        Returns values which change whenever the serialized publisher,
+        its packages or its members do
+        '''
+        return publisher.id, models.VersionStamp.get(
+            models.VersionStamp.publisher_stamp(publisher.id))
+
     @classmethod
     def create(cls, metadata):
         pub = cls.deserialize(metadata)
@@ -391,16 +518,20 @@ def get_jwt_token():
         raise InvalidUsage('Secret key do not match', 403)
 
 
-def generate_signed_url():
+def authorize_upload_request():
+    """
+    Checks that the user of the request may upload to the package of its
+    `metadata`.
+    :return: Tuple of the request data, publisher and package name
+    """
     user_id = None
     jwt_status, user_info = get_user_from_jwt(request, app.config['JWT_SEED'])
     if jwt_status:
         user_id = user_info['user']
 
     data = request.get_json()
-    metadata, filedata = data['metadata'], data['filedata']
+    metadata = data['metadata']
     publisher, package_name = metadata['owner'], metadata['name']
-    res_payload = {'filedata': {}}
 
     if Package.exists(publisher, package_name):
         status = check_is_authorized('Package::Update', publisher, package_name, user_id)
@@ -409,18 +540,102 @@ def generate_signed_url():
 
     if not status:
         raise InvalidUsage('Not authorized to upload data', 400)
+    return data, publisher, package_name
+
 
-    for relative_path in filedata.keys():
-        response = FileData(package_name=package_name,
-                            publisher=publisher,
-                            relative_path=relative_path,
-                            props=filedata[relative_path])
-        res_payload['filedata'][relative_path] = response.build_file_information()
+def generate_signed_url():
+    data, publisher, package_name = authorize_upload_request()
+    filedata = data['filedata']
+    res_payload = {'filedata': {}}
+
+    bit_store = BitStore(publisher, package_name)
+    # one signer for all files, so the signing key is derived only once
+    signer = bit_store.create_post_signer()
+    # files are validated before anything is looked up for them
+    files = [FileData(package_name=package_name,
+                      publisher=publisher,
+                      relative_path=relative_path,
+                      props=filedata[relative_path],
+                      bitstore=bit_store,
+                      signer=signer)
+             for relative_path in filedata.keys()]
+    unchanged = bit_store.get_unchanged_paths(filedata)
+    upload_ids = {}
+    for response in files:
+        response.unchanged = response.relative_path in unchanged
+        information = response.build_file_information()
+        if 'multipart' in information:
+            upload_ids[response.relative_path] = \
+                information['multipart']['upload_id']
+        res_payload['filedata'][response.relative_path] = information
+
+    bit_store.save_manifest(filedata, upload_ids=upload_ids)
     return res_payload
 
 
+def get_multipart_upload_parts():
+    '''
+    Lists the parts received for a multipart upload and presigns the
+    `part_numbers` requested, so that clients can resume an upload.
+    '''
+    data, publisher, package_name = authorize_upload_request()
+    path, upload_id = get_multipart_upload(data)
+    bit_store = BitStore(publisher, package_name)
+    try:
+        uploaded = bit_store.list_uploaded_parts(path, upload_id)
+    except ClientError as e:
+        raise multipart_upload_error(e)
+    parts = bit_store.generate_part_urls(path, upload_id,
+                                         data.get('part_numbers') or [])
+    return dict(uploaded=uploaded, parts=parts)
+
+
+def complete_multipart_upload():
+    data, publisher, package_name = authorize_upload_request()
+    path, upload_id = get_multipart_upload(data)
+    if not data.get('parts'):
+        raise InvalidUsage('parts not found', 400)
+    bit_store = BitStore(publisher, package_name)
+    try:
+        bit_store.complete_multipart_upload(path, upload_id, data['parts'])
+    except ClientError as e:
+        raise multipart_upload_error(e)
+    return dict(status='OK', key=bit_store.build_s3_key(path))
+
+
+def abort_multipart_upload():
+    data, publisher, package_name = authorize_upload_request()
+    path, upload_id = get_multipart_upload(data)
+    try:
+        BitStore(publisher, package_name).abort_multipart_upload(path,
+                                                                 upload_id)
+    except ClientError as e:
+        raise multipart_upload_error(e)
+    return dict(status='OK')
+
+
 #### helpers
 
+def get_multipart_upload(data):
+    path, upload_id = data.get('path'), data.get('upload_id')
+    if not path or not upload_id:
+        raise InvalidUsage('path and upload_id are required', 400)
+    return path, upload_id
+
+
+def multipart_upload_error(error):
+    '''
+    Converts an S3 error about a multipart upload to the API error.
+    '''
+    code = error.response['Error']['Code']
+    if code == 'NoSuchUpload':
+        return InvalidUsage('Upload not found', 404)
+    if code in ('InvalidPart', 'InvalidPartOrder', 'EntityTooSmall'):
+        return InvalidUsage(error.response['Error'].get('Message') or code,
+                            400)
+    return error
+
+
 def validate_for_template(descriptor):
     '''
     Validates field types in the descriptor for template, e.g. licenses property should be a list.
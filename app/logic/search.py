@@ -4,24 +4,105 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import base64
+import binascii
+import json
 import re
-import sqlalchemy
-from sqlalchemy import or_
-from app.package.models import Package, PackageTag, PackageStateEnum
+from decimal import Decimal
+
+from sqlalchemy import Numeric, and_, cast, or_, func
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from sqlalchemy.orm import contains_eager, joinedload
+from app.package.models import Package, PackageTag, PackageStateEnum, \
+    VersionStamp, search_config
+from app.database import db
 from app.profile.models import Publisher
 from app.utils import InvalidUsage
 
+# columns of the latest tag put in full results
+RESULT_TAG_COLUMNS = ('descriptor', 'readme')
+
+
+class Explain(Executable, ClauseElement):
+    '''
+    EXPLAIN of a select, giving the plan as JSON
+    '''
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, 'postgresql')
+def compile_explain(element, compiler, **kwargs):
+    return 'EXPLAIN (FORMAT JSON) {0}'.format(
+        compiler.process(element.statement, **kwargs))
+
+
 class DataPackageQuery(object):
+    '''
+    Searches packages by a substring of their title, or best matches first
+    with the fulltext mode, by the search vector of their latest tag, or
+    with the fuzzy mode, by trigram similarity of their title or name,
+    which tolerates typos.
+    Results come in pages of `limit` packages in a stable order, by rank
+    then id. The page after a result is selected by the cursor of the
+    result, see get_page.
+    With the summary fields only the name, publisher, title, description
+    and status of packages are selected, instead of their whole latest tag.
+    '''
+    modes = ('title', 'fulltext', 'fuzzy')
+    projections = ('full', 'summary')
 
-    def __init__(self, query_string, limit=None):
+    def __init__(self, query_string, limit=None, mode=None, after=None,
+                 fields=None):
         self.query_string = query_string
         try:
             self.limit = min(int(limit), 1000)
         except (ValueError, TypeError):
             self.limit = 500
+        self.mode = mode or 'title'
+        if self.mode not in self.modes:
+            raise InvalidUsage('Search mode must be one of {0}'
+                               .format(', '.join(self.modes)), 400)
+        self.after = after
+        self.fields = fields or 'full'
+        if self.fields not in self.projections:
+            raise InvalidUsage('Fields must be one of {0}'
+                               .format(', '.join(self.projections)), 400)
 
-    def _build_sql_query(self, query, query_filters):
+    def _mode(self, query):
+        '''
+        Returns the mode the query is searched with. Ranked modes match
+        nothing without words, so an empty query lists all packages as
+        with the title mode
+        '''
+        return self.mode if query else 'title'
+
+    def _rank(self, query):
+        '''
+        Returns the expression ranking matches of ranked modes, or None.
+        Ranks are rounded to numeric so they can be compared exactly with
+        the rank in a cursor
+        '''
+        mode = self._mode(query)
+        if query == '*':
+            return None
+        if mode == 'fulltext':
+            rank = func.ts_rank(PackageTag.search_vector,
+                                func.plainto_tsquery(search_config(), query))
+        elif mode == 'fuzzy':
+            rank = func.greatest(
+                func.similarity(PackageTag.title(), query),
+                func.similarity(Package.name, query))
+        else:
+            return None
+        return func.round(cast(rank, Numeric), 6)
 
+    def _filter_sql_query(self, query, query_filters):
+        '''
+        Returns the query of all matching packages, unordered
+        '''
         sql_query = Package.query.join(Package.publisher)
         sa_filters = []
         for f in query_filters:
@@ -33,16 +114,110 @@ class DataPackageQuery(object):
         if len(sa_filters) > 0:
             sql_query = sql_query.filter(or_(*sa_filters))
 
-        if query != '*' or not query.strip():
-            sql_query = sql_query.join(Package.tags)\
-                .filter(PackageTag.descriptor.op('->>')('title')
-                        .cast(sqlalchemy.TEXT)
-                        .ilike("%{q}%".format(q=query)),
-                        PackageTag.tag == 'latest',
-                        Package.status == PackageStateEnum.active)
+        if query == '*':
+            return sql_query
+
+        mode = self._mode(query)
+        if mode == 'fulltext':
+            ts_query = func.plainto_tsquery(search_config(), query)
+            match = PackageTag.search_vector.op('@@')(ts_query)
+        elif mode == 'fuzzy':
+            match = or_(PackageTag.title().op('%%')(query),
+                        Package.name.op('%%')(query))
+        else:
+            match = PackageTag.title().ilike("%{q}%".format(q=query))
+        return sql_query.join(Package.tags)\
+            .filter(match,
+                    PackageTag.tag == 'latest',
+                    Package.status == PackageStateEnum.active)
+
+    def _build_sql_query(self, query, query_filters):
+
+        sql_query = self._filter_sql_query(query, query_filters)
+        if self.fields == 'summary':
+            if query == '*':
+                sql_query = sql_query.outerjoin(
+                    PackageTag, and_(PackageTag.package_id == Package.id,
+                                     PackageTag.tag == 'latest'))
+            sql_query = sql_query.with_entities(
+                Package.id, Package.name,
+                Publisher.name.label('publisher_name'),
+                PackageTag.title().label('title'),
+                PackageTag.description().label('description'),
+                Package.status)
+        elif query == '*':
+            sql_query = sql_query.options(
+                contains_eager(Package.publisher),
+                joinedload(Package.latest_tag).load_only(*RESULT_TAG_COLUMNS))
+        else:
+            sql_query = sql_query.options(
+                contains_eager(Package.publisher),
+                contains_eager(Package.latest_tag)
+                .load_only(*RESULT_TAG_COLUMNS))
+
+        rank = self._rank(query)
+        if rank is None:
+            sql_query = sql_query.order_by(Package.id)
+        else:
+            sql_query = sql_query.add_columns(rank)\
+                .order_by(rank.desc(), Package.id)
+
+        if self.after is not None:
+            keys = self._decode_cursor(self.after, rank is not None)
+            if rank is None:
+                sql_query = sql_query.filter(Package.id > keys[0])
+            else:
+                sql_query = sql_query.filter(or_(
+                    rank < keys[0],
+                    and_(rank == keys[0], Package.id > keys[1])))
 
         return sql_query
 
+    @staticmethod
+    def _encode_cursor(keys):
+        return base64.urlsafe_b64encode(
+            json.dumps(keys).encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def _decode_cursor(cursor, ranked):
+        '''
+        :return: [rank, id] for ranked queries, otherwise [id]
+        '''
+        try:
+            keys = json.loads(base64.urlsafe_b64decode(
+                cursor.encode('ascii')).decode('utf-8'))
+            if ranked:
+                rank, package_id = keys
+                return [Decimal(rank), int(package_id)]
+            package_id, = keys
+            return [int(package_id)]
+        except (ValueError, TypeError, ArithmeticError, binascii.Error):
+            raise InvalidUsage('Invalid cursor', 400)
+
+    def count(self, estimate=False):
+        '''
+        Counts all matching packages, not only those of a page
+        :param estimate: Return the number of rows the query planner
+            expects instead, which is cheap but approximate
+        '''
+        q, qf = self._parse_query_string()
+        sql_query = self._filter_sql_query(q, qf)
+        if estimate:
+            plan = db.session.execute(
+                Explain(sql_query.with_entities(Package.id).statement))\
+                .scalar()
+            if not isinstance(plan, list):
+                plan = json.loads(plan)
+            return int(plan[0]['Plan']['Plan Rows'])
+        return sql_query.with_entities(func.count(Package.id)).scalar()
+
+    @staticmethod
+    def get_version_stamp():
+        '''
+        Returns a value which changes whenever any search result could
+        '''
+        return VersionStamp.get(VersionStamp.PACKAGES)
+
     def _parse_query_string(self):
 
         regex = "(\\b\\w+\\b:[\\-\\w\\_\\@]+)"
@@ -58,13 +233,43 @@ class DataPackageQuery(object):
         return qu, qu_filters
 
     def get_data(self):
+        return self.get_page()[0]
+
+    def get_page(self):
+        '''
+        :return: (list of packages, cursor of the next page or None if this
+            is the last page)
+        '''
         data_list = []
         q, qf = self._parse_query_string()
+        ranked = self._rank(q) is not None
+        summary = self.fields == 'summary'
 
-        results = self._build_sql_query(q, qf).limit(self.limit)
+        results = self._build_sql_query(q, qf).limit(self.limit + 1).all()
+        next_cursor = None
+        if len(results) > self.limit:
+            results = results[:self.limit]
+            last = results[-1]
+            # rows are packages, or tuples of the package or the summary
+            # columns followed by the rank
+            package_id = last.id if summary or not ranked else last[0].id
+            if ranked:
+                next_cursor = self._encode_cursor([str(last[-1]),
+                                                   package_id])
+            else:
+                next_cursor = self._encode_cursor([package_id])
 
         for result in results:
-            tag = filter(lambda t: t.tag == 'latest', result.tags)[0]
+            if summary:
+                data_list.append({'name': result.name,
+                                  'publisher_name': result.publisher_name,
+                                  'title': result.title,
+                                  'description': result.description,
+                                  'status': result.status.value})
+                continue
+            if ranked:
+                result = result[0]
+            tag = result.latest_tag
             data = {'name': result.name,
                     'descriptor': tag.descriptor,
                     'readme': tag.readme,
@@ -72,4 +277,4 @@ class DataPackageQuery(object):
                     'publisher_name': result.publisher.name}
             data_list.append(data)
 
-        return data_list
+        return data_list, next_cursor
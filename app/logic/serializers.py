@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import functools
+import threading
+import timeit
+
+from marshmallow import fields, missing, ValidationError
+from marshmallow.decorators import PRE_DUMP, POST_DUMP
+
+# Fields whose serialized value is the attribute itself when it is None or
+# of one of these types, as column values are. Other values are serialized
+# by the field. Raw fields pass through any value which is not callable
+PASSTHROUGH_TYPES = {
+    fields.String: (type(''),),
+    fields.Integer: (int,),
+    fields.Boolean: (bool,),
+    fields.Raw: None,
+    fields.Field: None,
+}
+
+serializers = {}
+
+
+class FieldTypeChanged(Exception):
+    """
+    Raised when a field which is not declared gets a value of another type
+    than the one it was compiled for
+    """
+
+
+class Serializer(object):
+    """
+    Dumps objects the same as `schema_class().dump(obj).data`, but builds
+    the schema only once and, on the first dump, compiles its fields to a
+    list of accessors. Plain column fields are read with getattr and
+    Method fields call the schema method directly, skipping the
+    marshalling machinery of marshmallow. Schemas with pre or post dump
+    processors are dumped through a new schema, as are objects whose
+    fields not declared in the schema are of other types than those of
+    the first object.
+    """
+
+    def __init__(self, schema_class):
+        self.schema_class = schema_class
+        self.schema = schema_class()
+        self.accessors = None
+        self.compiled = not has_dump_processors(schema_class)
+        self._lock = threading.Lock()
+
+    def dump(self, obj):
+        if self.accessors is None and self.compiled:
+            with self._lock:
+                if self.accessors is None and self.compiled:
+                    accessors = self.compile(obj)
+                    if accessors is None:
+                        self.compiled = False
+                    else:
+                        self.accessors = accessors
+        if not self.compiled:
+            return self.schema_class().dump(obj).data
+
+        try:
+            return dump_with(self.accessors, obj)
+        except FieldTypeChanged:
+            # marshmallow infers these fields from the object dumped
+            return self.schema_class().dump(obj).data
+
+    def compile(self, obj):
+        """
+        Dumps `obj` through the schema, which binds its fields and infers
+        the type of those listed in the schema options but not declared
+        :return: list of (key, accessor) tuples, or None if they do not
+            dump `obj` the same as the schema
+        """
+        expected = self.schema.dump(obj).data
+        accessors = []
+        for name, field in self.schema.fields.items():
+            if field.load_only:
+                continue
+            accessor = self.compile_field(name, field)
+            if name not in self.schema.declared_fields:
+                accessor = inferred_accessor(
+                    field.attribute or name, type(field),
+                    self.schema.TYPE_MAPPING, accessor)
+            accessors.append((field.dump_to or name, accessor))
+        if dump_with(accessors, obj) != expected:
+            return None
+        return accessors
+
+    def compile_field(self, name, field):
+        if isinstance(field, fields.Method):
+            return method_accessor(getattr(self.schema, field.method_name))
+
+        attribute = field.attribute or name
+        serialize = field_accessor(functools.partial(
+            field.serialize, name, accessor=self.schema.get_attribute))
+        if type(field) in PASSTHROUGH_TYPES and '.' not in attribute and \
+                not getattr(field, 'as_string', False):
+            return passthrough_accessor(
+                attribute, PASSTHROUGH_TYPES[type(field)], serialize)
+        return serialize
+
+
+def dump_with(accessors, obj):
+    result = {}
+    for key, accessor in accessors:
+        value = accessor(obj)
+        if value is not missing:
+            result[key] = value
+    return result
+
+
+def has_dump_processors(schema_class):
+    """
+    Whether the schema has methods decorated with pre_dump or post_dump,
+    which the decorators tag with their name
+    """
+    for name in dir(schema_class):
+        tags = getattr(getattr(schema_class, name, None),
+                       '__marshmallow_tags__', ())
+        if any(tag in (PRE_DUMP, POST_DUMP) for tag, pass_many in tags):
+            return True
+    return False
+
+
+def passthrough_accessor(attribute, types, serialize):
+    def accessor(obj):
+        value = getattr(obj, attribute, missing)
+        if value is None:
+            return value
+        if types is None:
+            if value is not missing and not callable(value):
+                return value
+        elif type(value) in types:
+            return value
+        return serialize(obj)
+    return accessor
+
+
+def inferred_accessor(attribute, field_class, type_mapping, accessor):
+    def wrapped(obj):
+        value = getattr(obj, attribute, None)
+        # every field serializes None to None
+        if value is not None and \
+                type_mapping.get(type(value), fields.Field) is not field_class:
+            raise FieldTypeChanged(attribute)
+        return accessor(obj)
+    return wrapped
+
+
+def method_accessor(method):
+    def accessor(obj):
+        # like marshmallow, leave the key out if the method fails to
+        # read an attribute
+        try:
+            return method(obj)
+        except AttributeError:
+            return missing
+    return accessor
+
+
+def field_accessor(serialize):
+    def accessor(obj):
+        try:
+            return serialize(obj)
+        except ValidationError:
+            return missing
+    return accessor
+
+
+def get_serializer(schema_class):
+    serializer = serializers.get(schema_class)
+    if serializer is None:
+        serializer = serializers[schema_class] = Serializer(schema_class)
+    return serializer
+
+
+def benchmark(schema_class, obj, number=1000):
+    """
+    Measures the cost of serializing `obj` with a new schema per call, as
+    it was done before, and with the compiled serializer.
+    :return: dict of seconds per object for `schema` and `compiled`
+    """
+    serializer = Serializer(schema_class)
+    serializer.dump(obj)
+    schema_time = timeit.timeit(lambda: schema_class().dump(obj).data,
+                                number=number)
+    compiled_time = timeit.timeit(lambda: serializer.dump(obj),
+                                  number=number)
+    return dict(schema=schema_time / number,
+                compiled=compiled_time / number)
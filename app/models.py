@@ -1,2 +1,3 @@
 from app.profile.models import *
 from app.package.models import *
+from app.jobs.models import *
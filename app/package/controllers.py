@@ -4,13 +4,15 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-from flask import Blueprint, request, jsonify, _request_ctx_stack
+from flask import Blueprint, Response, request, jsonify, redirect, \
+    _request_ctx_stack
 from flask import current_app as app
 
 from app.auth.annotations import requires_auth, is_allowed
 from app.auth.annotations import get_user_from_jwt
 from app.bitstore import BitStore
 from app.utils import InvalidUsage
+from app.utils.http import conditional_response, make_etag
 import app.logic as logic
 import app.models as models
 
@@ -80,6 +82,10 @@ def tag_data_package(publisher, package):
     except Exception as e:
         ## TODO roll back changes in db
         raise InvalidUsage(e.message, 500)
+    if not status_bitstore:
+        raise InvalidUsage('Failed to copy {0} objects'
+                           .format(len(status_bitstore.failed)), 500,
+                           payload=dict(failed=status_bitstore.failed))
 
     return jsonify({"status": "OK"}), 200
 
@@ -128,6 +134,10 @@ def delete_data_package(publisher, package):
     except Exception as e:
         ## TODO roll back changes in db
         raise InvalidUsage(e.message, 500)
+    if not status_acl:
+        raise InvalidUsage('Failed to change access for {0} objects'
+                           .format(len(status_acl.failed)), 500,
+                           payload=dict(failed=status_acl.failed))
     if status_acl and status_db:
         return jsonify({"status": "OK"}), 200
 
@@ -178,6 +188,10 @@ def undelete_data_package(publisher, package):
     except Exception as e:
         ## TODO roll back changes in db
         raise InvalidUsage(e.message, 500)
+    if not status_acl:
+        raise InvalidUsage('Failed to change access for {0} objects'
+                           .format(len(status_acl.failed)), 500,
+                           payload=dict(failed=status_acl.failed))
     if status_acl and status_db:
         return jsonify({"status": "OK"}), 200
 
@@ -227,6 +241,10 @@ def purge_data_package(publisher, package):
     except Exception as e:
         ## TODO roll back changes in db
         raise InvalidUsage(e.message, 500)
+    if not status_acl:
+        raise InvalidUsage('Failed to delete {0} objects'
+                           .format(len(status_acl.failed)), 500,
+                           payload=dict(failed=status_acl.failed))
     if status_acl and status_db:
         return jsonify({"status": "OK"}), 200
 
@@ -237,6 +255,8 @@ def finalize_publish():
     Data Package finalize operation.
 
     Gets the datapackage.json and README for Data Package and imports into database.
+    The import runs as a background job, its status is available from
+    /api/jobs/<job_id>
     ---
     tags:
         - package
@@ -253,7 +273,16 @@ def finalize_publish():
           description: JWT Token
     responses:
         200:
-            description: Data Uploaded
+            description: Import queued
+            schema:
+                id: finalize_publish_success
+                properties:
+                    status:
+                        type: string
+                        default: queued
+                    job_id:
+                        type: integer
+                        description: Id of the import job
         400:
             description: Un-Authorized
         401:
@@ -268,9 +297,9 @@ def finalize_publish():
     if jwt_status:
         user_id = user_info['user']
 
-    status = logic.Package.finalize_publish(user_id, datapackage_url)
-    if status:
-        return jsonify({"status": status}), 200
+    job = logic.Package.finalize_publish(user_id, datapackage_url)
+    if job:
+        return jsonify({"status": "queued", "job_id": job.id}), 200
     raise InvalidUsage("Failed to get data from s3")
 
 
@@ -305,13 +334,59 @@ def get_metadata(publisher, package):
                         description: The datapackage.json
         500:
             description: Internal Server Error
+        304:
+            description: Not modified since the version given by
+                If-None-Match or If-Modified-Since
         404:
             description: No metadata found for the package
     """
-    metadata = logic.Package.get(publisher, package)
-    if metadata is None:
+    row = logic.Package.get_document(publisher, package)
+    if row is None:
         raise InvalidUsage('No metadata found for the package', 404)
-    return jsonify(metadata), 200
+    return conditional_response(
+        make_etag(row.id, row.updated_at), row.updated_at,
+        lambda: Response(row.document, mimetype='application/json'))
+
+
+@package_blueprint.route("/<publisher>/<package>/_v/<version>/<path:path>",
+                         methods=["GET"])
+def get_package_file(publisher, package, version, path):
+    """
+    Redirects to the object storing a file of a Data Package version.
+    Used when BITSTORE_CONTENT_ADDRESSED is set, as files are then stored
+    by their md5 instead of their path.
+    ---
+    tags:
+        - package
+    parameters:
+        - in: path
+          name: publisher
+          type: string
+          required: true
+          description: publisher name
+        - in: path
+          name: package
+          type: string
+          required: true
+          description: package name
+        - in: path
+          name: version
+          type: string
+          required: true
+          description: version e.g. latest
+        - in: path
+          name: path
+          type: string
+          required: true
+          description: relative path of the file in the data package
+    responses:
+        302:
+            description: Redirect to the object in the bitstore
+    """
+    bitstore = BitStore(publisher, package, version=version)
+    return redirect('{base_url}/{key}'.format(
+        base_url=app.config['BITSTORE_URL'],
+        key=bitstore.resolve_key(path)))
 
 
 @package_blueprint.route("/<publisher>", methods=["GET"])
@@ -346,5 +421,9 @@ def get_all_metadata_names_for_publisher(publisher):
             description: No Data Package Found For The Publisher
     """
     publisher = models.Publisher.query.filter_by(name=publisher).first_or_404()
-    pkgnames = [ pkg.name for pkg in publisher.packages ]
-    return jsonify({'data': pkgnames}), 200
+    etag = make_etag(*logic.Publisher.get_version_stamp(publisher))
+
+    def build_response():
+        pkgnames = [ pkg.name for pkg in publisher.packages ]
+        return jsonify({'data': pkgnames})
+    return conditional_response(etag, None, build_response)
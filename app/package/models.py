@@ -6,17 +6,55 @@ from __future__ import unicode_literals
 
 import json
 import datetime
+from itertools import chain
 
 import enum
+from sqlalchemy import DDL
 from sqlalchemy import ForeignKey
+from sqlalchemy import Index
+from sqlalchemy import TEXT
 from sqlalchemy import UniqueConstraint
+from sqlalchemy import and_, or_, event, func, literal_column
+from sqlalchemy import text, type_coerce
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from flask import current_app as app
-from sqlalchemy.orm import relationship
-from app.profile.models import Publisher
+from flask_sqlalchemy import SignallingSession
+from sqlalchemy.orm import relationship, contains_eager, deferred, \
+    joinedload
+from app.profile.models import Publisher, PublisherUser
 from app.database import db
+from app.utils.helpers import MARKDOWN_PIPELINE_VERSION, render_readmes
 from botocore.exceptions import ClientError
 
 
+# text search configuration of the package search vectors
+SEARCH_CONFIG = 'english'
+# texts are cut to this many characters before they are indexed, keeping
+# search vectors well below the 1MB Postgres allows for a tsvector
+SEARCH_TEXT_MAX_SIZE = 64 * 1024
+
+
+def search_config():
+    return literal_column("'{0}'::regconfig".format(SEARCH_CONFIG))
+
+
+def build_search_vector(weighted_texts):
+    """
+    Builds the SQL expression of a weighted tsvector
+    :param weighted_texts: List of (text, weight) tuples, weight being one
+        of A, B, C or D. Texts which are not strings are left out, longer
+        ones are cut to SEARCH_TEXT_MAX_SIZE characters
+    """
+    vector = None
+    for text, weight in weighted_texts:
+        if not isinstance(text, (bytes, type(''))):
+            text = ''
+        text = text[:SEARCH_TEXT_MAX_SIZE]
+        part = func.setweight(func.to_tsvector(search_config(), text), weight)
+        vector = part if vector is None else vector.op('||')(part)
+    return vector
+
+
 class PackageStateEnum(enum.Enum):
     active = "ACTIVE"
     deleted = "DELETED"
@@ -41,18 +79,45 @@ class Package(db.Model):
                              single_parent=True)
 
     tags = relationship("PackageTag", back_populates="package")
+    latest_tag = relationship(
+        "PackageTag", uselist=False, viewonly=True,
+        primaryjoin="and_(Package.id == PackageTag.package_id, "
+                    "PackageTag.tag == 'latest')")
 
     __table_args__ = (
         UniqueConstraint("name", "publisher_id"),
     )
 
+    @classmethod
+    def query_with_latest_tag(cls):
+        """
+        Query of packages loading their publisher and latest tag in the
+        same statement, so serializing them does not lazy load
+        """
+        return cls.query.join(Publisher) \
+            .options(contains_eager(cls.publisher),
+                     joinedload(cls.latest_tag))
+
     @classmethod
     def get_by_publisher(cls, publisher_name, package_name):
-        instance = cls.query.join(Publisher) \
+        instance = cls.query_with_latest_tag() \
             .filter(Package.name == package_name,
                     Publisher.name == publisher_name).one_or_none()
         return instance
 
+    @classmethod
+    def get_many(cls, names):
+        """
+        Gets many packages in one query
+        :param names: List of (publisher name, package name) tuples
+        """
+        if not names:
+            return []
+        return cls.query_with_latest_tag() \
+            .filter(or_(*[and_(Publisher.name == publisher_name,
+                               Package.name == package_name)
+                          for publisher_name, package_name in names])).all()
+
 
 class PackageTag(db.Model):
 
@@ -60,6 +125,8 @@ class PackageTag(db.Model):
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow,
+                           onupdate=datetime.datetime.utcnow)
 
     tag = db.Column(db.TEXT, index=True, default='latest')
     tag_description = db.Column(db.Text)
@@ -67,6 +134,19 @@ class PackageTag(db.Model):
     descriptor = db.Column(db.JSON)
     readme = db.Column(db.TEXT)
 
+    # readme rendered at publish time, see render_readme
+    readme_html = db.Column(db.TEXT)
+    readme_short = db.Column(db.TEXT)
+    readme_render_version = db.Column(db.Integer)
+
+    # JSON encoded API response for the package, see Package.build_document.
+    # Deferred as it is only read by itself, see get_document
+    document = deferred(db.Column(db.TEXT))
+
+    # full text search vector, only kept for latest tags of active packages.
+    # Deferred as it is only written and matched in SQL
+    search_vector = deferred(db.Column(TSVECTOR))
+
     package_id = db.Column(db.Integer, ForeignKey("package.id", ondelete='CASCADE'))
 
     package = relationship("Package", back_populates="tags",
@@ -75,10 +155,166 @@ class PackageTag(db.Model):
 
     __table_args__ = (
         UniqueConstraint("tag", "package_id"),
+        Index('ix_package_tag_search_vector', 'search_vector',
+              postgresql_using='gin'),
     )
 
+    def update_search_vector(self, publisher_name):
+        """
+        Sets the search vector to the title, name and publisher, weighted
+        most, then the description and keywords and last the readme
+        """
+        descriptor = self.descriptor if isinstance(self.descriptor, dict) \
+            else {}
+        keywords = descriptor.get('keywords')
+        if isinstance(keywords, list):
+            keywords = ' '.join(keyword for keyword in keywords
+                                if isinstance(keyword, (bytes, type(''))))
+        self.search_vector = build_search_vector([
+            (descriptor.get('title'), 'A'),
+            (descriptor.get('name'), 'A'),
+            (publisher_name, 'A'),
+            (descriptor.get('description'), 'B'),
+            (keywords, 'B'),
+            (self.readme, 'C')])
+
+    @property
+    def readme_is_stale(self):
+        return self.readme_render_version != MARKDOWN_PIPELINE_VERSION
+
+    def render_readme(self):
+        """
+        Renders the readme to html and its short summary, which are stored
+        so that views of the package need not render markdown
+        """
+        PackageTag.render_readmes([self])
+
+    @staticmethod
+    def render_readmes(tags, renderer=None):
+        """
+        Renders the readmes of many tags in one batch, see render_readme
+        """
+        rendered = render_readmes(
+            [(tag.readme, tag.descriptor) for tag in tags],
+            renderer=renderer)
+        for tag, (readme_html, readme_short) in zip(tags, rendered):
+            tag.readme_html = readme_html
+            tag.readme_short = readme_short
+            tag.readme_render_version = MARKDOWN_PIPELINE_VERSION
+
+    @classmethod
+    def get_document(cls, publisher_name, package_name, tag='latest'):
+        """
+        Gets only the id, update time and stored document of a package
+        version
+        :return: (id, updated_at, document) row or None if not found
+        """
+        return db.session.query(cls.id, cls.updated_at, cls.document) \
+            .join(Package).join(Publisher) \
+            .filter(Publisher.name == publisher_name,
+                    Package.name == package_name,
+                    cls.tag == tag).one_or_none()
+
     @classmethod
     def get_by_tag(cls, package_id, tag):
         instance = cls.query.join(Package).filter(
                 Package.id==package_id, PackageTag.tag==tag).first()
         return instance
+
+    @classmethod
+    def title(cls):
+        """
+        The descriptor title as text. It is the same expression as the
+        trigram index on it, so searches on it can use the index
+        """
+        return type_coerce(cls.descriptor.op('->>')('title'), TEXT)
+
+    @classmethod
+    def description(cls):
+        """
+        The descriptor description as text
+        """
+        return type_coerce(cls.descriptor.op('->>')('description'), TEXT)
+
+
+# Trigram indexes serving substring and fuzzy package searches, created
+# with the tables by `manager.py createdb`
+event.listen(db.Model.metadata, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+             .execute_if(dialect='postgresql'))
+event.listen(PackageTag.__table__, 'after_create',
+             DDL("CREATE INDEX ix_package_tag_title_trgm ON package_tag "
+                 "USING gin ((descriptor ->> 'title') gin_trgm_ops)")
+             .execute_if(dialect='postgresql'))
+event.listen(Package.__table__, 'after_create',
+             DDL("CREATE INDEX ix_package_name_trgm ON package "
+                 "USING gin (name gin_trgm_ops)")
+             .execute_if(dialect='postgresql'))
+
+
+class VersionStamp(db.Model):
+    """
+    Counters bumped in the same transaction as every write to what they
+    cover, so conditional reads get their version stamp with a primary
+    key lookup instead of aggregating the tables. See bump_version_stamps
+    """
+    __tablename__ = 'version_stamp'
+
+    # changes whenever any search result could
+    PACKAGES = 'packages'
+
+    name = db.Column(db.TEXT, primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+    @staticmethod
+    def publisher_stamp(publisher_id):
+        """
+        Name of the stamp of a publisher, changing with the publisher, its
+        packages and its members
+        """
+        return 'publisher:{0}'.format(publisher_id)
+
+    @classmethod
+    def get(cls, name):
+        return db.session.query(cls.value).filter(cls.name == name)\
+            .scalar() or 0
+
+    @staticmethod
+    def bump(session, names):
+        """
+        Increments the stamps in the transaction of the session. They are
+        bumped in a fixed order, so concurrent writers lock the rows in the
+        same order and can not deadlock
+        """
+        for name in sorted(names):
+            session.execute(
+                text('INSERT INTO version_stamp (name, value) '
+                     'VALUES (:name, 1) ON CONFLICT (name) '
+                     'DO UPDATE SET value = version_stamp.value + 1'),
+                dict(name=name))
+
+
+@event.listens_for(SignallingSession, 'after_flush')
+def bump_version_stamps(session, flush_context):
+    """
+    Bumps the stamps covering the packages, tags, publishers and members
+    the flush wrote
+    """
+    names = set()
+    changed = chain(session.new, session.deleted,
+                    (instance for instance in session.dirty
+                     if session.is_modified(instance)))
+    for instance in changed:
+        if isinstance(instance, (Package, PackageTag)):
+            names.add(VersionStamp.PACKAGES)
+        if isinstance(instance, Package) and \
+                instance.publisher_id is not None:
+            names.add(VersionStamp.publisher_stamp(instance.publisher_id))
+        elif isinstance(instance, Publisher):
+            # search results show the publisher name
+            names.add(VersionStamp.PACKAGES)
+            names.add(VersionStamp.publisher_stamp(instance.id))
+        elif isinstance(instance, PublisherUser):
+            names.add(VersionStamp.publisher_stamp(instance.publisher_id))
+    if names:
+        VersionStamp.bump(session, names)
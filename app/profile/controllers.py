@@ -7,7 +7,9 @@ from __future__ import unicode_literals
 from flask import Blueprint, jsonify
 from flask import current_app as app
 from app.utils import InvalidUsage
+from app.utils.http import conditional_response, make_etag
 import app.logic as logic
+import app.models as models
 
 profile_blueprint = Blueprint('profile', __name__, url_prefix='/api/profile')
 
@@ -62,7 +64,10 @@ def get_publisher_profile(name):
                             type: string
                             default: SUCCESS
         """
-    info = logic.Publisher.get(name)
-    if not info:
+    publisher = models.Publisher.get_by_name(name)
+    if not publisher:
         raise InvalidUsage('Not Found', 404)
-    return jsonify(dict(data=info, status="SUCCESS"))
+    return conditional_response(
+        make_etag(*logic.Publisher.get_version_stamp(publisher)), None,
+        lambda: jsonify(dict(data=logic.Publisher.serialize(publisher),
+                             status="SUCCESS")))
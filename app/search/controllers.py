@@ -7,6 +7,8 @@ from __future__ import unicode_literals
 from flask import Blueprint, request, jsonify
 from flask import current_app as app
 from app.logic.search import DataPackageQuery
+from app.utils import InvalidUsage
+from app.utils.http import conditional_response, make_etag
 
 search_blueprint = Blueprint('search', __name__, url_prefix='/api/search')
 
@@ -24,6 +26,38 @@ def search_packages():
               type: string
               required: true
               description: search query string e.g. q=query publisher=pub
+            - in: query
+              name: mode
+              type: string
+              required: false
+              description: title (default) to match titles, fulltext to
+                match titles, descriptions, keywords and READMEs, fuzzy to
+                match titles and names despite typos, both best matches
+                first
+            - in: query
+              name: limit
+              type: integer
+              required: false
+              description: page size, at most 1000
+            - in: query
+              name: after
+              type: string
+              required: false
+              description: cursor of the page to get, the next value of
+                the previous page
+            - in: query
+              name: fields
+              type: string
+              required: false
+              description: full (default) for the descriptor and README of
+                packages, summary for only their name, publisher, title,
+                description and status
+            - in: query
+              name: count
+              type: string
+              required: false
+              description: exact (default) to count all matches, estimate
+                for a cheap estimate from the query planner
         responses:
             500:
                 description: Internal Server Error
@@ -35,6 +69,10 @@ def search_packages():
                         total_count:
                             type: integer
                             description: Total datapackage count
+                        next:
+                            type: string
+                            description: Cursor of the next page, null on
+                                the last page
                         items:
                             type: list
                             properties:
@@ -45,6 +83,21 @@ def search_packages():
         q = ''
     limit = request.args.get('limit')
 
-    result = DataPackageQuery(query_string=q.strip(),
-                              limit=limit).get_data()
-    return jsonify(dict(items=result, total_count=len(result)))
+    count = request.args.get('count', 'exact')
+    if count not in ('exact', 'estimate'):
+        raise InvalidUsage('Count must be exact or estimate', 400)
+
+    query = DataPackageQuery(query_string=q.strip(), limit=limit,
+                             mode=request.args.get('mode'),
+                             after=request.args.get('after'),
+                             fields=request.args.get('fields'))
+    etag = make_etag(query.query_string, query.limit, query.mode,
+                     query.after, query.fields, count,
+                     DataPackageQuery.get_version_stamp())
+
+    def build_response():
+        result, next_cursor = query.get_page()
+        total_count = query.count(estimate=count == 'estimate')
+        return jsonify(dict(items=result, total_count=total_count,
+                            next=next_cursor))
+    return conditional_response(etag, None, build_response)
@@ -14,6 +14,9 @@ import app.logic as logic
 
 site_blueprint = Blueprint('site', __name__)
 
+# packages per page of the search page
+SEARCH_PAGE_SIZE = 20
+
 
 @site_blueprint.route("/", methods=["GET", "POST"])
 def index():
@@ -21,10 +24,12 @@ def index():
     Renders index.html if no token found in cookie.
     If token found in cookie then it renders dashboard.html
     """
-    showcase_packages = [logic.Package.get(item['publisher'], item['package']) for item in app.config['FRONT_PAGE_SHOWCASE_PACKAGES']]
-    tutorial_packages = [ logic.Package.get(item['publisher'], item['package']) for item in app.config['TUTORIAL_PACKAGES']]
-    showcase_packages = filter(None, showcase_packages)
-    tutorial_packages = filter(None, tutorial_packages)
+    showcase_packages = logic.Package.get_many(
+        [(item['publisher'], item['package'])
+         for item in app.config['FRONT_PAGE_SHOWCASE_PACKAGES']])
+    tutorial_packages = logic.Package.get_many(
+        [(item['publisher'], item['package'])
+         for item in app.config['TUTORIAL_PACKAGES']])
 
     if g.current_user:
         return render_template("dashboard.html",
@@ -84,9 +89,12 @@ def search_package():
     q = request.args.get('q')
     if q is None:
         q = ''
-    datapackage_list = logic.search.DataPackageQuery(query_string=q.strip(),
-                                        limit=1000).get_data()
+    query = logic.search.DataPackageQuery(query_string=q.strip(),
+                                          limit=SEARCH_PAGE_SIZE,
+                                          after=request.args.get('after'))
+    datapackage_list, next_cursor = query.get_page()
     return render_template("search.html",
                            datapackage_list=datapackage_list,
-                           total_count=len(datapackage_list),
+                           total_count=query.count(),
+                           next_cursor=next_cursor,
                            query_term=q), 200
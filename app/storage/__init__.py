@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+# Storage backends for the BitStore. A backend is any object implementing
+# the part of the boto3 S3 client API used by app.bitstore.BitStore
+# (get/put/head/copy objects, list_objects_v2, delete_objects,
+# put_object_acl, multipart uploads and generate_presigned_post) and
+# raising botocore ClientError with the S3 error codes. The backend is
+# chosen with the BITSTORE_BACKEND config and stored in app.config['S3'].
+
+import boto3
+from botocore.client import Config
+
+from app.storage.local import LocalStorageClient
+
+
+def create_s3_client(config):
+    return boto3.client('s3',
+                        region_name=config['AWS_REGION'],
+                        aws_access_key_id=config['AWS_ACCESS_KEY_ID'],
+                        config=Config(signature_version='s3v4'),
+                        aws_secret_access_key=config['AWS_SECRET_ACCESS_KEY'])
+
+
+def create_local_client(config):
+    return LocalStorageClient(root=config['BITSTORE_LOCAL_ROOT'],
+                              secret=config['JWT_SEED'],
+                              url=config['BITSTORE_URL'])
+
+
+BACKENDS = {
+    's3': create_s3_client,
+    'local': create_local_client
+}
+
+
+def create_storage_client(config):
+    """
+    Creates the storage client for the configured BITSTORE_BACKEND
+    """
+    backend = config['BITSTORE_BACKEND']
+    if backend not in BACKENDS:
+        raise Exception("Unknown BITSTORE_BACKEND `%s`, expected one of %s"
+                        % (backend, ', '.join(sorted(BACKENDS))))
+    return BACKENDS[backend](config)
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import base64
+import hashlib
+
+from botocore.exceptions import ClientError
+from flask import Blueprint, request, jsonify, send_file
+from flask import current_app as app
+
+from app.storage.local import LocalStorageClient
+from app.utils import InvalidUsage
+
+storage_blueprint = Blueprint('storage', __name__, url_prefix='/api/storage')
+
+
+def get_local_client():
+    client = app.config['S3']
+    if not isinstance(client, LocalStorageClient):
+        raise InvalidUsage('Not Found', 404)
+    return client
+
+
+@storage_blueprint.route('/<path:key>', methods=['GET'])
+def get_object(key):
+    """
+    Serves a public object of the local storage backend.
+    Only available if BITSTORE_BACKEND is local.
+    ---
+    tags:
+        - storage
+    parameters:
+        - in: path
+          name: key
+          type: string
+          required: true
+          description: object key
+    responses:
+        200:
+            description: The object
+        404:
+            description: Object not found or not public
+    """
+    client = get_local_client()
+    try:
+        info = client.get_object_info(app.config['S3_BUCKET_NAME'], key)
+    except ClientError:
+        raise InvalidUsage('Not Found', 404)
+    if info['ACL'] != 'public-read':
+        raise InvalidUsage('Not Found', 404)
+    # send_file hands the open file to the server's wsgi.file_wrapper,
+    # which uses sendfile(2) under gunicorn
+    response = send_file(info['Path'], mimetype=info['ContentType'],
+                         add_etags=False, conditional=True)
+    response.set_etag(info['ETag'].strip('"'))
+    return response.make_conditional(request)
+
+
+@storage_blueprint.route('/_parts', methods=['PUT'])
+def upload_part():
+    """
+    Stores a part of a multipart upload in the local storage backend.
+    The URL, including its signed policy, is generated by
+    /api/datastore/authorize. Only available if BITSTORE_BACKEND is local.
+    ---
+    tags:
+        - storage
+    responses:
+        200:
+            description: Part stored, its ETag is in the ETag header
+        403:
+            description: Policy is invalid or expired
+        404:
+            description: Upload not found
+    """
+    client = get_local_client()
+    policy = client.verify_policy(request.args.get('policy', ''),
+                                  request.args.get('signature'))
+    if policy is None or policy.get('method') != 'upload_part':
+        raise InvalidUsage('Invalid or expired upload policy', 403)
+    try:
+        response = client.upload_part(Bucket=policy['bucket'],
+                                      Key=policy['key'],
+                                      UploadId=policy['upload_id'],
+                                      PartNumber=policy['part_number'],
+                                      Body=request.stream)
+    except ClientError:
+        raise InvalidUsage('Upload not found', 404)
+    return '', 200, {'ETag': response['ETag']}
+
+
+@storage_blueprint.route('', methods=['POST'])
+def upload_object():
+    """
+    Stores a file in the local storage backend.
+    The form fields are the ones returned by /api/datastore/authorize,
+    the file is sent as `file`. Only available if BITSTORE_BACKEND is local.
+    ---
+    tags:
+        - storage
+    responses:
+        204:
+            description: File stored
+        400:
+            description: File missing or Content-MD5 does not match
+        403:
+            description: Policy is invalid, expired or a field does not
+                match its condition
+    """
+    client = get_local_client()
+    form = request.form
+    policy = client.verify_policy(form.get('policy', ''),
+                                  form.get('signature'))
+    if policy is None or policy.get('method') != 'post_object' \
+            or policy['key'] != form.get('key'):
+        raise InvalidUsage('Invalid or expired upload policy', 403)
+    for name, value in policy.get('conditions', {}).items():
+        if form.get(name) != value:
+            raise InvalidUsage('Invalid {0} for upload policy'.format(name),
+                               403)
+    upload = request.files.get('file')
+    if upload is None:
+        raise InvalidUsage('file not found', 400)
+
+    body = upload.read()
+    expected_md5 = form.get('Content-MD5')
+    if expected_md5 and \
+            base64.b64encode(hashlib.md5(body).digest()).decode('ascii') \
+            != expected_md5:
+        raise InvalidUsage('Content-MD5 does not match', 400)
+
+    client.put_object(Bucket=policy['bucket'], Key=policy['key'], Body=body,
+                      ACL=policy['acl'],
+                      ContentType=form.get('Content-Type',
+                                           'binary/octet-stream'))
+    return '', 204
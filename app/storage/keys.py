@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import posixpath
+
+
+def is_valid_key(key):
+    """
+    Whether `key` is a relative, normalized path. Keys with empty, `.` or
+    `..` segments are rejected, so that a key built from a client supplied
+    path can not point out of the prefix it is put under
+    """
+    if not isinstance(key, (bytes, type(''))) or not key:
+        return False
+    if key.startswith('/') or '\\' in key or '\0' in key:
+        return False
+    if any(segment in ('', '.', '..') for segment in key.split('/')):
+        return False
+    return posixpath.normpath(key) == key
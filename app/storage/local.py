@@ -0,0 +1,459 @@
+# -*- coding: utf-8 -*-
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import base64
+import datetime
+import hashlib
+import hmac
+import json
+import mmap
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+
+from botocore.exceptions import ClientError
+from werkzeug.urls import url_encode
+
+from app.storage.keys import is_valid_key
+
+# upload ids are generated by create_multipart_upload as uuid4().hex
+UPLOAD_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+class MappedBody(object):
+    """
+    File like body of a local object. The file is memory mapped, so reads
+    are served from the page cache without copying it through python
+    file objects.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) \
+                if size else None
+        self._position = 0
+        self._size = size
+
+    def read(self, amt=None):
+        if self._map is None:
+            return b''
+        end = self._size if amt is None \
+            else min(self._size, self._position + amt)
+        data = self._map[self._position:end]
+        self._position = end
+        return data
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+
+
+class LocalStorageClient(object):
+    """
+    Storage backend keeping objects in a directory tree. It implements the
+    part of the boto3 S3 client API which is used by
+    :class:`~app.bitstore.BitStore`, so it can be used in place of
+    ``app.config['S3']``. Objects are stored under ``<root>/<bucket>/<key>``
+    and their ETag, ACL and content type in a ``<root>/.meta`` sidecar.
+    Uploads are authorized with HMAC signed, presigned-post style policies
+    which are checked by :func:`~app.storage.controllers.upload_object`.
+    """
+
+    def __init__(self, root, secret, url):
+        self.root = os.path.abspath(root)
+        self.secret = secret
+        self.url = url
+        for directory in (self.root, self._meta_root, self._uploads_root,
+                          self._tmp_root):
+            _makedirs(directory)
+
+    @property
+    def _meta_root(self):
+        return os.path.join(self.root, '.meta')
+
+    @property
+    def _uploads_root(self):
+        return os.path.join(self.root, '.uploads')
+
+    @property
+    def _tmp_root(self):
+        return os.path.join(self.root, '.tmp')
+
+    def _atomic_write(self, path, data):
+        """
+        Writes bytes, or calls `data` with the open file, in a temporary
+        file which is then renamed to path. Temporary files are kept out
+        of the bucket directories so that listings never see them.
+        """
+        _makedirs(os.path.dirname(path))
+        fd, tmp_path = tempfile.mkstemp(dir=self._tmp_root)
+        with os.fdopen(fd, 'wb') as f:
+            if callable(data):
+                data(f)
+            else:
+                f.write(data)
+        os.rename(tmp_path, path)
+
+    def object_path(self, bucket, key):
+        if not is_valid_key(bucket) or '/' in bucket or \
+                bucket.startswith('.') or not is_valid_key(key):
+            raise _error('InvalidArgument', 'Invalid key {0}'.format(key))
+        return os.path.join(self.root, bucket, *key.split('/'))
+
+    def _meta_path(self, bucket, key):
+        return os.path.join(self._meta_root,
+                            os.path.relpath(self.object_path(bucket, key),
+                                            self.root) + '.json')
+
+    def _read_meta(self, bucket, key):
+        try:
+            with open(self._meta_path(bucket, key)) as f:
+                return json.load(f)
+        except (IOError, OSError):
+            raise _error('NoSuchKey', 'The specified key does not exist.')
+
+    def _write_meta(self, bucket, key, meta):
+        self._atomic_write(self._meta_path(bucket, key),
+                           json.dumps(meta).encode('utf-8'))
+
+    def _store(self, bucket, key, source, acl='private',
+               content_type='binary/octet-stream', metadata=None):
+        """
+        Writes the file like `source` to the object atomically and returns
+        its ETag.
+        """
+        path = self.object_path(bucket, key)
+        md5 = hashlib.md5()
+
+        def write(f):
+            for chunk in iter(lambda: source.read(1024 * 1024), b''):
+                md5.update(chunk)
+                f.write(chunk)
+
+        self._atomic_write(path, write)
+        etag = '"{0}"'.format(md5.hexdigest())
+        self._write_meta(bucket, key, dict(ETag=etag, ACL=acl,
+                                           ContentType=content_type,
+                                           Metadata=metadata or {}))
+        return etag
+
+    def get_object_info(self, bucket, key):
+        """
+        :return: Dict with the path, ETag, ACL and ContentType of an object
+        """
+        meta = self._read_meta(bucket, key)
+        meta['Path'] = self.object_path(bucket, key)
+        return meta
+
+    def put_object(self, Bucket, Key, Body=b'', ACL='private',
+                   ContentType='binary/octet-stream', Metadata=None,
+                   **kwargs):
+        if not hasattr(Body, 'read'):
+            if not isinstance(Body, bytes):
+                Body = Body.encode('utf-8')
+            Body = _BytesReader(Body)
+        etag = self._store(Bucket, Key, Body, acl=ACL,
+                           content_type=ContentType, metadata=Metadata)
+        return dict(ETag=etag)
+
+    def head_object(self, Bucket, Key, **kwargs):
+        meta = self._read_meta(Bucket, Key)
+        stat = os.stat(self.object_path(Bucket, Key))
+        return dict(ETag=meta['ETag'], ContentType=meta['ContentType'],
+                    Metadata=meta['Metadata'], ContentLength=stat.st_size,
+                    LastModified=_mtime(stat))
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None, **kwargs):
+        response = self.head_object(Bucket, Key)
+        if IfNoneMatch is not None and IfNoneMatch == response['ETag']:
+            raise _error('304', 'Not Modified')
+        response['Body'] = MappedBody(self.object_path(Bucket, Key))
+        return response
+
+    def list_objects_v2(self, Bucket, Prefix='', MaxKeys=1000,
+                        ContinuationToken=None, **kwargs):
+        bucket_root = os.path.join(self.root, Bucket)
+        start = os.path.join(bucket_root, os.path.dirname(Prefix))
+        keys = []
+        for directory, _, files in os.walk(start):
+            for name in files:
+                key = os.path.relpath(os.path.join(directory, name),
+                                      bucket_root).replace(os.sep, '/')
+                if key.startswith(Prefix) and \
+                        (ContinuationToken is None or key > ContinuationToken):
+                    keys.append(key)
+        keys.sort()
+        page = keys[:MaxKeys]
+        contents = []
+        for key in page:
+            stat = os.stat(self.object_path(Bucket, key))
+            contents.append(dict(Key=key, Size=stat.st_size,
+                                 LastModified=_mtime(stat),
+                                 ETag=self._read_meta(Bucket, key)['ETag']))
+        response = dict(KeyCount=len(page), IsTruncated=len(keys) > MaxKeys)
+        if contents:
+            response['Contents'] = contents
+        if response['IsTruncated']:
+            response['NextContinuationToken'] = page[-1]
+        return response
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        errors, deleted = [], []
+        for ob in Delete['Objects']:
+            try:
+                for path in (self.object_path(Bucket, ob['Key']),
+                             self._meta_path(Bucket, ob['Key'])):
+                    if os.path.exists(path):
+                        os.remove(path)
+                deleted.append(dict(Key=ob['Key']))
+            except (OSError, ClientError) as e:
+                errors.append(dict(Key=ob['Key'], Code='InternalError',
+                                   Message=str(e)))
+        response = dict(Errors=errors)
+        if not Delete.get('Quiet'):
+            response['Deleted'] = deleted
+        return response
+
+    def put_object_acl(self, Bucket, Key, ACL, **kwargs):
+        meta = self._read_meta(Bucket, Key)
+        meta['ACL'] = ACL
+        self._write_meta(Bucket, Key, meta)
+        return {}
+
+    def copy_object(self, Bucket, Key, CopySource, ACL='private', **kwargs):
+        meta = self._read_meta(CopySource['Bucket'], CopySource['Key'])
+        source = self.object_path(CopySource['Bucket'], CopySource['Key'])
+        target = self.object_path(Bucket, Key)
+        _makedirs(os.path.dirname(target))
+        # objects are always replaced by rename and never written in place,
+        # so a hard link is a safe zero-copy copy
+        tmp_path = os.path.join(self._tmp_root, uuid.uuid4().hex)
+        try:
+            os.link(source, tmp_path)
+        except OSError:
+            shutil.copyfile(source, tmp_path)
+        os.rename(tmp_path, target)
+        meta['ACL'] = ACL
+        self._write_meta(Bucket, Key, meta)
+        return dict(CopyObjectResult=dict(ETag=meta['ETag']))
+
+    def create_multipart_upload(self, Bucket, Key, ACL='private',
+                                ContentType='binary/octet-stream',
+                                Metadata=None, **kwargs):
+        upload_id = uuid.uuid4().hex
+        upload_dir = os.path.join(self._uploads_root, upload_id)
+        os.makedirs(upload_dir)
+        upload = dict(Bucket=Bucket, Key=Key, ACL=ACL,
+                      ContentType=ContentType, Metadata=Metadata or {})
+        self._atomic_write(os.path.join(upload_dir, 'upload.json'),
+                           json.dumps(upload).encode('utf-8'))
+        return dict(Bucket=Bucket, Key=Key, UploadId=upload_id)
+
+    def list_multipart_uploads(self, Bucket, Prefix='', **kwargs):
+        uploads = []
+        for upload_id in sorted(os.listdir(self._uploads_root)):
+            try:
+                with open(os.path.join(self._uploads_root, upload_id,
+                                       'upload.json')) as f:
+                    upload = json.load(f)
+            except (IOError, OSError, ValueError):
+                continue
+            if upload['Bucket'] == Bucket and \
+                    upload['Key'].startswith(Prefix):
+                uploads.append(dict(Key=upload['Key'], UploadId=upload_id))
+        return dict(Bucket=Bucket, Uploads=uploads, IsTruncated=False)
+
+    def _upload_dir(self, upload_id):
+        """
+        :return: The directory of an upload. The id is checked before the
+            filesystem is touched, so a client supplied id can not point
+            outside of the uploads directory.
+        """
+        if not isinstance(upload_id, basestring) or \
+                not UPLOAD_ID_PATTERN.match(upload_id):
+            raise _error('NoSuchUpload', 'The specified upload does not exist.')
+        upload_dir = os.path.join(self._uploads_root, upload_id)
+        if not os.path.isdir(upload_dir):
+            raise _error('NoSuchUpload', 'The specified upload does not exist.')
+        return upload_dir
+
+    def _part_path(self, upload_id, part_number):
+        return os.path.join(self._upload_dir(upload_id),
+                            '{0:05d}'.format(int(part_number)))
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        if not hasattr(Body, 'read'):
+            Body = _BytesReader(Body)
+        md5 = hashlib.md5()
+
+        def write(f):
+            for chunk in iter(lambda: Body.read(1024 * 1024), b''):
+                md5.update(chunk)
+                f.write(chunk)
+
+        self._atomic_write(self._part_path(UploadId, PartNumber), write)
+        return dict(ETag='"{0}"'.format(md5.hexdigest()))
+
+    def list_parts(self, Bucket, Key, UploadId, **kwargs):
+        upload_dir = os.path.dirname(self._part_path(UploadId, 1))
+        parts = []
+        for name in sorted(os.listdir(upload_dir)):
+            if not name.isdigit():
+                continue
+            md5 = hashlib.md5()
+            with open(os.path.join(upload_dir, name), 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    md5.update(chunk)
+            parts.append(dict(PartNumber=int(name),
+                              ETag='"{0}"'.format(md5.hexdigest()),
+                              Size=os.path.getsize(
+                                  os.path.join(upload_dir, name))))
+        return dict(Bucket=Bucket, Key=Key, UploadId=UploadId, Parts=parts,
+                    IsTruncated=False)
+
+    def upload_part_copy(self, Bucket, Key, UploadId, PartNumber, CopySource,
+                         CopySourceRange=None, **kwargs):
+        source = self.object_path(CopySource['Bucket'], CopySource['Key'])
+        first, last = 0, os.path.getsize(source) - 1
+        if CopySourceRange:
+            first, last = [int(i) for i in
+                           CopySourceRange.split('=')[1].split('-')]
+        with open(source, 'rb') as f:
+            f.seek(first)
+            response = self.upload_part(Bucket, Key, UploadId, PartNumber,
+                                        _BytesReader(f.read(last - first + 1)))
+        return dict(CopyPartResult=response)
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId,
+                                  MultipartUpload, **kwargs):
+        upload_dir = self._upload_dir(UploadId)
+        with open(os.path.join(upload_dir, 'upload.json')) as f:
+            upload = json.load(f)
+        parts = [self._part_path(UploadId, part['PartNumber'])
+                 for part in MultipartUpload['Parts']]
+        etag = self._store(Bucket, Key, _ConcatenatedReader(parts),
+                           acl=upload['ACL'],
+                           content_type=upload['ContentType'],
+                           metadata=upload['Metadata'])
+        shutil.rmtree(upload_dir)
+        return dict(Bucket=Bucket, Key=Key, ETag=etag)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        shutil.rmtree(self._upload_dir(UploadId), ignore_errors=True)
+        return {}
+
+    def generate_presigned_post(self, Bucket, Key, Fields=None,
+                                Conditions=None, ExpiresIn=3600):
+        """
+        Produces a signed upload policy for one key, in the same shape
+        as the S3 presigned POST, i.e. the client posts the returned fields
+        and a `file` to the returned url. Exact match conditions, e.g.
+        ``{"Content-MD5": ...}``, are kept in the policy so that the
+        posted fields can be checked against them.
+        """
+        fields = dict(Fields or {})
+        conditions = {}
+        for condition in Conditions or []:
+            if isinstance(condition, dict):
+                conditions.update(condition)
+        policy = dict(method='post_object', bucket=Bucket, key=Key,
+                      acl=fields.get('acl', 'private'),
+                      conditions=conditions,
+                      expires=int(time.time()) + ExpiresIn)
+        encoded = base64.b64encode(json.dumps(policy).encode('utf-8'))
+        fields.update(key=Key, policy=encoded.decode('ascii'),
+                      signature=self.sign(encoded))
+        return dict(url=self.url, fields=fields)
+
+    def generate_presigned_url(self, ClientMethod, Params=None,
+                               ExpiresIn=3600, **kwargs):
+        """
+        Produces a signed URL to PUT a part of a multipart upload to, the
+        only presigned URL the BitStore hands out.
+        """
+        if ClientMethod != 'upload_part':
+            raise _error('InvalidRequest',
+                         'Can not presign {0}'.format(ClientMethod))
+        policy = dict(method=ClientMethod, bucket=Params['Bucket'],
+                      key=Params['Key'], upload_id=Params['UploadId'],
+                      part_number=Params['PartNumber'],
+                      expires=int(time.time()) + ExpiresIn)
+        encoded = base64.b64encode(json.dumps(policy).encode('utf-8'))
+        return '{url}/_parts?{query}'.format(
+            url=self.url, query=url_encode(dict(
+                policy=encoded.decode('ascii'),
+                signature=self.sign(encoded))))
+
+    def sign(self, value):
+        if not isinstance(value, bytes):
+            value = value.encode('utf-8')
+        return hmac.new(self.secret.encode('utf-8'), value,
+                        hashlib.sha256).hexdigest()
+
+    def verify_policy(self, policy, signature):
+        """
+        Checks a policy produced by :meth:`generate_presigned_post`.
+        :return: The decoded policy or None if it is forged or expired
+        """
+        if not hmac.compare_digest(str(self.sign(policy)),
+                                   str(signature or '')):
+            return None
+        decoded = json.loads(base64.b64decode(policy).decode('utf-8'))
+        if decoded['expires'] < time.time():
+            return None
+        return decoded
+
+
+class _BytesReader(object):
+    def __init__(self, data):
+        self._data = data
+        self._position = 0
+
+    def read(self, amt=-1):
+        end = len(self._data) if amt is None or amt < 0 \
+            else self._position + amt
+        chunk = self._data[self._position:end]
+        self._position += len(chunk)
+        return chunk
+
+
+class _ConcatenatedReader(object):
+    def __init__(self, paths):
+        self._paths = list(paths)
+        self._current = None
+
+    def read(self, amt=-1):
+        while True:
+            if self._current is None:
+                if not self._paths:
+                    return b''
+                self._current = open(self._paths.pop(0), 'rb')
+            chunk = self._current.read(amt)
+            if chunk:
+                return chunk
+            self._current.close()
+            self._current = None
+
+
+def _error(code, message):
+    return ClientError(dict(Error=dict(Code=code, Message=message)),
+                       'LocalStorage')
+
+
+def _makedirs(directory):
+    try:
+        os.makedirs(directory)
+    except OSError:
+        if not os.path.isdir(directory):
+            raise
+
+
+def _mtime(stat):
+    return datetime.datetime.utcfromtimestamp(stat.st_mtime)
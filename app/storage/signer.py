@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import base64
+import datetime
+import hashlib
+import hmac
+import json
+
+from botocore.client import BaseClient
+
+from app.utils.cache import LRUCache
+
+SIGV4_ALGORITHM = 'AWS4-HMAC-SHA256'
+SIGV4_TIMESTAMP = '%Y%m%dT%H%M%SZ'
+ISO8601 = '%Y-%m-%dT%H:%M:%SZ'
+
+# derived SigV4 signing keys by (secret, date, region, service). A key is
+# only valid for its date, so old entries are never used again and are
+# evicted as new dates come in
+signing_keys = LRUCache(maxsize=32)
+
+
+def _hmac(key, message):
+    return hmac.new(key, message.encode('utf-8'), hashlib.sha256).digest()
+
+
+def get_signing_key(secret_key, date, region, service='s3'):
+    """
+    Derives the SigV4 signing key of a day, which takes four chained
+    HMACs, or returns it from the cache.
+    :param date: Date of the request as YYYYMMDD
+    """
+    cache_key = (secret_key, date, region, service)
+    signing_key = signing_keys.get(cache_key)
+    if signing_key is None:
+        signing_key = _hmac(('AWS4' + secret_key).encode('utf-8'), date)
+        for part in (region, service, 'aws4_request'):
+            signing_key = _hmac(signing_key, part)
+        signing_keys.set(cache_key, signing_key)
+    return signing_key
+
+
+class PostSigner(object):
+    """
+    Signs presigned posts to one bucket, producing the same url and fields
+    as boto3's generate_presigned_post. The credential scope, expiration
+    and signing key are computed once, so signing every further key only
+    costs encoding its policy and a single HMAC.
+    """
+
+    def __init__(self, s3_client, bucket, expires_in=3600):
+        request_signer = s3_client._request_signer
+        credentials = request_signer._credentials.get_frozen_credentials()
+        now = datetime.datetime.utcnow()
+        date = now.strftime('%Y%m%d')
+
+        self.bucket = bucket
+        self.url = '{0}/{1}'.format(s3_client.meta.endpoint_url, bucket)
+        self.timestamp = now.strftime(SIGV4_TIMESTAMP)
+        self.expiration = (now + datetime.timedelta(seconds=expires_in))\
+            .strftime(ISO8601)
+        self.credential = '/'.join([credentials.access_key, date,
+                                    request_signer.region_name, 's3',
+                                    'aws4_request'])
+        self.token = credentials.token
+        self.signing_key = get_signing_key(credentials.secret_key, date,
+                                           request_signer.region_name)
+
+    def sign(self, key, fields=None, conditions=None):
+        """
+        :return: dict containing S3 url and post params
+        """
+        fields = dict(fields or {})
+        conditions = list(conditions or [])
+        conditions.append({'bucket': self.bucket})
+        conditions.append({'key': key})
+        fields['key'] = key
+
+        fields['x-amz-algorithm'] = SIGV4_ALGORITHM
+        fields['x-amz-credential'] = self.credential
+        fields['x-amz-date'] = self.timestamp
+        conditions.append({'x-amz-algorithm': SIGV4_ALGORITHM})
+        conditions.append({'x-amz-credential': self.credential})
+        conditions.append({'x-amz-date': self.timestamp})
+        if self.token is not None:
+            fields['x-amz-security-token'] = self.token
+            conditions.append({'x-amz-security-token': self.token})
+
+        policy = dict(expiration=self.expiration, conditions=conditions)
+        fields['policy'] = base64.b64encode(
+            json.dumps(policy).encode('utf-8')).decode('utf-8')
+        fields['x-amz-signature'] = hmac.new(
+            self.signing_key, fields['policy'].encode('utf-8'),
+            hashlib.sha256).hexdigest()
+        return dict(url=self.url, fields=fields)
+
+
+class ClientPostSigner(object):
+    """
+    Signs presigned posts with the storage client itself, for clients
+    PostSigner can not sign for, e.g. the local backend.
+    """
+
+    def __init__(self, s3_client, bucket, expires_in=3600):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.expires_in = expires_in
+
+    def sign(self, key, fields=None, conditions=None):
+        return self.s3_client.generate_presigned_post(
+            Bucket=self.bucket, Key=key, Fields=fields,
+            Conditions=conditions, ExpiresIn=self.expires_in)
+
+
+def create_post_signer(s3_client, bucket, expires_in=3600):
+    """
+    Creates the signer for presigned posts to the bucket, meant to be
+    reused for all files authorized in a request.
+    """
+    request_signer = getattr(s3_client, '_request_signer', None)
+    if isinstance(s3_client, BaseClient) \
+            and request_signer.signature_version == 's3v4' \
+            and request_signer._credentials is not None:
+        return PostSigner(s3_client, bucket, expires_in)
+    return ClientPostSigner(s3_client, bucket, expires_in)
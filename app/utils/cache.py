@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    Thread safe mapping holding at most `maxsize` entries and, if
+    `maxbytes` is given, values of at most that total length, as measured
+    by `sizeof`. When full, the least recently used entries are evicted.
+    Values longer than `maxbytes` are not stored. Keeps hit and miss
+    counters.
+    """
+
+    def __init__(self, maxsize=128, maxbytes=None, sizeof=len):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._pop(key)
+            if self.maxbytes is not None and \
+                    self.sizeof(value) > self.maxbytes:
+                return
+            self._data[key] = value
+            if self.maxbytes is not None:
+                self._bytes += self.sizeof(value)
+            while len(self._data) > self.maxsize or \
+                    (self.maxbytes is not None and
+                     self._bytes > self.maxbytes):
+                self._pop(next(iter(self._data)))
+
+    def delete(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+            self.hits = self.misses = 0
+
+    def _pop(self, key):
+        value = self._data.pop(key, None)
+        if value is not None and self.maxbytes is not None:
+            self._bytes -= self.sizeof(value)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ObjectCache(object):
+    """
+    Cache of S3 object bodies together with their ETag, keyed by bucket
+    and key. Entries live in an in-memory LRU, holding bodies of at most
+    `maxbytes` in total, and, if `directory` is given, in a second
+    on-disk tier which survives restarts and is shared by all workers of
+    the host. The disk tier is pruned to
+    `disk_maxsize` files, least recently used first.
+    Cached bodies are meant to be revalidated against S3 with the ETag,
+    the cache itself never decides that an entry is fresh.
+    """
+
+    def __init__(self, maxsize=256, max_object_size=1024 * 1024,
+                 maxbytes=32 * 1024 * 1024, directory=None,
+                 disk_maxsize=4096):
+        self.memory = LRUCache(maxsize, maxbytes=maxbytes,
+                               sizeof=_body_size)
+        self.max_object_size = max_object_size
+        self.directory = directory
+        self.disk_maxsize = disk_maxsize
+        self._disk_writes = 0
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def get(self, bucket, key):
+        """
+        :return: (etag, body) tuple or None if not cached
+        """
+        entry = self.memory.get((bucket, key))
+        if entry is None and self.directory:
+            entry = self._read_disk(bucket, key)
+            if entry is not None:
+                self.memory.set((bucket, key), entry)
+        return entry
+
+    def set(self, bucket, key, etag, body):
+        if not etag or len(body) > self.max_object_size:
+            self.delete(bucket, key)
+            return
+        self.memory.set((bucket, key), (etag, body))
+        if self.directory:
+            self._write_disk(bucket, key, etag, body)
+
+    def delete(self, bucket, key):
+        self.memory.delete((bucket, key))
+        if self.directory:
+            try:
+                os.remove(self._path(bucket, key))
+            except OSError:
+                pass
+
+    def _path(self, bucket, key):
+        name = hashlib.sha1('{0}/{1}'.format(bucket, key).encode('utf-8'))
+        return os.path.join(self.directory, name.hexdigest())
+
+    def _read_disk(self, bucket, key):
+        path = self._path(bucket, key)
+        try:
+            with open(path, 'rb') as f:
+                etag = f.readline().rstrip(b'\n').decode('utf-8')
+                body = f.read()
+            os.utime(path, None)
+        except (IOError, OSError):
+            return None
+        return etag, body
+
+    def _write_disk(self, bucket, key, etag, body):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(etag.encode('utf-8') + b'\n')
+            f.write(body)
+        os.rename(tmp_path, self._path(bucket, key))
+        self._disk_writes += 1
+        if self._disk_writes % max(1, self.disk_maxsize // 10) == 0:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        paths = [os.path.join(self.directory, name)
+                 for name in os.listdir(self.directory)]
+        if len(paths) <= self.disk_maxsize:
+            return
+        paths.sort(key=_mtime)
+        for path in paths[:len(paths) - self.disk_maxsize]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _body_size(entry):
+    etag, body = entry
+    return len(body)
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return 0
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import hashlib
+import json
+
+from markdown.extensions import codehilite, fenced_code
+from markdown.extensions.codehilite import CodeHilite, CodeHiliteExtension
+
+from app.utils.cache import LRUCache
+
+# blocks whose highlighted html is longer than this are not cached
+HIGHLIGHT_CACHE_MAX_BLOCK_SIZE = 64 * 1024
+
+# highlighted html of code blocks by a hash of their source and options.
+# READMEs often embed the same samples, e.g. the descriptor put in by
+# dp_in_readme, so it is shared by all renders of the process. It is
+# bounded by the total length of the html it holds
+highlight_cache = LRUCache(maxsize=512, maxbytes=8 * 1024 * 1024)
+
+
+class CachedCodeHilite(CodeHilite):
+    """
+    CodeHilite which looks the highlighted html up in highlight_cache
+    before running Pygments
+    """
+
+    def cache_key(self):
+        options = [self.src, self.lang, self.linenums, self.guess_lang,
+                   self.css_class, self.style, self.noclasses,
+                   self.tab_length, self.hl_lines, self.use_pygments]
+        return hashlib.sha1(json.dumps(options).encode('utf-8')).hexdigest()
+
+    def hilite(self):
+        key = self.cache_key()
+        html = highlight_cache.get(key)
+        if html is None:
+            html = super(CachedCodeHilite, self).hilite()
+            if len(html) <= HIGHLIGHT_CACHE_MAX_BLOCK_SIZE:
+                highlight_cache.set(key, html)
+        return html
+
+
+class CachedCodeHiliteExtension(CodeHiliteExtension):
+    """
+    The codehilite extension, caching highlighted code in highlight_cache.
+    Its tree processor and the fenced_code preprocessor create their
+    highlighter by the module level CodeHilite name, which is pointed to
+    CachedCodeHilite when the extension is used. The html is the same, so
+    other users of the extensions in the process only gain the cache.
+    """
+
+    def extendMarkdown(self, md, md_globals):
+        for module in (codehilite, fenced_code):
+            if getattr(module, 'CodeHilite', None) is CodeHilite:
+                module.CodeHilite = CachedCodeHilite
+        super(CachedCodeHiliteExtension, self).extendMarkdown(md, md_globals)
@@ -4,12 +4,20 @@ from __future__ import print_function
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+from BeautifulSoup import BeautifulSoup
+from flask import current_app as app, has_app_context
 from markdown import markdown
 from mdx_gfm import GithubFlavoredMarkdownExtension
 import bleach
 import re
 import json
 
+from app.utils.codehilite import CachedCodeHiliteExtension
+
+# Bump whenever text_to_markdown or render_readme change their output, so
+# that the READMEs rendered and stored at publish time are rendered again
+MARKDOWN_PIPELINE_VERSION = 1
+
 
 def text_to_markdown(text):
     """ This method takes any text and sanitizes it from unsafe html tags.
@@ -48,7 +56,7 @@ def text_to_markdown(text):
     }
     markdown_to_html = markdown(text,
                                 extensions=[GithubFlavoredMarkdownExtension(),
-                                            'codehilite'])
+                                            CachedCodeHiliteExtension()])
     sanitized_html = bleach.clean(markdown_to_html,
                                 tags=ALLOWED_TAGS,
                                 attributes=ALLOWED_ATTRIBUTES)
@@ -62,6 +70,8 @@ def dp_in_readme(readme, dp):
     be one of: datapackage.json, datapackage, dp.json, dp.
     """
     regex = "({{ ?)(datapackage(\.json)?|dp(\.json)?)( ?}})"
+    if '{{' not in readme or not re.search(regex, readme):
+        return readme
     dp_copy = dict(dp)
     if 'readme' in dp_copy:
         dp_copy.pop('readme')
@@ -70,3 +80,55 @@ def dp_in_readme(readme, dp):
     dp_as_md = '\n```json\n' + json.dumps(dp_copy, indent=2) + '\n```\n'
     readme_with_dp = re.sub(regex, dp_as_md, readme)
     return readme_with_dp
+
+
+def readme_summary(html):
+    """ This method takes rendered readme html and returns the text of its
+    first paragraph, used as the short description of a package.
+    """
+    return ''.join(BeautifulSoup(html).findAll(text=True)) \
+        .split('\n\n')[0].replace(' \n', '') \
+        .replace('\n', ' ').replace('/^ /', '')
+
+
+def render_readme(readme, dp, renderer=None):
+    """ This method takes a readme and data package descriptor as arguments
+    and returns a tuple of the readme html, with dp variables replaced, and
+    its short plain text summary.
+    """
+    return render_readmes([(readme, dp)], renderer=renderer)[0]
+
+
+def render_readmes(readmes, renderer=None):
+    """ This method takes a list of (readme, dp) tuples and
+    returns a list of (html, short summary) tuples like render_readme. All
+    markdown is rendered in one batch by `renderer`, by default the app's
+    MARKDOWN_RENDERER, so that it can be rendered in parallel.
+    """
+    if renderer is None and has_app_context():
+        renderer = app.config.get('MARKDOWN_RENDERER')
+
+    texts = []
+    for readme, dp in readmes:
+        readme = readme or ''
+        if not isinstance(dp, dict):
+            dp = {}
+        readme_with_dp = dp_in_readme(readme, dp)
+        texts.append(readme_with_dp)
+        # the summary is made of the readme as written, not of the
+        # descriptor embedded into it
+        texts.append(readme if readme_with_dp != readme else None)
+
+    to_render = [text for text in texts if text is not None]
+    if renderer is None:
+        rendered = [text_to_markdown(text) for text in to_render]
+    else:
+        rendered = renderer.render_many(to_render)
+    rendered = iter(rendered)
+    htmls = [next(rendered) if text is not None else None for text in texts]
+
+    result = []
+    for readme_html, short_html in zip(htmls[::2], htmls[1::2]):
+        result.append((readme_html,
+                       readme_summary(short_html or readme_html)))
+    return result
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import hashlib
+
+from flask import request, make_response
+from flask import current_app as app
+from werkzeug.urls import url_parse
+
+
+def make_etag(*stamps):
+    """
+    Builds a strong ETag from the version stamps of what a response is
+    made of, e.g. ids and update times of the rows it shows.
+    """
+    stamp = '|'.join('{0}'.format(s) for s in stamps)
+    return hashlib.md5(stamp.encode('utf-8')).hexdigest()
+
+
+def external_url(endpoint, **values):
+    """
+    Builds the absolute URL of an endpoint from the API_URL config. Unlike
+    url_for it does not depend on the current request, so URLs built by
+    background jobs and manager commands point to the API too.
+    """
+    api_url = url_parse(app.config['API_URL'])
+    adapter = app.url_map.bind(api_url.netloc,
+                               script_name=api_url.path or '/',
+                               url_scheme=api_url.scheme)
+    return adapter.build(endpoint, values, force_external=True)
+
+
+def is_not_modified(etag, last_modified=None):
+    """
+    Checks the conditional headers of the current request. If-None-Match
+    takes precedence over If-Modified-Since.
+    :param last_modified: naive UTC datetime
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        since = request.if_modified_since.replace(tzinfo=None)
+        # HTTP dates have no fractions of a second
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def conditional_response(etag, last_modified, build_response):
+    """
+    Answers with 304 Not Modified if the client has the current version,
+    otherwise with the response returned by `build_response`. The 304 is
+    decided before `build_response` is called, so nothing is serialized
+    for it. Both get the validators and Cache-Control set.
+    :param last_modified: naive UTC datetime or None to only use the ETag
+    :param build_response: function returning the full response
+    """
+    if is_not_modified(etag, last_modified):
+        response = app.response_class(status=304)
+    else:
+        response = make_response(build_response())
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = app.config['HTTP_CACHE_MAX_AGE']
+    return response
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import multiprocessing
+import os
+import threading
+
+from flask import current_app as app
+from markupsafe import escape
+
+from app.utils.helpers import text_to_markdown
+
+
+def escaped_text(text):
+    """
+    Fallback for text which can not be rendered: the text as is, escaped
+    """
+    return '<pre>{0}</pre>'.format(escape(text))
+
+
+class MarkdownRenderer(object):
+    """
+    Renders markdown with text_to_markdown, bounded in size and, with a
+    pool, in time. Texts longer than `max_size` characters, renders taking
+    longer than `timeout` seconds and renders failing are replaced by the
+    escaped text.
+    With `pool_size` 0 texts are rendered in the calling thread, which can
+    not be timed out. Otherwise they are rendered by a pool of processes,
+    started on first use in each process, so a pathological text only
+    ties up a pool worker. After a timeout the pool is replaced, the old
+    one is terminated once no thread renders with it any more.
+    """
+
+    def __init__(self, pool_size=0, max_size=512 * 1024, timeout=10):
+        self.pool_size = pool_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self._pool = None
+        self._pid = None
+        # number of render_many calls using each pool, a replaced pool
+        # is terminated once the last of them is done with it
+        self._users = {}
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self):
+        with self._lock:
+            return self._current_pool()
+
+    def _current_pool(self):
+        # a pool does not survive forks, e.g. of preloading gunicorn
+        # workers, so each process starts its own
+        if self._pool is None or self._pid != os.getpid():
+            if self._pid != os.getpid():
+                self._users = {}
+            self._pool = multiprocessing.Pool(self.pool_size)
+            self._pid = os.getpid()
+        return self._pool
+
+    def _acquire(self):
+        with self._lock:
+            pool = self._current_pool()
+            self._users[pool] = self._users.get(pool, 0) + 1
+            return pool
+
+    def _release(self, pool):
+        with self._lock:
+            users = self._users.pop(pool, 1) - 1
+            if users:
+                self._users[pool] = users
+            if users or pool is self._pool:
+                return
+        pool.terminate()
+
+    def render(self, text):
+        return self.render_many([text])[0]
+
+    def render_many(self, texts):
+        """
+        Renders the texts, in parallel with a pool
+        :return: list of html, in the order of texts
+        """
+        if not self.pool_size:
+            return [self._render_inline(text) for text in texts]
+
+        htmls = [escaped_text(text) if len(text) > self.max_size else None
+                 for text in texts]
+        pending = [i for i, html in enumerate(htmls) if html is None]
+        while pending:
+            pool = self._acquire()
+            try:
+                results = [pool.apply_async(text_to_markdown, (texts[i],))
+                           for i in pending]
+                # results are collected in the order the pool starts them,
+                # so each render has run for at least `timeout` when it
+                # times out
+                for n, (i, result) in enumerate(zip(pending, results)):
+                    try:
+                        htmls[i] = result.get(self.timeout)
+                    except multiprocessing.TimeoutError:
+                        app.logger.error('Rendering markdown of %s '
+                                         'characters timed out',
+                                         len(texts[i]))
+                        htmls[i] = escaped_text(texts[i])
+                        self._restart(pool)
+                        # renders queued behind the stuck one are started
+                        # over in the new pool
+                        pending = pending[n + 1:]
+                        break
+                    except Exception:
+                        app.logger.exception('Failed to render markdown')
+                        htmls[i] = escaped_text(texts[i])
+                else:
+                    pending = []
+            finally:
+                self._release(pool)
+        return htmls
+
+    def close(self):
+        with self._lock:
+            pools = set(self._users)
+            if self._pool is not None:
+                pools.add(self._pool)
+            if self._pid == os.getpid():
+                for pool in pools:
+                    pool.terminate()
+                    pool.join()
+            self._pool = None
+            self._users = {}
+
+    def _render_inline(self, text):
+        if len(text) > self.max_size:
+            return escaped_text(text)
+        try:
+            return text_to_markdown(text)
+        except Exception:
+            app.logger.exception('Failed to render markdown')
+            return escaped_text(text)
+
+    def _restart(self, pool):
+        # the worker stuck on the text can only be stopped by terminating
+        # the pool. New renders go to a new pool right away, the old one
+        # is terminated by _release once the renders of other threads
+        # using it are done
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
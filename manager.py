@@ -5,6 +5,8 @@ from __future__ import print_function
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+import multiprocessing
+
 from flask_script import Manager
 from flask_migrate import Migrate, MigrateCommand
 from flask import current_app, json
@@ -13,6 +15,11 @@ from dotenv import load_dotenv
 from app import create_app
 from app.bitstore import BitStore
 from app.database import db
+from app.jobs import queue
+from app.logic import serializers
+import app.logic as logic
+from app.utils.helpers import MARKDOWN_PIPELINE_VERSION
+from app.utils.rendering import MarkdownRenderer
 import app.models as models
 
 dot_env_path = join(dirname(__file__), '.env')
@@ -43,6 +50,79 @@ def dropdb():
     db.drop_all()
 
 
+@manager.option('--burst', dest='burst', action='store_true', default=False,
+                help='Exit once the queue is empty')
+def worker(burst=False):
+    """
+    Runs queued background jobs, e.g. package imports
+    """
+    queue.work(burst=burst)
+
+
+@manager.option('-p', '--processes', dest='processes', type=int,
+                default=multiprocessing.cpu_count(),
+                help='Processes rendering READMEs, all cores by default')
+def rerender_readmes(processes=multiprocessing.cpu_count()):
+    """
+    Renders again the stored READMEs rendered by an older markdown pipeline
+    """
+    stale = models.PackageTag.query.filter(db.or_(
+        models.PackageTag.readme_render_version.is_(None),
+        models.PackageTag.readme_render_version !=
+        MARKDOWN_PIPELINE_VERSION)).all()
+    renderer = MarkdownRenderer(pool_size=processes,
+                                max_size=current_app.config['MARKDOWN_MAX_SIZE'],
+                                timeout=current_app.config['MARKDOWN_TIMEOUT'])
+    try:
+        models.PackageTag.render_readmes(stale, renderer=renderer)
+    finally:
+        renderer.close()
+    for tag in stale:
+        if tag.tag == 'latest':
+            logic.Package.build_document(tag.package)
+    db.session.commit()
+    print('Rendered {0} READMEs'.format(len(stale)))
+
+
+@manager.option('-n', '--number', dest='number', type=int, default=1000,
+                help='Objects serialized per measurement')
+def benchmark_serializers(number=1000):
+    """
+    Prints the cost of serializing a package, publisher and user with a new
+    schema per object and with the compiled serializers
+    """
+    publisher = models.Publisher(name='core', title='Core',
+                                 contact_public=True, email='core@test.com')
+    user = models.User(name='core', full_name='Core', email='core@test.com')
+    package = models.Package(name='gold-prices', publisher=publisher)
+    package.latest_tag = models.PackageTag(
+        descriptor=json.loads(open('fixtures/datapackage.json').read()),
+        readme='# Gold prices')
+    package.latest_tag.render_readme()
+
+    for schema, obj in ((logic.PackageMetadataSchema, package),
+                        (logic.PublisherSchema, publisher),
+                        (logic.UserSchema, user)):
+        result = serializers.benchmark(schema, obj, number=number)
+        print('{0}: {1:.1f}us -> {2:.1f}us per object'.format(
+            schema.__name__, result['schema'] * 1e6,
+            result['compiled'] * 1e6))
+
+
+@manager.command
+def reindex_search():
+    """
+    Sets the full text search vectors of all active packages
+    """
+    packages = models.Package.query_with_latest_tag()\
+        .filter(models.Package.status == models.PackageStateEnum.active).all()
+    for package in packages:
+        if package.latest_tag is not None:
+            package.latest_tag.update_search_vector(package.publisher.name)
+    db.session.commit()
+    print('Indexed {0} packages'.format(len(packages)))
+
+
 @manager.command
 def populate():
     user_name, full_name, email = 'examples', 'Examples', 'examples@test.com'
@@ -7,9 +7,11 @@ from __future__ import unicode_literals
 import unittest
 import json
 
+import boto3
 from flask.ext.oauthlib.client import OAuthResponse
 from mock import patch
 from app import create_app
+from app.bitstore import BitStore
 from app.database import db
 from moto import mock_s3
 from app.profile.models import User, Publisher, PublisherUser, UserRoleEnum
@@ -294,6 +296,9 @@ class AuthorizeUploadTestCase(unittest.TestCase):
 
     @mock_s3
     def test_should_return_200_if_all_right(self):
+        with self.app.app_context():
+            s3 = boto3.client('s3')
+            s3.create_bucket(Bucket=self.app.config['S3_BUCKET_NAME'])
         auth = "%s" % self.jwt
         data = {
             'metadata': {
@@ -313,6 +318,113 @@ class AuthorizeUploadTestCase(unittest.TestCase):
                                     content_type='application/json')
         self.assertEqual(200, response.status_code)
 
+    @mock_s3
+    def test_should_save_upload_manifest(self):
+        with self.app.app_context():
+            s3 = boto3.client('s3')
+            s3.create_bucket(Bucket=self.app.config['S3_BUCKET_NAME'])
+        auth = "%s" % self.jwt
+        filedata = {
+            "README.md": {
+                "name": "README",
+                "md5": "12345y65uyhgfed23243y6"
+            }
+        }
+        data = {
+            'metadata': {
+                "owner": self.publisher,
+                "name": self.package
+            },
+            "filedata": filedata
+        }
+        response = self.client.post(self.url,
+                                    headers={'Auth-Token': auth},
+                                    data=json.dumps(data),
+                                    content_type='application/json')
+        self.assertEqual(200, response.status_code)
+        with self.app.app_context():
+            bit_store = BitStore(self.publisher, self.package)
+            manifest = bit_store.get_manifest()
+            filedata['README.md']['key'] = bit_store.build_s3_key('README.md')
+            self.assertEqual(filedata, manifest['files'])
+
+    @mock_s3
+    def test_should_mark_unchanged_files(self):
+        with self.app.app_context():
+            s3 = boto3.client('s3')
+            bucket_name = self.app.config['S3_BUCKET_NAME']
+            s3.create_bucket(Bucket=bucket_name)
+            bit_store = BitStore(self.publisher, self.package)
+            s3.put_object(Bucket=bucket_name,
+                          Key=bit_store.build_s3_key('data.csv'),
+                          Body='hello')
+        data = {
+            'metadata': {
+                "owner": self.publisher,
+                "name": self.package
+            },
+            "filedata": {
+                "data.csv": {
+                    "name": "data",
+                    "md5": "XUFAKrxLKna5cZ2REBfFkg=="
+                },
+                "datapackage.json": {
+                    "name": "datapackage.json",
+                    "md5": "CY9rzUYh03PK3k6DJie09g=="
+                }
+            }
+        }
+        response = self.client.post(self.url,
+                                    headers={'Auth-Token': self.jwt},
+                                    data=json.dumps(data),
+                                    content_type='application/json')
+        self.assertEqual(200, response.status_code)
+        filedata = json.loads(response.data)['filedata']
+        self.assertTrue(filedata['data.csv']['unchanged'])
+        self.assertNotIn('upload_url', filedata['data.csv'])
+        self.assertNotIn('unchanged', filedata['datapackage.json'])
+        self.assertIn('upload_url', filedata['datapackage.json'])
+
+    @mock_s3
+    def test_should_abort_multipart_upload(self):
+        with self.app.app_context():
+            s3 = boto3.client('s3')
+            s3.create_bucket(Bucket=self.app.config['S3_BUCKET_NAME'])
+            upload = BitStore(self.publisher, self.package).\
+                create_multipart_upload('data/big.csv', 10)
+        data = {
+            'metadata': {
+                "owner": self.publisher,
+                "name": self.package
+            },
+            'path': 'data/big.csv',
+            'upload_id': upload['upload_id']
+        }
+        response = self.client.post('/api/datastore/multipart/abort',
+                                    headers={'Auth-Token': self.jwt},
+                                    data=json.dumps(data),
+                                    content_type='application/json')
+        self.assertEqual(200, response.status_code)
+        with self.app.app_context():
+            uploads = s3.list_multipart_uploads(
+                Bucket=self.app.config['S3_BUCKET_NAME'])
+            self.assertFalse(uploads.get('Uploads'))
+
+    @mock_s3
+    def test_should_return_400_if_multipart_upload_not_given(self):
+        data = {
+            'metadata': {
+                "owner": self.publisher,
+                "name": self.package
+            },
+            'path': 'data/big.csv'
+        }
+        response = self.client.post('/api/datastore/multipart/complete',
+                                    headers={'Auth-Token': self.jwt},
+                                    data=json.dumps(data),
+                                    content_type='application/json')
+        self.assertEqual(400, response.status_code)
+
     @mock_s3
     def test_should_return_500_if_data_not_present(self):
         auth = "%s" % self.jwt
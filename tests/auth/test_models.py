@@ -4,10 +4,12 @@ from __future__ import print_function
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+import boto3
 import unittest
 from app import create_app
 from moto import mock_s3
 from app.auth.jwt import FileData
+from app.utils import InvalidUsage
 
 
 class FileDataTestCase(unittest.TestCase):
@@ -33,4 +35,68 @@ class FileDataTestCase(unittest.TestCase):
                                         'type': 'json',
                                         'name': 'readme.md'})
             response = file_data.build_file_information()
-            self.assertIsNotNone(response['upload_url'])
\ No newline at end of file
+            self.assertIsNotNone(response['upload_url'])
+
+    def test_should_not_return_upload_url_if_unchanged(self):
+        with self.app.app_context():
+            file_data = FileData(package_name='abc',
+                                 publisher='pub',
+                                 relative_path="data/readme.md",
+                                 props={'md5': 'as131twfc56t7',
+                                        'type': 'json',
+                                        'name': 'readme.md'},
+                                 unchanged=True)
+            response = file_data.build_file_information()
+            self.assertTrue(response['unchanged'])
+            self.assertNotIn('upload_url', response)
+
+    @mock_s3
+    def test_should_return_multipart_upload_for_big_files(self):
+        with self.app.app_context():
+            s3 = boto3.client('s3')
+            s3.create_bucket(Bucket=self.app.config['S3_BUCKET_NAME'])
+            size = self.app.config['BITSTORE_MULTIPART_UPLOAD_THRESHOLD'] + 1
+            file_data = FileData(package_name='abc',
+                                 publisher='pub',
+                                 relative_path="data/big.csv",
+                                 props={'md5': 'as131twfc56t7',
+                                        'name': 'big.csv',
+                                        'size': size})
+            response = file_data.build_file_information()
+            self.assertNotIn('upload_url', response)
+            self.assertTrue(response['multipart']['upload_id'])
+            self.assertTrue(response['multipart']['parts'])
+
+    def test_should_reject_invalid_size(self):
+        with self.app.app_context():
+            with self.assertRaises(InvalidUsage) as context:
+                FileData(package_name='abc',
+                         publisher='pub',
+                         relative_path="data/big.csv",
+                         props={'md5': 'as131twfc56t7',
+                                'name': 'big.csv',
+                                'size': 'big'})
+            self.assertEqual(400, context.exception.status_code)
+
+    def test_should_reject_paths_out_of_the_package(self):
+        with self.app.app_context():
+            for path in ('../../victim/pkg/_v/latest/datapackage.json',
+                         '/data/big.csv', 'data//big.csv', 'data/./big.csv'):
+                with self.assertRaises(InvalidUsage) as context:
+                    FileData(package_name='abc',
+                             publisher='pub',
+                             relative_path=path,
+                             props={'md5': 'as131twfc56t7',
+                                    'name': 'big.csv'})
+                self.assertEqual(400, context.exception.status_code)
+
+    def test_should_reject_acl_other_than_public_read(self):
+        with self.app.app_context():
+            with self.assertRaises(InvalidUsage) as context:
+                FileData(package_name='abc',
+                         publisher='pub',
+                         relative_path="data/big.csv",
+                         props={'md5': 'as131twfc56t7',
+                                'name': 'big.csv',
+                                'acl': 'public-read-write'})
+            self.assertEqual(400, context.exception.status_code)
\ No newline at end of file
@@ -7,7 +7,9 @@ from __future__ import unicode_literals
 import boto3
 import unittest
 
-from urlparse import urlparse
+from urlparse import urlparse, parse_qs
+from botocore.exceptions import ClientError
+from mock import MagicMock, patch
 from moto import mock_s3
 from app import create_app
 from app.bitstore import BitStore 
@@ -147,7 +149,7 @@ class BitStoreTestCase(unittest.TestCase):
             s3.create_bucket(Bucket=bucket_name)
             read_me_key = bit_store.build_s3_key('test.md')
             s3.put_object(Bucket=bucket_name, Key=read_me_key, Body='')
-            self.assertEqual(bit_store.get_readme_object_key(), 'None')
+            self.assertIsNone(bit_store.get_readme_object_key())
 
     @mock_s3
     def test_return_none_if_object_found(self):
@@ -270,3 +272,444 @@ class BitStoreTestCase(unittest.TestCase):
                                           .build_s3_versioned_prefix())
             self.assertEqual(len(objects_nu['Contents']),
                              len(objects_old['Contents']))
+
+    def test_iter_objects_follows_continuation_tokens(self):
+        with self.app.app_context():
+            s3_client = MagicMock()
+            s3_client.list_objects_v2.side_effect = [
+                {'Contents': [{'Key': 'a'}, {'Key': 'b'}],
+                 'IsTruncated': True,
+                 'NextContinuationToken': 'token'},
+                {'Contents': [{'Key': 'c'}],
+                 'IsTruncated': False}
+            ]
+            self.app.config['S3'] = s3_client
+            bit_store = BitStore('test_pub', 'test_package')
+            keys = [ob['Key'] for ob in bit_store.iter_objects('prefix')]
+            self.assertEqual(['a', 'b', 'c'], keys)
+            self.assertEqual(2, s3_client.list_objects_v2.call_count)
+            _, kwargs = s3_client.list_objects_v2.call_args
+            self.assertEqual('token', kwargs['ContinuationToken'])
+
+    def test_delete_data_package_reports_failed_keys(self):
+        with self.app.app_context():
+            s3_client = MagicMock()
+            s3_client.list_objects_v2.return_value = {
+                'Contents': [{'Key': 'a'}, {'Key': 'b'}],
+                'IsTruncated': False}
+            s3_client.delete_objects.return_value = {
+                'Errors': [{'Key': 'b', 'Code': 'AccessDenied',
+                            'Message': 'Access Denied'}]}
+            self.app.config['S3'] = s3_client
+            bit_store = BitStore('test_pub', 'test_package')
+            result = bit_store.delete_data_package()
+            self.assertFalse(result)
+            self.assertEqual(1, result.succeeded)
+            self.assertEqual({'b': 'Access Denied'}, result.failed)
+
+    @mock_s3
+    def test_delete_data_package_in_batches(self):
+        with self.app.app_context():
+            bit_store = BitStore('test_pub', 'test_package')
+            s3 = boto3.client('s3')
+            bucket_name = self.app.config['S3_BUCKET_NAME']
+            s3.create_bucket(Bucket=bucket_name)
+            for i in range(1500):
+                s3.put_object(Bucket=bucket_name,
+                              Key=bit_store.build_s3_key('data/%d.csv' % i),
+                              Body='data')
+            result = bit_store.delete_data_package()
+            self.assertTrue(result)
+            self.assertEqual(1500, result.succeeded)
+            res = s3.list_objects(Bucket=bucket_name,
+                                  Prefix=bit_store.build_s3_base_prefix())
+            self.assertTrue('Contents' not in res)
+
+    def test_change_acl_retries_transient_errors(self):
+        with self.app.app_context():
+            s3_client = MagicMock()
+            s3_client.list_objects_v2.return_value = {
+                'Contents': [{'Key': 'a'}, {'Key': 'b'}],
+                'IsTruncated': False}
+            slow_down = ClientError({'Error': {'Code': 'SlowDown'}},
+                                    'PutObjectAcl')
+            denied = ClientError({'Error': {'Code': 'AccessDenied'}},
+                                 'PutObjectAcl')
+
+            def put_object_acl(Bucket, Key, ACL):
+                if Key == 'b':
+                    raise denied
+                if s3_client.put_object_acl.call_count < 3:
+                    raise slow_down
+
+            s3_client.put_object_acl.side_effect = put_object_acl
+            self.app.config['S3'] = s3_client
+            self.app.config['BITSTORE_RETRY_BACKOFF'] = 0
+            bit_store = BitStore('test_pub', 'test_package')
+            result = bit_store.change_acl('private', workers=1)
+            self.assertFalse(result)
+            self.assertEqual(1, result.succeeded)
+            self.assertEqual(['b'], list(result.failed))
+
+    def test_copy_to_new_version_uses_multipart_copy_for_large_objects(self):
+        with self.app.app_context():
+            bit_store = BitStore('test_pub', 'test_package')
+            large_key = bit_store.build_s3_key('large.csv')
+            small_key = bit_store.build_s3_key('small.csv')
+            s3_client = MagicMock()
+            s3_client.list_objects_v2.return_value = {
+                'Contents': [{'Key': large_key, 'Size': 25},
+                             {'Key': small_key, 'Size': 5}],
+                'IsTruncated': False}
+            s3_client.get_object.side_effect = ClientError(
+                {'Error': {'Code': 'NoSuchKey'}}, 'GetObject')
+            s3_client.head_object.return_value = {'ContentType': 'text/csv'}
+            s3_client.create_multipart_upload.return_value = {'UploadId': 'id'}
+            s3_client.upload_part_copy.side_effect = lambda **kw: {
+                'CopyPartResult': {'ETag': kw['CopySourceRange']}}
+            self.app.config['S3'] = s3_client
+            self.app.config['BITSTORE_MULTIPART_THRESHOLD'] = 10
+            self.app.config['BITSTORE_MULTIPART_PART_SIZE'] = 10
+
+            result = bit_store.copy_to_new_version('0.8')
+
+            self.assertTrue(result)
+            self.assertEqual(2, result.succeeded)
+            _, kwargs = s3_client.copy_object.call_args
+            self.assertEqual(small_key.replace('latest', '0.8'), kwargs['Key'])
+            _, kwargs = s3_client.complete_multipart_upload.call_args
+            self.assertEqual(large_key.replace('latest', '0.8'), kwargs['Key'])
+            self.assertEqual([
+                {'PartNumber': 1, 'ETag': 'bytes=0-9'},
+                {'PartNumber': 2, 'ETag': 'bytes=10-19'},
+                {'PartNumber': 3, 'ETag': 'bytes=20-24'}
+            ], kwargs['MultipartUpload']['Parts'])
+            self.assertFalse(s3_client.abort_multipart_upload.called)
+
+    def test_multipart_copy_respects_part_limit(self):
+        s3_client = MagicMock()
+        s3_client.head_object.return_value = {}
+        s3_client.create_multipart_upload.return_value = {'UploadId': 'id'}
+        s3_client.upload_part_copy.return_value = {
+            'CopyPartResult': {'ETag': '"etag"'}}
+        size = 20000 * 10 + 1
+        BitStore._multipart_copy(s3_client, 'bucket', 'source', 'key', size,
+                                 10, 1, 0, 0)
+        _, kwargs = s3_client.complete_multipart_upload.call_args
+        self.assertLessEqual(len(kwargs['MultipartUpload']['Parts']), 10000)
+        _, kwargs = s3_client.upload_part_copy.call_args
+        self.assertTrue(kwargs['CopySourceRange'].endswith('-200000'))
+
+    def test_get_s3_object_revalidates_cached_body(self):
+        with self.app.app_context():
+            s3_client = MagicMock()
+            body = MagicMock()
+            body.read.return_value = 'body'
+            s3_client.get_object.side_effect = [
+                {'Body': body, 'ETag': '"etag"'},
+                ClientError({'Error': {'Code': '304'}}, 'GetObject')
+            ]
+            self.app.config['S3'] = s3_client
+            bit_store = BitStore('test_pub', 'test_package')
+            key = bit_store.build_s3_key('datapackage.json')
+            self.assertEqual('body', bit_store.get_s3_object(key))
+            self.assertEqual('body', bit_store.get_s3_object(key))
+            _, kwargs = s3_client.get_object.call_args
+            self.assertEqual('"etag"', kwargs['IfNoneMatch'])
+
+    @mock_s3
+    def test_get_readme_object_key_from_manifest(self):
+        with self.app.app_context():
+            bit_store = BitStore('test_pub', 'test_package')
+            s3 = boto3.client('s3')
+            bucket_name = self.app.config['S3_BUCKET_NAME']
+            s3.create_bucket(Bucket=bucket_name)
+            bit_store.save_manifest({
+                'data/readme.txt': {'name': 'readme', 'md5': 'a'},
+                'README.md': {'name': 'README', 'md5': 'b'},
+                'datapackage.json': {'name': 'datapackage', 'md5': 'c'}
+            })
+            with patch.object(BitStore, 'iter_objects') as iter_objects:
+                self.assertEqual(bit_store.build_s3_key('README.md'),
+                                 bit_store.get_readme_object_key())
+                self.assertFalse(iter_objects.called)
+
+    @mock_s3
+    def test_get_readme_object_key_returns_none_if_not_in_manifest(self):
+        with self.app.app_context():
+            bit_store = BitStore('test_pub', 'test_package')
+            s3 = boto3.client('s3')
+            bucket_name = self.app.config['S3_BUCKET_NAME']
+            s3.create_bucket(Bucket=bucket_name)
+            bit_store.save_manifest({
+                'datapackage.json': {'name': 'datapackage', 'md5': 'c'}
+            })
+            self.assertIsNone(bit_store.get_readme_object_key())
+
+    @mock_s3
+    def test_save_manifest_keeps_files_not_authorized_again(self):
+        with self.app.app_context():
+            bit_store = BitStore('test_pub', 'test_package')
+            s3 = boto3.client('s3')
+            bucket_name = self.app.config['S3_BUCKET_NAME']
+            s3.create_bucket(Bucket=bucket_name)
+            bit_store.save_manifest({
+                'README.md': {'name': 'README', 'md5': 'b'},
+                'datapackage.json': {'name': 'datapackage', 'md5': 'c'}
+            })
+            bit_store.save_manifest({
+                'datapackage.json': {'name': 'datapackage', 'md5': 'd'}
+            })
+            files = bit_store.get_manifest()['files']
+            self.assertEqual(set(['README.md', 'datapackage.json']),
+                             set(files))
+            self.assertEqual('d', files['datapackage.json']['md5'])
+
+    def test_change_acl_skips_manifest(self):
+        with self.app.app_context():
+            s3_client = MagicMock()
+            self.app.config['S3'] = s3_client
+            bit_store = BitStore('test_pub', 'test_package')
+            s3_client.list_objects_v2.return_value = {'Contents': [
+                {'Key': bit_store.build_s3_key('datapackage.json')},
+                {'Key': bit_store.build_s3_manifest_key()}]}
+
+            self.assertTrue(bit_store.change_acl('public-read'))
+
+            keys = [kwargs['Key'] for _, kwargs in
+                    s3_client.put_object_acl.call_args_list]
+            self.assertEqual([bit_store.build_s3_key('datapackage.json')],
+                             keys)
+
+    def test_change_acl_of_manifest_keys_without_listing(self):
+        with self.app.app_context():
+            s3_client = MagicMock()
+            s3_client.put_object_acl.side_effect = [
+                {}, ClientError({'Error': {'Code': 'NoSuchKey'}},
+                                'PutObjectAcl')]
+            self.app.config['S3'] = s3_client
+            bit_store = BitStore('test_pub', 'test_package')
+            with patch('app.bitstore.BitStore.get_manifest') as get_manifest:
+                get_manifest.return_value = {'files': {
+                    'datapackage.json': {'key': 'metadata/dp'},
+                    'data.csv': {'md5': 'x'}}}
+                keys = bit_store.get_manifest_keys()
+            self.assertEqual(sorted(['metadata/dp',
+                                     bit_store.build_s3_key('data.csv')]),
+                             keys)
+
+            # a file authorized but never uploaded is not a failure
+            self.assertTrue(bit_store.change_acl('public-read', workers=1,
+                                                 keys=keys))
+            self.assertFalse(s3_client.list_objects_v2.called)
+
+    def test_md5_to_hex(self):
+        self.assertEqual('5d41402abc4b2a76b9719d911017c592',
+                         BitStore.md5_to_hex('XUFAKrxLKna5cZ2REBfFkg=='))
+        self.assertEqual('5d41402abc4b2a76b9719d911017c592',
+                         BitStore.md5_to_hex('5D41402ABC4B2A76B9719D911017C592'))
+        self.assertIsNone(BitStore.md5_to_hex('not an md5'))
+        self.assertIsNone(BitStore.md5_to_hex(''))
+        self.assertIsNone(BitStore.md5_to_hex(None))
+
+    def test_extract_information_from_blob_url(self):
+        with self.app.app_context():
+            bit_store = BitStore('pub_test', 'test_package')
+            key = bit_store.build_s3_blob_key('5d41402abc4b2a76b9719d911017c592')
+            self.assertEqual(('pub_test', 'test_package', 'latest'),
+                             BitStore.extract_information_from_s3_url(key))
+
+    @mock_s3
+    def test_content_addressed_upload_goes_to_blob(self):
+        with self.app.app_context():
+            self.app.config['BITSTORE_CONTENT_ADDRESSED'] = True
+            bit_store = BitStore('test_pub', 'test_package')
+            post = bit_store.generate_pre_signed_post_object(
+                'data/file.csv', 'XUFAKrxLKna5cZ2REBfFkg==')
+            self.assertEqual(
+                bit_store.build_s3_blob_key('5d41402abc4b2a76b9719d911017c592'),
+                post['fields']['key'])
+
+    @mock_s3
+    def test_content_addressed_reads_resolve_through_manifest(self):
+        with self.app.app_context():
+            self.app.config['BITSTORE_CONTENT_ADDRESSED'] = True
+            s3 = boto3.client('s3')
+            bucket_name = self.app.config['S3_BUCKET_NAME']
+            s3.create_bucket(Bucket=bucket_name)
+            bit_store = BitStore('test_pub', 'test_package')
+            blob_key = bit_store.build_s3_blob_key(
+                '5d41402abc4b2a76b9719d911017c592')
+            s3.put_object(Bucket=bucket_name, Key=blob_key, Body='hello')
+            bit_store.save_manifest({
+                'datapackage.json': {'name': 'datapackage',
+                                     'md5': 'XUFAKrxLKna5cZ2REBfFkg=='},
+                'README.md': {'name': 'README',
+                              'md5': 'XUFAKrxLKna5cZ2REBfFkg=='}
+            })
+            self.assertEqual(blob_key, bit_store.resolve_key('datapackage.json'))
+            self.assertEqual(blob_key, bit_store.get_readme_object_key())
+            self.assertEqual('hello', bit_store.get_metadata_body())
+            self.assertEqual(bit_store.build_s3_key('missing.csv'),
+                             bit_store.resolve_key('missing.csv'))
+
+    @mock_s3
+    def test_content_addressed_tag_copies_only_the_manifest(self):
+        with self.app.app_context():
+            self.app.config['BITSTORE_CONTENT_ADDRESSED'] = True
+            s3 = boto3.client('s3')
+            bucket_name = self.app.config['S3_BUCKET_NAME']
+            s3.create_bucket(Bucket=bucket_name)
+            bit_store = BitStore('test_pub', 'test_package')
+            blob_key = bit_store.build_s3_blob_key(
+                '5d41402abc4b2a76b9719d911017c592')
+            s3.put_object(Bucket=bucket_name, Key=blob_key, Body='hello')
+            bit_store.save_manifest({
+                'datapackage.json': {'name': 'datapackage',
+                                     'md5': 'XUFAKrxLKna5cZ2REBfFkg=='}
+            })
+
+            result = bit_store.copy_to_new_version('0.1')
+
+            self.assertTrue(result)
+            self.assertEqual(0, result.succeeded)
+            tagged = BitStore('test_pub', 'test_package', version='0.1')
+            self.assertEqual(blob_key, tagged.resolve_key('datapackage.json'))
+            self.assertEqual('hello', tagged.get_metadata_body())
+            keys = [ob['Key'] for ob in
+                    bit_store.iter_objects(bit_store.build_s3_base_prefix())]
+            self.assertEqual(3, len(keys))
+
+    @mock_s3
+    def test_get_unchanged_paths(self):
+        with self.app.app_context():
+            s3 = boto3.client('s3')
+            bucket_name = self.app.config['S3_BUCKET_NAME']
+            s3.create_bucket(Bucket=bucket_name)
+            bit_store = BitStore('test_pub', 'test_package')
+            s3.put_object(Bucket=bucket_name,
+                          Key=bit_store.build_s3_key('data.csv'), Body='hello')
+            s3.put_object(Bucket=bucket_name,
+                          Key=bit_store.build_s3_key('changed.csv'), Body='old')
+            unchanged = bit_store.get_unchanged_paths({
+                'data.csv': {'name': 'data', 'md5': 'XUFAKrxLKna5cZ2REBfFkg=='},
+                'changed.csv': {'name': 'changed',
+                                'md5': 'XUFAKrxLKna5cZ2REBfFkg=='},
+                'new.csv': {'name': 'new', 'md5': 'XUFAKrxLKna5cZ2REBfFkg=='},
+                'invalid.csv': {'name': 'invalid', 'md5': 'invalid'}
+            })
+            self.assertEqual(set(['data.csv']), unchanged)
+
+    @mock_s3
+    def test_get_unchanged_paths_content_addressed(self):
+        with self.app.app_context():
+            self.app.config['BITSTORE_CONTENT_ADDRESSED'] = True
+            s3 = boto3.client('s3')
+            bucket_name = self.app.config['S3_BUCKET_NAME']
+            s3.create_bucket(Bucket=bucket_name)
+            bit_store = BitStore('test_pub', 'test_package')
+            s3.put_object(Bucket=bucket_name,
+                          Key=bit_store.build_s3_blob_key(
+                              '5d41402abc4b2a76b9719d911017c592'),
+                          Body='hello')
+            unchanged = bit_store.get_unchanged_paths({
+                'renamed.csv': {'name': 'renamed',
+                                'md5': 'XUFAKrxLKna5cZ2REBfFkg=='},
+                'new.csv': {'name': 'new', 'md5': 'CY9rzUYh03PK3k6DJie09g=='}
+            })
+            self.assertEqual(set(['renamed.csv']), unchanged)
+
+    def test_get_unchanged_paths_of_multipart_uploads(self):
+        with self.app.app_context():
+            md5 = 'XUFAKrxLKna5cZ2REBfFkg=='
+            md5_hex = '5d41402abc4b2a76b9719d911017c592'
+            s3_client = MagicMock()
+            s3_client.complete_multipart_upload.return_value = {
+                'ETag': '"abc-2"'}
+            s3_client.head_object.return_value = {'ContentLength': 10}
+            self.app.config['S3'] = s3_client
+            bit_store = BitStore('test_pub', 'test_package')
+            manifest = {'files': {'big.csv': {
+                'name': 'big', 'md5': md5, 'size': 10, 'upload_id': 'id',
+                'key': bit_store.build_s3_key('big.csv')}}}
+            with patch('app.bitstore.BitStore.get_manifest',
+                       return_value=manifest), \
+                    patch('app.bitstore.BitStore.save_manifest_body'):
+                bit_store.complete_multipart_upload('big.csv', 'id', [
+                    {'PartNumber': 1, 'ETag': '"a"'},
+                    {'PartNumber': 2, 'ETag': '"b"'}])
+            self.assertEqual(dict(etag='abc-2', md5=md5_hex, size=10),
+                             manifest['files']['big.csv']['uploaded'])
+
+            s3_client.list_objects_v2.return_value = {
+                'Contents': [{'Key': bit_store.build_s3_key('big.csv'),
+                              'ETag': '"abc-2"', 'Size': 10}],
+                'IsTruncated': False}
+            with patch('app.bitstore.BitStore.get_manifest',
+                       return_value=manifest):
+                self.assertEqual(set(['big.csv']),
+                                 bit_store.get_unchanged_paths({'big.csv': {
+                                     'name': 'big', 'md5': md5, 'size': 10}}))
+                changed = {'name': 'big', 'md5': 'CY9rzUYh03PK3k6DJie09g==',
+                           'size': 10}
+                self.assertEqual(set(), bit_store.get_unchanged_paths(
+                    {'big.csv': changed}))
+
+    def test_get_unchanged_paths_does_not_list_without_md5s(self):
+        with self.app.app_context():
+            bit_store = BitStore('test_pub', 'test_package')
+            with patch.object(BitStore, 'iter_objects') as iter_objects:
+                self.assertEqual(set(), bit_store.get_unchanged_paths(
+                    {'data.csv': {'name': 'data', 'md5': 'invalid'}}))
+                self.assertFalse(iter_objects.called)
+
+    @mock_s3
+    def test_create_multipart_upload(self):
+        with self.app.app_context():
+            s3 = boto3.client('s3')
+            bucket_name = self.app.config['S3_BUCKET_NAME']
+            s3.create_bucket(Bucket=bucket_name)
+            self.app.config['BITSTORE_MULTIPART_UPLOAD_PART_SIZE'] = \
+                64 * 1024 * 1024
+            bit_store = BitStore('test_pub', 'test_package')
+            upload = bit_store.create_multipart_upload('data/big.csv',
+                                                       150 * 1024 * 1024)
+            self.assertEqual(bit_store.build_s3_key('data/big.csv'),
+                             upload['key'])
+            self.assertEqual(64 * 1024 * 1024, upload['part_size'])
+            self.assertEqual([1, 2, 3], [part['part_number']
+                                         for part in upload['parts']])
+            query = parse_qs(urlparse(upload['parts'][1]['url']).query)
+            self.assertEqual(['2'], query['partNumber'])
+            self.assertEqual([upload['upload_id']], query['uploadId'])
+
+    def test_create_multipart_upload_respects_part_limit(self):
+        with self.app.app_context():
+            s3_client = MagicMock()
+            s3_client.create_multipart_upload.return_value = {'UploadId': 'id'}
+            s3_client.list_multipart_uploads.return_value = {}
+            self.app.config['S3'] = s3_client
+            self.app.config['BITSTORE_MULTIPART_UPLOAD_PART_SIZE'] = 1
+            bit_store = BitStore('test_pub', 'test_package')
+            size = 20000 * 5 * 1024 * 1024 + 1
+            with patch('app.bitstore.BitStore.get_manifest',
+                       return_value=None):
+                upload = bit_store.create_multipart_upload('big.csv', size)
+            self.assertEqual(10000, len(upload['parts']))
+            self.assertGreaterEqual(upload['part_size'] * 10000, size)
+
+    def test_complete_multipart_upload_sorts_parts(self):
+        with self.app.app_context():
+            s3_client = MagicMock()
+            self.app.config['S3'] = s3_client
+            bit_store = BitStore('test_pub', 'test_package')
+            with patch('app.bitstore.BitStore.get_manifest',
+                       return_value=None):
+                bit_store.complete_multipart_upload('big.csv', 'id', [
+                    {'PartNumber': '2', 'ETag': '"b"'},
+                    {'PartNumber': 1, 'ETag': '"a"'}])
+            _, kwargs = s3_client.complete_multipart_upload.call_args
+            self.assertEqual(bit_store.build_s3_key('big.csv'), kwargs['Key'])
+            self.assertEqual([{'PartNumber': 1, 'ETag': '"a"'},
+                              {'PartNumber': 2, 'ETag': '"b"'}],
+                             kwargs['MultipartUpload']['Parts'])
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import json
+import unittest
+
+from app import create_app
+from app.database import db
+from app.jobs.models import Job, JobStateEnum
+from app.profile.models import User
+
+
+class GetJobStatusTestCase(unittest.TestCase):
+    jwt_url = '/api/auth/token'
+
+    def setUp(self):
+        self.app = create_app()
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.drop_all()
+            db.create_all()
+            user = User(id=1, name='owner', secret='super_secret',
+                        email='owner@test.com')
+            other = User(id=2, name='other', secret='super_secret',
+                         email='other@test.com')
+            job = Job(name='package.import', user_id=1,
+                      status=JobStateEnum.failed, attempts=3,
+                      error='Traceback ...\nValueError: broken\n')
+            db.session.add_all([user, other, job])
+            db.session.commit()
+            self.job_id = job.id
+        self.jwt = self.get_token('owner')
+
+    def get_token(self, name):
+        response = self.client.post(self.jwt_url,
+                                    data=json.dumps({
+                                        'username': name,
+                                        'secret': 'super_secret'
+                                    }),
+                                    content_type='application/json')
+        return json.loads(response.data)['token']
+
+    def test_returns_job_status(self):
+        response = self.client.get('/api/jobs/%s' % self.job_id,
+                                   headers={'Auth-Token': self.jwt})
+        self.assertEqual(200, response.status_code)
+        data = json.loads(response.data)
+        self.assertEqual('failed', data['status'])
+        self.assertEqual(3, data['attempts'])
+        self.assertEqual('ValueError: broken', data['error'])
+
+    def test_throw_404_for_job_of_other_user(self):
+        response = self.client.get('/api/jobs/%s' % self.job_id,
+                                   headers={'Auth-Token':
+                                            self.get_token('other')})
+        self.assertEqual(404, response.status_code)
+
+    def test_throw_401_without_token(self):
+        response = self.client.get('/api/jobs/%s' % self.job_id)
+        self.assertEqual(401, response.status_code)
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+            db.engine.dispose()
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import datetime
+import time
+import unittest
+
+from mock import MagicMock
+from app import create_app
+from app.database import db
+from app.jobs import queue
+from app.jobs.models import Job, JobStateEnum
+
+
+class QueueTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.app_context().push()
+        self.app.config['JOB_QUEUE_EAGER'] = False
+        self.app.config['JOB_MAX_ATTEMPTS'] = 2
+        self.task = MagicMock(return_value=dict(ok=True))
+        queue.tasks['test.task'] = self.task
+        db.drop_all()
+        db.create_all()
+
+    def test_enqueue_stores_queued_job(self):
+        job = queue.enqueue('test.task', user_id=None, value=1)
+        job = Job.query.get(job.id)
+        self.assertEqual(JobStateEnum.queued, job.status)
+        self.assertEqual(dict(value=1), job.payload)
+        self.assertFalse(self.task.called)
+
+    def test_enqueue_unknown_task_raises(self):
+        with self.assertRaises(KeyError):
+            queue.enqueue('unknown.task')
+
+    def test_eager_enqueue_runs_job(self):
+        self.app.config['JOB_QUEUE_EAGER'] = True
+        job = queue.enqueue('test.task', value=1)
+        self.task.assert_called_once_with(value=1)
+        self.assertEqual(JobStateEnum.done, job.status)
+        self.assertEqual(dict(ok=True), job.result)
+
+    def test_eager_enqueue_raises_errors(self):
+        self.app.config['JOB_QUEUE_EAGER'] = True
+        self.task.side_effect = ValueError('broken')
+        with self.assertRaises(ValueError):
+            queue.enqueue('test.task')
+        job = Job.query.one()
+        self.assertEqual(JobStateEnum.failed, job.status)
+
+    def test_work_runs_due_jobs(self):
+        job_id = queue.enqueue('test.task', value=1).id
+        later_id = queue.enqueue('test.task', value=2).id
+        later = Job.query.get(later_id)
+        later.run_after = datetime.datetime.utcnow() + \
+            datetime.timedelta(hours=1)
+        db.session.commit()
+
+        queue.work(burst=True)
+
+        self.task.assert_called_once_with(value=1)
+        self.assertEqual(JobStateEnum.done, Job.query.get(job_id).status)
+        self.assertEqual(JobStateEnum.queued, Job.query.get(later_id).status)
+
+    def test_failed_job_is_retried_with_backoff(self):
+        self.task.side_effect = ValueError('broken')
+        job_id = queue.enqueue('test.task').id
+
+        job = queue.run(queue.claim_next())
+
+        self.assertEqual(JobStateEnum.queued, job.status)
+        self.assertEqual(1, job.attempts)
+        self.assertIn('ValueError: broken', job.error)
+        self.assertGreater(job.run_after, datetime.datetime.utcnow())
+        self.assertIsNone(queue.claim_next())
+
+        job.run_after = datetime.datetime.utcnow()
+        db.session.commit()
+        job = queue.run(queue.claim_next())
+        self.assertEqual(job_id, job.id)
+        self.assertEqual(JobStateEnum.failed, job.status)
+        self.assertEqual(2, job.attempts)
+
+    def test_running_job_with_expired_lease_is_claimed_again(self):
+        job_id = queue.enqueue('test.task').id
+        job = queue.claim_next()
+        self.assertIsNone(queue.claim_next())
+
+        job.heartbeat_at = datetime.datetime.utcnow() - datetime.timedelta(
+            seconds=self.app.config['JOB_LEASE_TIMEOUT'] + 1)
+        db.session.commit()
+        job = queue.claim_next()
+        self.assertEqual(job_id, job.id)
+        self.assertEqual(2, job.attempts)
+
+    def test_lost_job_without_attempts_left_fails(self):
+        job_id = queue.enqueue('test.task').id
+        job = queue.claim_next()
+        job.attempts = job.max_attempts
+        job.heartbeat_at = datetime.datetime.utcnow() - datetime.timedelta(
+            seconds=self.app.config['JOB_LEASE_TIMEOUT'] + 1)
+        db.session.commit()
+
+        self.assertIsNone(queue.claim_next())
+        job = Job.query.get(job_id)
+        self.assertEqual(JobStateEnum.failed, job.status)
+        self.assertEqual(job.max_attempts, job.attempts)
+
+    def test_worker_renews_lease_while_job_runs(self):
+        self.app.config['JOB_HEARTBEAT_INTERVAL'] = 0.01
+        self.task.side_effect = lambda **kwargs: time.sleep(0.2)
+        job_id = queue.enqueue('test.task').id
+
+        queue.work(burst=True)
+
+        job = Job.query.get(job_id)
+        self.assertEqual(JobStateEnum.done, job.status)
+        self.assertGreater(job.heartbeat_at, job.started_at)
+
+    def tearDown(self):
+        queue.tasks.pop('test.task', None)
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
@@ -7,6 +7,8 @@ from __future__ import unicode_literals
 import unittest
 import json
 
+from sqlalchemy import event
+
 from app import create_app
 from app.bitstore import BitStore
 from app.database import db
@@ -176,6 +178,28 @@ class PackageTestCase(unittest.TestCase):
         self.assertEqual(json.loads(descriptor)['name'], "sub")
         self.assertEqual(metadata.private, True)
 
+    def test_renders_readme_on_update(self):
+        logic.Package.create_or_update(self.package_one, self.publisher_one,
+                                       readme='# Title\n\nAbout')
+        tag = Package.query.join(Publisher) \
+            .filter(Publisher.name == self.publisher_one,
+                    Package.name == self.package_one).one().tags[0]
+        self.assertEqual(tag.readme_html, '<h1>Title</h1>\n<p>About</p>')
+        self.assertEqual(tag.readme_short, 'Title About')
+        self.assertFalse(tag.readme_is_stale)
+
+    def test_rerenders_stale_readme_on_read(self):
+        logic.Package.create_or_update(self.package_one, self.publisher_one,
+                                       readme='# Title')
+        tag = Package.query.join(Publisher) \
+            .filter(Publisher.name == self.publisher_one,
+                    Package.name == self.package_one).one().tags[0]
+        tag.readme_html = 'old'
+        tag.readme_render_version = 0
+        db.session.commit()
+        metadata = logic.Package.get(self.publisher_one, self.package_one)
+        self.assertEqual(metadata['readme'], '<h1>Title</h1>')
+
     def test_insert_if_not_present(self):
         pub = self.publisher_two
         name = "custom_name"
@@ -244,6 +268,7 @@ class PackageTestCase(unittest.TestCase):
                     PackageTag.tag == 'tag_one').one()
 
         self.assertEqual(latest_data.readme, tagged_data.readme)
+        self.assertEqual(latest_data.readme_html, tagged_data.readme_html)
 
     def test_change_status(self):
         data = Package.query.join(Publisher). \
@@ -317,6 +342,53 @@ class PackageTestCase(unittest.TestCase):
         self.assertEqual(metadata['id'], 1)
 
 
+    def test_stores_document_on_write(self):
+        logic.Package.create_or_update(self.package_one, self.publisher_one,
+                                       readme='README')
+        logic.Package.create_or_update_tag(self.publisher_one,
+                                           self.package_one, '1.0')
+        package = Package.get_by_publisher(self.publisher_one,
+                                           self.package_one)
+        document = json.loads(package.latest_tag.document)
+        self.assertEqual(document,
+                         logic.Package.get(self.publisher_one, self.package_one))
+        self.assertEqual(document['readme'], '<p>README</p>')
+        tagged = PackageTag.query.filter_by(package_id=package.id,
+                                            tag='1.0').one()
+        self.assertEqual(tagged.document, package.latest_tag.document)
+
+    def test_get_document(self):
+        document = logic.Package.get_document(self.publisher, self.package)
+        self.assertEqual(json.loads(document.document),
+                         logic.Package.get(self.publisher, self.package))
+        self.assertIsNone(logic.Package.get_document(self.publisher, 'unknown'))
+
+    def test_get_many(self):
+        metadata = logic.Package.get_many([(self.publisher_two, self.package_two),
+                                           (self.publisher_one, 'unknown'),
+                                           (self.publisher_one, self.package_one)])
+        self.assertEqual([(m['publisher'], m['name']) for m in metadata],
+                         [(self.publisher_two, self.package_two),
+                          (self.publisher_one, self.package_one)])
+        self.assertEqual(logic.Package.get_many([]), [])
+
+    def test_get_runs_single_query(self):
+        logic.Package.create_or_update_tag(self.publisher_one,
+                                           self.package_one, '1.0')
+        db.session.remove()
+        statements = []
+
+        def count(*args):
+            statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            logic.Package.get(self.publisher_one, self.package_one)
+            logic.Package.get_many([(self.publisher_one, self.package_one),
+                                    (self.publisher_two, self.package_two)])
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+        self.assertEqual(len(statements), 2)
+
     def test_returns_none_if_package_not_found(self):
         package = logic.Package.get(self.publisher, 'unknown')
         self.assertIsNone(package)
@@ -6,6 +6,7 @@ from app import create_app
 from app.database import db
 from app.package.models import *
 from app.profile.models import *
+from app.jobs.models import JobStateEnum
 import app.logic as logic
 from app.utils import InvalidUsage
 
@@ -87,7 +88,7 @@ class PackageTest(unittest.TestCase):
     @patch('app.bitstore.BitStore.get_readme_object_key')
     @patch('app.bitstore.BitStore.get_s3_object')
     @patch('app.bitstore.BitStore.change_acl')
-    def test_finalize_package_publish_returns_queued_if_fine(
+    def test_finalize_package_publish_runs_import_job_if_fine(
                                     self, change_acl, get_s3_object,
                                     get_readme_object_key,
                                     get_metadata_body, create_or_update):
@@ -95,9 +96,15 @@ class PackageTest(unittest.TestCase):
         create_or_update.return_value = None
         get_readme_object_key.return_value = ''
         get_s3_object.return_value = ''
-        change_acl.return_value = None
-        status = logic.Package.finalize_publish(1, self.datapackage_url)
-        self.assertEqual(status, 'queued')
+        change_acl.return_value = True
+        job = logic.Package.finalize_publish(1, self.datapackage_url)
+        self.assertEqual(job.name, 'package.import')
+        self.assertEqual(job.status, JobStateEnum.done)
+        self.assertEqual(job.result, dict(publisher=self.publisher,
+                                          package=self.package))
+        create_or_update.assert_called_once_with(
+            name=self.package, publisher_name=self.publisher,
+            descriptor=dict(name='package'), readme=None)
 
 
     @patch('app.logic.Package.create_or_update')
@@ -113,7 +120,7 @@ class PackageTest(unittest.TestCase):
         create_or_update.return_value = None
         get_readme_object_key.return_value = ''
         get_s3_object.return_value = ''
-        change_acl.return_value = None
+        change_acl.return_value = True
         with self.assertRaises(InvalidUsage) as context:
             logic.Package.finalize_publish(2, self.datapackage_url)
         self.assertEqual(context.exception.status_code, 400)
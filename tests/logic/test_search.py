@@ -10,7 +10,8 @@ from app.database import db
 import app.logic as logic
 from app.logic.search import DataPackageQuery
 from app.profile.models import Publisher
-from app.package.models import Package, PackageTag
+from app.package.models import Package, PackageTag, PackageStateEnum
+from app.utils import InvalidUsage
 
 
 class DataPackageQueryTestCase(unittest.TestCase):
@@ -158,6 +159,46 @@ class DataPackageQueryTestCase(unittest.TestCase):
         dpq = DataPackageQuery('details publisher:pub1', limit=1005)
         self.assertEqual(1000, dpq.limit)
 
+    def test_fuzzy_should_tolerate_typos_in_name(self):
+        dpq = DataPackageQuery('pak4', mode='fuzzy')
+        self.assertEqual(['pack4'], [item['name'] for item in dpq.get_data()])
+
+    def test_fuzzy_should_tolerate_typos_in_title(self):
+        with self.app.test_request_context():
+            pack = Package(name='world-stats')
+            pack.tags.append(PackageTag(descriptor={"title": "Population"}))
+            self.pub1.packages.append(pack)
+            db.session.add(self.pub1)
+            db.session.commit()
+        dpq = DataPackageQuery('Popluation', mode='fuzzy')
+        self.assertEqual(['world-stats'],
+                         [item['name'] for item in dpq.get_data()])
+
+    def test_fuzzy_should_return_best_matches_first(self):
+        dpq = DataPackageQuery('pack4', mode='fuzzy')
+        names = [item['name'] for item in dpq.get_data()]
+        self.assertEqual(6, len(names))
+        self.assertEqual('pack4', names[0])
+
+    def test_summary_should_only_contain_summary_fields(self):
+        dpq = DataPackageQuery('* publisher:pub2', fields='summary')
+        items = dpq.get_data()
+        self.assertEqual(['pack4', 'pack5', 'pack6'],
+                         [item['name'] for item in items])
+        self.assertEqual({'name': 'pack4', 'publisher_name': 'pub2',
+                          'title': 'pack4 details four', 'description': None,
+                          'status': 'ACTIVE'}, items[0])
+
+    def test_summary_should_page_with_cursor(self):
+        dpq = DataPackageQuery('details', limit=4, fields='summary')
+        items, cursor = dpq.get_page()
+        self.assertEqual(4, len(items))
+        dpq = DataPackageQuery('details', limit=4, fields='summary',
+                               after=cursor)
+        items, cursor = dpq.get_page()
+        self.assertEqual(['pack5', 'pack6'], [item['name'] for item in items])
+        self.assertIsNone(cursor)
+
     def test_should_not_visible_after_soft_delete(self):
         logic.Package.delete(self.pub1_name, 'pack1')
         query_string = "details publisher:pub1"
@@ -168,3 +209,105 @@ class DataPackageQueryTestCase(unittest.TestCase):
         with self.app.app_context():
             db.session.remove()
             db.drop_all()
+
+
+class FullTextSearchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app()
+        self.app.app_context().push()
+        with self.app.test_request_context():
+            db.drop_all()
+            db.create_all()
+            db.session.add(Publisher(name='pub1'))
+            db.session.add(Publisher(name='climate'))
+            db.session.commit()
+
+            logic.Package.create_or_update(
+                'gdp', 'pub1',
+                descriptor={"name": "gdp", "title": "Country GDP",
+                            "description": "Yearly gross domestic product",
+                            "keywords": ["economy", "finance"]},
+                readme="Figures collected from the world bank")
+            logic.Package.create_or_update(
+                'co2', 'climate',
+                descriptor={"name": "co2", "title": "CO2 emissions",
+                            "description": "Emissions by country and year"},
+                readme="")
+            logic.Package.create_or_update(
+                'banks', 'pub1',
+                descriptor={"name": "banks", "title": "Banks of the world"},
+                readme="Includes central banks")
+
+    def search(self, query_string):
+        dpq = DataPackageQuery(query_string, mode='fulltext')
+        return [item['name'] for item in dpq.get_data()]
+
+    def test_should_match_title_description_keywords_and_readme(self):
+        self.assertEqual(['gdp'], self.search('gross product'))
+        self.assertEqual(['gdp'], self.search('economy'))
+        self.assertEqual(['gdp'], self.search('collected figures'))
+
+    def test_should_page_by_rank(self):
+        dpq = DataPackageQuery('country', mode='fulltext', limit=1)
+        items, cursor = dpq.get_page()
+        self.assertEqual(['gdp'], [item['name'] for item in items])
+        self.assertEqual(2, dpq.count())
+
+        dpq = DataPackageQuery('country', mode='fulltext', limit=1,
+                               after=cursor)
+        items, cursor = dpq.get_page()
+        self.assertEqual(['co2'], [item['name'] for item in items])
+        self.assertIsNone(cursor)
+
+    def test_should_match_publisher(self):
+        self.assertEqual(['co2'], self.search('climate'))
+
+    def test_should_rank_title_matches_first(self):
+        self.assertEqual(['banks', 'gdp'], self.search('bank'))
+        self.assertEqual(['gdp', 'co2'], self.search('country'))
+
+    def test_should_filter_by_publisher(self):
+        self.assertEqual(['gdp'], self.search('country publisher:pub1'))
+
+    def test_should_follow_updates(self):
+        logic.Package.create_or_update(
+            'co2', 'climate',
+            descriptor={"name": "co2", "title": "Carbon dioxide"})
+        self.assertEqual([], self.search('emissions'))
+        self.assertEqual(['co2'], self.search('carbon'))
+
+    def test_should_follow_status_changes(self):
+        logic.Package.change_status('pub1', 'gdp', PackageStateEnum.deleted)
+        self.assertEqual([], self.search('economy'))
+        tag = PackageTag.query.join(Package)\
+            .filter(Package.name == 'gdp', PackageTag.tag == 'latest').one()
+        self.assertIsNone(tag.search_vector)
+
+        logic.Package.change_status('pub1', 'gdp', PackageStateEnum.active)
+        self.assertEqual(['gdp'], self.search('economy'))
+
+    def test_should_keep_results_after_tagging(self):
+        logic.Package.create_or_update_tag('pub1', 'gdp', '1.0')
+        self.assertEqual(['gdp'], self.search('economy'))
+
+    def test_should_list_all_for_empty_query(self):
+        for mode in ('fulltext', 'fuzzy'):
+            dpq = DataPackageQuery('', mode=mode)
+            self.assertEqual(['gdp', 'co2', 'banks'],
+                             [item['name'] for item in dpq.get_data()])
+
+    def test_should_index_readme_over_tsvector_limit(self):
+        readme = ' '.join('word%d' % i for i in range(200000))
+        logic.Package.create_or_update(
+            'big', 'pub1', descriptor={"name": "big", "title": "Big readme"},
+            readme=readme)
+        self.assertEqual(['big'], self.search('word1'))
+
+    def test_should_raise_for_unknown_mode(self):
+        self.assertRaises(InvalidUsage, DataPackageQuery, 'gdp', mode='bad')
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import datetime
+import unittest
+
+from app import create_app
+from app.package.models import Package, PackageTag
+from app.profile.models import Publisher, User
+from app.jobs.models import Job, JobStateEnum
+import app.logic as logic
+from app.logic.serializers import Serializer, get_serializer
+
+
+class SerializerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.app_context().push()
+        self.publisher = Publisher(name='core', contact_public=True,
+                                   email='core@test.com',
+                                   created_at=datetime.datetime(2017, 1, 1))
+        self.user = User(name='core', email='core@test.com')
+        self.package = Package(id=1, name='gold-prices',
+                               publisher=self.publisher)
+        self.package.latest_tag = PackageTag(
+            descriptor=dict(name='gold-prices', licenses={'type': 'odc'}),
+            readme='# Gold')
+
+    def assert_dumps_same_as_schema(self, schema, obj):
+        expected = schema().dump(obj).data
+        serializer = Serializer(schema)
+        # the first dump compiles the serializer, the second uses it
+        self.assertEqual(serializer.dump(obj), expected)
+        self.assertEqual(serializer.dump(obj), expected)
+
+    def assert_dumps_all_same_as_schema(self, schema, objs):
+        serializer = Serializer(schema)
+        for obj in objs:
+            self.assertEqual(serializer.dump(obj), schema().dump(obj).data)
+
+    def test_package_metadata(self):
+        self.assert_dumps_same_as_schema(logic.PackageMetadataSchema,
+                                         self.package)
+
+    def test_publisher(self):
+        self.assert_dumps_same_as_schema(logic.PublisherSchema,
+                                         self.publisher)
+
+    def test_user(self):
+        self.assert_dumps_same_as_schema(logic.UserSchema, self.user)
+
+    def test_job(self):
+        job = Job(id=1, name='package.import', status=JobStateEnum.failed,
+                  error='Traceback\nException: failed')
+        self.assert_dumps_same_as_schema(logic.JobSchema, job)
+
+    def test_serializers_are_reused(self):
+        self.assertIs(get_serializer(logic.UserSchema),
+                      get_serializer(logic.UserSchema))
+
+    def test_values_of_other_types_than_their_fields(self):
+        self.assert_dumps_all_same_as_schema(logic.UserSchema, [
+            self.user,
+            User(id=2, name=b'bytes', email=None, sysadmin=1),
+            User(id=True, name=42, full_name=3.5, sysadmin='false')])
+
+    def test_fields_not_declared_of_other_types(self):
+        packages = []
+        for package_id, name in ((1, 'gold-prices'), (None, b'bytes'),
+                                 ('3', 42), (4.5, 'silver')):
+            package = Package(id=package_id, name=name,
+                              publisher=self.publisher)
+            package.latest_tag = self.package.latest_tag
+            packages.append(package)
+        self.assert_dumps_all_same_as_schema(logic.PackageMetadataSchema,
+                                             packages)
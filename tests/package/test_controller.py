@@ -70,6 +70,29 @@ class GetMetaDataTestCase(unittest.TestCase):
         self.assertEqual(data['name'], self.package)
         self.assertEqual(data['publisher'], self.publisher)
 
+    def test_return_304_if_not_modified(self):
+        with self.app.app_context():
+            db.session.add(Publisher(name=self.publisher))
+            db.session.commit()
+            logic.Package.create_or_update(self.package, self.publisher,
+                                           readme='README')
+        url = '/api/package/%s/%s' % (self.publisher, self.package)
+        response = self.client.get(url)
+        etag = response.headers['ETag']
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        response = self.client.get(url, headers={
+            'If-Modified-Since': response.headers['Last-Modified']})
+        self.assertEqual(response.status_code, 304)
+
+        with self.app.app_context():
+            logic.Package.create_or_update(self.package, self.publisher,
+                                           readme='NEW README')
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
     def test_return_empty_string_if_readme_not_there(self):
         descriptor = {'name': 'test description'}
         with self.app.app_context():
@@ -218,7 +241,7 @@ class FinalizeMetaDataTestCase(unittest.TestCase):
         create_or_update.return_value = None
         get_readme_object_key.return_value = ''
         get_s3_object.return_value = ''
-        change_acl.return_value = None
+        change_acl.return_value = True
         auth = "%s" % self.jwt
         response = self.client.post(self.url,
                                     data=json.dumps(dict(datapackage=self.datapackage_url)),
@@ -226,7 +249,8 @@ class FinalizeMetaDataTestCase(unittest.TestCase):
                                     content_type='application/json')
         self.assertEqual(200, response.status_code)
         data = json.loads(response.data)
-        self.assertEqual({'status': 'queued'}, data)
+        self.assertEqual('queued', data['status'])
+        self.assertTrue(data['job_id'])
 
     @patch('app.bitstore.BitStore.get_metadata_body')
     def test_throw_500_if_failed_to_get_data_from_s3(self, body_mock):
@@ -302,8 +326,10 @@ class EndToEndTestCase(unittest.TestCase):
     @patch('app.bitstore.BitStore.get_readme_object_key')
     @patch('app.bitstore.BitStore.get_s3_object')
     @patch('app.bitstore.BitStore.change_acl')
+    @patch('app.bitstore.BitStore.save_manifest')
     @patch('app.bitstore.BitStore.generate_pre_signed_post_object')
     def test_publish_end_to_end(self, generate_pre_signed_post_object,
+                                save_manifest,
                                 change_acl, get_s3_object,get_readme_object_key,
                                 get_metadata_body, create_or_update,
                                 create_or_update_tag,copy_to_new_version):
@@ -366,7 +392,7 @@ class EndToEndTestCase(unittest.TestCase):
         create_or_update.return_value = None
         get_readme_object_key.return_value = ''
         get_s3_object.return_value = ''
-        change_acl.return_value = None
+        change_acl.return_value = True
         rv = self.client.post(self.finalize_url,
                                     data=json.dumps(dict(datapackage=self.datapackage_url)),
                                     headers={'Auth-Token': self.auth},
@@ -374,7 +400,8 @@ class EndToEndTestCase(unittest.TestCase):
         # Test Data
         self.assertEqual(200, rv.status_code)
         data = json.loads(rv.data)
-        self.assertEqual({'status': 'queued'}, data)
+        self.assertEqual('queued', data['status'])
+        self.assertTrue(data['job_id'])
 
     def tearDown(self):
         with self.app.app_context():
@@ -931,3 +958,27 @@ class TagDataPackageTestCase(unittest.TestCase):
             db.session.remove()
             db.drop_all()
             db.engine.dispose()
+
+
+class GetPackageFileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.client = self.app.test_client()
+        self.app.config['BITSTORE_CONTENT_ADDRESSED'] = True
+
+    @mock_s3
+    def test_redirects_to_blob(self):
+        with self.app.app_context():
+            s3 = boto3.client('s3')
+            s3.create_bucket(Bucket=self.app.config['S3_BUCKET_NAME'])
+            bit_store = BitStore('test_publisher', 'test_package')
+            bit_store.save_manifest({
+                'data/file.csv': {'name': 'file',
+                                  'md5': 'XUFAKrxLKna5cZ2REBfFkg=='}
+            })
+            blob_key = bit_store.build_s3_blob_key(
+                '5d41402abc4b2a76b9719d911017c592')
+        response = self.client.get(
+            '/api/package/test_publisher/test_package/_v/latest/data/file.csv')
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.headers['Location'].endswith(blob_key))
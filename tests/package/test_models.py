@@ -11,7 +11,8 @@ import unittest
 import json
 from app import create_app
 from app.database import db
-from app.package.models import Package, PackageStateEnum, PackageTag
+from app.package.models import Package, PackageStateEnum, PackageTag, \
+    VersionStamp
 from app.profile.models import User, Publisher, UserRoleEnum, PublisherUser
 
 
@@ -68,6 +69,37 @@ class PackageTestCase(unittest.TestCase):
         pkg = Package.get_by_publisher(self.publisher_one, 'not_a_package')
         self.assertIsNone(pkg)
 
+    def test_latest_tag(self):
+        pkg = Package.get_by_publisher(self.publisher_one, self.package_one)
+        pkg.tags.append(PackageTag(tag='1.0', descriptor=dict(name='old')))
+        db.session.commit()
+        pkg = Package.get_by_publisher(self.publisher_one, self.package_one)
+        self.assertEqual(pkg.latest_tag.tag, 'latest')
+        self.assertEqual(pkg.latest_tag.descriptor['name'], 'test_one')
+
+    def test_version_stamps_change_with_writes(self):
+        publisher = Publisher.get_by_name(self.publisher_two)
+        publisher_stamp = VersionStamp.publisher_stamp(publisher.id)
+        packages = VersionStamp.get(VersionStamp.PACKAGES)
+        before = VersionStamp.get(publisher_stamp)
+
+        publisher.packages.append(Package(name=self.package_two))
+        db.session.commit()
+        self.assertGreater(VersionStamp.get(VersionStamp.PACKAGES), packages)
+        self.assertGreater(VersionStamp.get(publisher_stamp), before)
+
+        packages = VersionStamp.get(VersionStamp.PACKAGES)
+        publisher.title = 'renamed'
+        db.session.commit()
+        self.assertGreater(VersionStamp.get(VersionStamp.PACKAGES), packages)
+
+        before = VersionStamp.get(publisher_stamp)
+        member = PublisherUser(role=UserRoleEnum.member,
+                               user=User.get_by_name(self.publisher_one))
+        publisher.users.append(member)
+        db.session.commit()
+        self.assertGreater(VersionStamp.get(publisher_stamp), before)
+
     @classmethod
     def teardown_class(self):
         with self.app.app_context():
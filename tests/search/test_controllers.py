@@ -102,6 +102,52 @@ class SearchPackagesTestCase(unittest.TestCase):
         # extra 6 packages from the setup so we expect 36 packages
         self.assertEqual(36, len(result['items']))
 
+    def test_should_page_with_cursor(self):
+        url = "/api/search/package?q=details&limit=4"
+        result = json.loads(self.client.get(url).data)
+        self.assertEqual(['pack1', 'pack2', 'pack3', 'pack4'],
+                         [item['name'] for item in result['items']])
+        self.assertEqual(6, result['total_count'])
+
+        url = "/api/search/package?q=details&limit=4&after=" + result['next']
+        result = json.loads(self.client.get(url).data)
+        self.assertEqual(['pack5', 'pack6'],
+                         [item['name'] for item in result['items']])
+        self.assertEqual(6, result['total_count'])
+        self.assertIsNone(result['next'])
+
+    def test_should_return_total_count_beyond_limit(self):
+        url = "/api/search/package?q=* publisher:pub2&limit=1"
+        result = json.loads(self.client.get(url).data)
+        self.assertEqual(1, len(result['items']))
+        self.assertEqual(3, result['total_count'])
+
+    def test_should_estimate_count(self):
+        url = "/api/search/package?q=details&count=estimate"
+        response = self.client.get(url)
+        result = json.loads(response.data)
+        self.assertEqual(200, response.status_code)
+        self.assertIsInstance(result['total_count'], int)
+
+    def test_should_return_400_for_invalid_cursor(self):
+        response = self.client.get("/api/search/package?q=pack1&after=zz")
+        self.assertEqual(400, response.status_code)
+
+    def test_should_return_summary_fields(self):
+        url = "/api/search/package?q=pack1&fields=summary"
+        result = json.loads(self.client.get(url).data)
+        self.assertEqual([{'name': 'pack1', 'publisher_name': 'pub1',
+                           'title': 'pack1 details one', 'description': None,
+                           'status': 'ACTIVE'}], result['items'])
+
+    def test_should_return_400_for_unknown_fields(self):
+        response = self.client.get("/api/search/package?q=pack1&fields=all")
+        self.assertEqual(400, response.status_code)
+
+    def test_should_return_400_for_unknown_mode(self):
+        response = self.client.get("/api/search/package?q=pack1&mode=bad")
+        self.assertEqual(400, response.status_code)
+
     def tearDown(self):
         with self.app.app_context():
             db.session.remove()
@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import base64
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
+from urlparse import urlparse
+
+from botocore.exceptions import ClientError
+
+from app import create_app
+from app.bitstore import BitStore
+from app.storage import create_storage_client
+from app.storage.local import LocalStorageClient
+
+
+class LocalStorageClientTestCase(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.client = LocalStorageClient(self.root, 'secret',
+                                         'http://localhost/api/storage')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_put_and_get_object(self):
+        self.client.put_object(Bucket='b', Key='a/b.csv', Body=b'1,2',
+                               ContentType='text/csv')
+        obj = self.client.get_object(Bucket='b', Key='a/b.csv')
+        self.assertEqual(obj['Body'].read(), b'1,2')
+        self.assertEqual(obj['ContentType'], 'text/csv')
+        etag = '"%s"' % hashlib.md5(b'1,2').hexdigest()
+        self.assertEqual(obj['ETag'], etag)
+
+    def test_get_object_raises_304_if_etag_matches(self):
+        self.client.put_object(Bucket='b', Key='k', Body=b'data')
+        etag = self.client.head_object(Bucket='b', Key='k')['ETag']
+        with self.assertRaises(ClientError) as context:
+            self.client.get_object(Bucket='b', Key='k', IfNoneMatch=etag)
+        self.assertEqual(context.exception.response['Error']['Code'], '304')
+
+    def test_get_missing_object_raises_no_such_key(self):
+        with self.assertRaises(ClientError) as context:
+            self.client.get_object(Bucket='b', Key='missing')
+        self.assertEqual(context.exception.response['Error']['Code'],
+                         'NoSuchKey')
+
+    def test_rejects_keys_outside_of_root(self):
+        with self.assertRaises(ClientError):
+            self.client.put_object(Bucket='b', Key='../../etc/passwd',
+                                   Body=b'')
+
+    def test_rejects_keys_outside_of_their_prefix(self):
+        key = 'metadata/pub/pkg/_v/latest/' \
+              '../../../../victim/pkg/_v/latest/datapackage.json'
+        for bad_key in (key, '/b/k', 'p//k', 'p/./k', 'p/'):
+            with self.assertRaises(ClientError):
+                self.client.put_object(Bucket='b', Key=bad_key, Body=b'')
+        self.assertFalse(os.path.exists(
+            os.path.join(self.root, 'b', 'metadata', 'victim')))
+
+    def test_list_objects_paginates(self):
+        for i in range(5):
+            self.client.put_object(Bucket='b', Key='p/%d' % i, Body=b'x')
+        self.client.put_object(Bucket='b', Key='other', Body=b'x')
+        first = self.client.list_objects_v2(Bucket='b', Prefix='p/',
+                                            MaxKeys=3)
+        self.assertTrue(first['IsTruncated'])
+        second = self.client.list_objects_v2(
+            Bucket='b', Prefix='p/', MaxKeys=3,
+            ContinuationToken=first['NextContinuationToken'])
+        keys = [o['Key'] for o in first['Contents'] + second['Contents']]
+        self.assertEqual(keys, ['p/%d' % i for i in range(5)])
+
+    def test_copy_object_keeps_content_and_sets_acl(self):
+        self.client.put_object(Bucket='b', Key='src', Body=b'data',
+                               ACL='private')
+        self.client.copy_object(Bucket='b', Key='dst', ACL='public-read',
+                                CopySource=dict(Bucket='b', Key='src'))
+        self.assertEqual(self.client.get_object(Bucket='b', Key='dst')
+                         ['Body'].read(), b'data')
+        self.assertEqual(self.client.get_object_info('b', 'dst')['ACL'],
+                         'public-read')
+        self.assertEqual(self.client.get_object_info('b', 'src')['ACL'],
+                         'private')
+
+    def test_delete_objects(self):
+        self.client.put_object(Bucket='b', Key='k', Body=b'data')
+        self.client.delete_objects(Bucket='b',
+                                   Delete=dict(Objects=[dict(Key='k')]))
+        self.assertEqual(self.client.list_objects_v2(Bucket='b')['KeyCount'],
+                         0)
+
+    def test_multipart_upload(self):
+        upload_id = self.client.create_multipart_upload(
+            Bucket='b', Key='big')['UploadId']
+        parts = []
+        for number, body in enumerate([b'abc', b'def'], 1):
+            response = self.client.upload_part(
+                Bucket='b', Key='big', UploadId=upload_id,
+                PartNumber=number, Body=body)
+            parts.append(dict(PartNumber=number, ETag=response['ETag']))
+        self.client.complete_multipart_upload(
+            Bucket='b', Key='big', UploadId=upload_id,
+            MultipartUpload=dict(Parts=parts))
+        self.assertEqual(self.client.get_object(Bucket='b', Key='big')
+                         ['Body'].read(), b'abcdef')
+
+    def test_multipart_rejects_parent_upload_id(self):
+        self.client.put_object(Bucket='b', Key='k', Body=b'data')
+        for call in (self.client.abort_multipart_upload,
+                     self.client.list_parts):
+            with self.assertRaises(ClientError) as context:
+                call(Bucket='b', Key='k', UploadId='..')
+            self.assertEqual(context.exception.response['Error']['Code'],
+                             'NoSuchUpload')
+        with self.assertRaises(ClientError):
+            self.client.complete_multipart_upload(
+                Bucket='b', Key='k', UploadId='..',
+                MultipartUpload=dict(Parts=[]))
+        self.assertEqual(self.client.get_object(Bucket='b', Key='k')
+                         ['Body'].read(), b'data')
+
+    def test_multipart_rejects_absolute_upload_id(self):
+        outside = tempfile.mkdtemp()
+        try:
+            with self.assertRaises(ClientError) as context:
+                self.client.abort_multipart_upload(Bucket='b', Key='k',
+                                                   UploadId=outside)
+            self.assertEqual(context.exception.response['Error']['Code'],
+                             'NoSuchUpload')
+            with self.assertRaises(ClientError):
+                self.client.upload_part(Bucket='b', Key='k',
+                                        UploadId=outside, PartNumber=1,
+                                        Body=b'data')
+            self.assertTrue(os.path.isdir(outside))
+            self.assertEqual(os.listdir(outside), [])
+        finally:
+            shutil.rmtree(outside)
+
+    def test_presigned_post_policy_is_verified(self):
+        post = self.client.generate_presigned_post(
+            Bucket='b', Key='k', Fields={'acl': 'public-read'})
+        fields = post['fields']
+        policy = self.client.verify_policy(fields['policy'],
+                                           fields['signature'])
+        self.assertEqual(policy['key'], 'k')
+        self.assertEqual(policy['acl'], 'public-read')
+        self.assertIsNone(self.client.verify_policy(fields['policy'], 'x'))
+
+
+class LocalBackendTestCase(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.app = create_app()
+        self.app.app_context().push()
+        self.app.config['BITSTORE_BACKEND'] = 'local'
+        self.app.config['BITSTORE_LOCAL_ROOT'] = self.root
+        self.app.config['BITSTORE_URL'] = 'http://localhost/api/storage'
+        self.app.config['S3'] = create_storage_client(self.app.config)
+        self.client = self.app.test_client()
+        self.bucket = self.app.config['S3_BUCKET_NAME']
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_create_storage_client_returns_local_client(self):
+        self.assertIsInstance(self.app.config['S3'], LocalStorageClient)
+
+    def test_bitstore_runs_on_local_backend(self):
+        bit_store = BitStore('pub', 'pack', body='{"name": "pack"}')
+        bit_store.save_metadata()
+        self.assertEqual(bit_store.get_metadata_body(), b'{"name": "pack"}')
+        self.assertTrue(bit_store.change_acl('private'))
+        self.assertTrue(bit_store.delete_data_package())
+        self.assertIsNone(bit_store.get_metadata_body())
+
+    def test_upload_and_serve_object(self):
+        post = self.app.config['S3'].generate_presigned_post(
+            Bucket=self.bucket, Key='pub/pack/data.csv',
+            Fields={'acl': 'public-read'})
+        data = dict(post['fields'])
+        data['Content-Type'] = 'text/csv'
+        data['Content-MD5'] = base64.b64encode(
+            hashlib.md5(b'a,b').digest()).decode('ascii')
+        data['file'] = (BytesIO(b'a,b'), 'data.csv')
+        response = self.client.post('/api/storage', data=data)
+        self.assertEqual(response.status_code, 204)
+
+        response = self.client.get('/api/storage/pub/pack/data.csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, b'a,b')
+        self.assertEqual(response.mimetype, 'text/csv')
+
+        response = self.client.get(
+            '/api/storage/pub/pack/data.csv',
+            headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_upload_rejects_forged_policy(self):
+        post = self.app.config['S3'].generate_presigned_post(
+            Bucket=self.bucket, Key='pub/pack/data.csv')
+        data = dict(post['fields'])
+        data['key'] = 'pub/other/data.csv'
+        data['file'] = (BytesIO(b'a,b'), 'data.csv')
+        response = self.client.post('/api/storage', data=data)
+        self.assertEqual(response.status_code, 403)
+
+    def test_content_addressed_upload_rejects_other_md5(self):
+        self.app.config['BITSTORE_CONTENT_ADDRESSED'] = True
+        md5 = base64.b64encode(hashlib.md5(b'a,b').digest()).decode('ascii')
+        other_md5 = base64.b64encode(
+            hashlib.md5(b'evil').digest()).decode('ascii')
+        bit_store = BitStore('pub', 'pack')
+        post = bit_store.generate_pre_signed_post_object('data.csv', md5)
+
+        data = dict(post['fields'])
+        data['Content-MD5'] = other_md5
+        data['file'] = (BytesIO(b'evil'), 'data.csv')
+        response = self.client.post('/api/storage', data=data)
+        self.assertEqual(response.status_code, 403)
+
+        data = dict(post['fields'])
+        data['file'] = (BytesIO(b'evil'), 'data.csv')
+        response = self.client.post('/api/storage', data=data)
+        self.assertEqual(response.status_code, 400)
+        self.assertIsNone(bit_store.get_s3_object(post['fields']['key']))
+
+        data = dict(post['fields'])
+        data['file'] = (BytesIO(b'a,b'), 'data.csv')
+        response = self.client.post('/api/storage', data=data)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(bit_store.get_s3_object(post['fields']['key']),
+                         b'a,b')
+
+    def test_multipart_upload_with_presigned_parts(self):
+        bit_store = BitStore('pub', 'pack')
+        upload = bit_store.create_multipart_upload('big.csv', 10)
+        url = urlparse(upload['parts'][0]['url'])
+        response = self.client.put('{0}?{1}'.format(url.path, url.query),
+                                   data=b'0123456789')
+        self.assertEqual(response.status_code, 200)
+        uploaded = bit_store.list_uploaded_parts('big.csv',
+                                                 upload['upload_id'])
+        self.assertEqual([1], [part['PartNumber'] for part in uploaded])
+        self.assertEqual(response.headers['ETag'], uploaded[0]['ETag'])
+
+        bit_store.complete_multipart_upload('big.csv', upload['upload_id'],
+                                            uploaded)
+        self.assertEqual(bit_store.get_s3_object(upload['key']),
+                         b'0123456789')
+
+    def test_content_addressed_manifest_points_to_multipart_upload(self):
+        self.app.config['BITSTORE_CONTENT_ADDRESSED'] = True
+        self.app.config['BITSTORE_MULTIPART_UPLOAD_THRESHOLD'] = 5
+        md5 = base64.b64encode(
+            hashlib.md5(b'0123456789').digest()).decode('ascii')
+        bit_store = BitStore('pub', 'pack')
+        upload = bit_store.create_multipart_upload('big.csv', 10)
+        url = urlparse(upload['parts'][0]['url'])
+        response = self.client.put('{0}?{1}'.format(url.path, url.query),
+                                   data=b'0123456789')
+        self.assertEqual(response.status_code, 200)
+        bit_store.complete_multipart_upload('big.csv', upload['upload_id'],
+                                            [dict(PartNumber=1,
+                                                  ETag=response.headers
+                                                  ['ETag'])])
+        bit_store.save_manifest({
+            'big.csv': {'name': 'big', 'md5': md5, 'size': 10}})
+
+        self.assertEqual(upload['key'], bit_store.resolve_key('big.csv'))
+        self.assertEqual(bit_store.get_s3_object(
+            bit_store.resolve_key('big.csv')), b'0123456789')
+
+    def test_multipart_upload_is_resumed_or_replaced(self):
+        bit_store = BitStore('pub', 'pack')
+        upload = bit_store.create_multipart_upload('big.csv', 10, md5='md5')
+        bit_store.save_manifest(
+            {'big.csv': {'name': 'big', 'md5': 'md5', 'size': 10}},
+            upload_ids={'big.csv': upload['upload_id']})
+
+        again = bit_store.create_multipart_upload('big.csv', 10, md5='md5')
+        self.assertEqual(upload['upload_id'], again['upload_id'])
+        self.assertEqual([upload['upload_id']],
+                         bit_store.list_multipart_uploads('big.csv'))
+
+        changed = bit_store.create_multipart_upload('big.csv', 10,
+                                                    md5='other')
+        self.assertNotEqual(upload['upload_id'], changed['upload_id'])
+        self.assertEqual([changed['upload_id']],
+                         bit_store.list_multipart_uploads('big.csv'))
+
+    def test_part_upload_rejects_post_policy(self):
+        post = self.app.config['S3'].generate_presigned_post(
+            Bucket=self.bucket, Key='pub/pack/data.csv')
+        response = self.client.put('/api/storage/_parts', query_string=dict(
+            policy=post['fields']['policy'],
+            signature=post['fields']['signature']), data=b'x')
+        self.assertEqual(response.status_code, 403)
+
+    def test_private_objects_are_not_served(self):
+        self.app.config['S3'].put_object(Bucket=self.bucket, Key='secret',
+                                         Body=b'x', ACL='private')
+        response = self.client.get('/api/storage/secret')
+        self.assertEqual(response.status_code, 404)
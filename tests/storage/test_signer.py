@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import datetime
+import shutil
+import tempfile
+import unittest
+
+import boto3
+from botocore.client import Config
+from mock import patch
+
+from app.storage import signer
+from app.storage.local import LocalStorageClient
+
+
+class PostSignerTestCase(unittest.TestCase):
+    def setUp(self):
+        signer.signing_keys.clear()
+        self.s3 = boto3.client('s3', region_name='eu-west-1',
+                               aws_access_key_id='key',
+                               aws_secret_access_key='secret',
+                               config=Config(signature_version='s3v4'))
+        self.fields = {'acl': 'public-read',
+                       'Content-MD5': 'm',
+                       'Content-Type': 'text/plain'}
+        self.conditions = [{"acl": "public-read"},
+                           ["starts-with", "$Content-Type", ""]]
+
+    def test_uses_post_signer_for_s3v4_clients(self):
+        post_signer = signer.create_post_signer(self.s3, 'bucket')
+        self.assertIsInstance(post_signer, signer.PostSigner)
+
+    def test_signs_same_as_boto(self):
+        post_signer = signer.create_post_signer(self.s3, 'bucket')
+        post = post_signer.sign('a/b.csv', self.fields, self.conditions)
+
+        now = datetime.datetime.strptime(post_signer.timestamp,
+                                         signer.SIGV4_TIMESTAMP)
+
+        class FrozenDatetime(datetime.datetime):
+            @classmethod
+            def utcnow(cls):
+                return now
+
+        with patch('datetime.datetime', FrozenDatetime):
+            expected = self.s3.generate_presigned_post(
+                Bucket='bucket', Key='a/b.csv', Fields=self.fields,
+                Conditions=self.conditions)
+        self.assertEqual(post, expected)
+
+    def test_signing_key_is_derived_once(self):
+        post_signer = signer.create_post_signer(self.s3, 'bucket')
+        for key in ('a', 'b', 'c'):
+            post_signer.sign(key, self.fields, self.conditions)
+        signer.create_post_signer(self.s3, 'bucket')
+        self.assertEqual(len(signer.signing_keys), 1)
+        self.assertEqual(signer.signing_keys.misses, 1)
+        self.assertEqual(signer.signing_keys.hits, 1)
+
+    def test_does_not_share_fields_between_keys(self):
+        post_signer = signer.create_post_signer(self.s3, 'bucket')
+        first = post_signer.sign('a', self.fields, self.conditions)
+        second = post_signer.sign('b', self.fields, self.conditions)
+        self.assertEqual(first['fields']['key'], 'a')
+        self.assertEqual(second['fields']['key'], 'b')
+        self.assertNotEqual(first['fields']['x-amz-signature'],
+                            second['fields']['x-amz-signature'])
+        self.assertNotIn('key', self.fields)
+        self.assertEqual(len(self.conditions), 2)
+
+    def test_falls_back_to_client_signing(self):
+        root = tempfile.mkdtemp()
+        try:
+            client = LocalStorageClient(root, 'secret',
+                                        'http://localhost/api/storage')
+            post_signer = signer.create_post_signer(client, 'bucket')
+            self.assertIsInstance(post_signer, signer.ClientPostSigner)
+            post = post_signer.sign('a', self.fields, self.conditions)
+            self.assertEqual(post['fields']['key'], 'a')
+        finally:
+            shutil.rmtree(root)
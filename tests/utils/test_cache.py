@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from app.utils.cache import LRUCache, ObjectCache
+
+
+class LRUCacheTestCase(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(2, len(cache))
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+
+    def test_counts_hits_and_misses(self):
+        cache = LRUCache()
+        cache.set('a', 1)
+        self.assertEqual(1, cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+    def test_evicts_to_maxbytes(self):
+        cache = LRUCache(maxsize=10, maxbytes=5)
+        cache.set('a', 'aa')
+        cache.set('b', 'bb')
+        cache.set('c', 'cc')
+        self.assertNotIn('a', cache)
+        self.assertEqual(2, len(cache))
+        cache.set('d', 'dddddd')
+        self.assertNotIn('d', cache)
+        self.assertEqual(2, len(cache))
+
+
+class ObjectCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def test_does_not_cache_big_objects(self):
+        cache = ObjectCache(max_object_size=3)
+        cache.set('bucket', 'key', '"etag"', b'body')
+        self.assertIsNone(cache.get('bucket', 'key'))
+
+    def test_evicts_memory_tier_by_body_size(self):
+        cache = ObjectCache(maxsize=10, maxbytes=10)
+        for key in ['a', 'b', 'c']:
+            cache.set('bucket', key, '"etag"', b'body')
+        self.assertIsNone(cache.get('bucket', 'a'))
+        self.assertEqual(cache.get('bucket', 'c'), ('"etag"', b'body'))
+        self.assertEqual(2, len(cache.memory))
+
+    def test_reads_from_disk_tier(self):
+        cache = ObjectCache(directory=self.directory)
+        cache.set('bucket', 'key', '"etag"', b'body')
+        cache = ObjectCache(directory=self.directory)
+        self.assertEqual(('"etag"', b'body'), cache.get('bucket', 'key'))
+        cache.delete('bucket', 'key')
+        self.assertIsNone(ObjectCache(directory=self.directory)
+                          .get('bucket', 'key'))
+
+    def test_prunes_disk_tier(self):
+        cache = ObjectCache(maxsize=1, directory=self.directory,
+                            disk_maxsize=2)
+        # mtimes are set apart, files written in the same tick would tie
+        for mtime, key in [(1000, 'a'), (2000, 'b')]:
+            cache.set('bucket', key, '"etag"', b'body')
+            os.utime(cache._path('bucket', key), (mtime, mtime))
+        # reading from disk marks the file as used
+        self.assertIsNotNone(cache.get('bucket', 'a'))
+        cache.set('bucket', 'c', '"etag"', b'body')
+        self.assertTrue(os.path.exists(cache._path('bucket', 'a')))
+        self.assertFalse(os.path.exists(cache._path('bucket', 'b')))
+        self.assertTrue(os.path.exists(cache._path('bucket', 'c')))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import unittest
+
+from markdown import markdown
+from mdx_gfm import GithubFlavoredMarkdownExtension
+
+from app.utils.codehilite import CachedCodeHilite, \
+    CachedCodeHiliteExtension, CodeHilite, highlight_cache, \
+    HIGHLIGHT_CACHE_MAX_BLOCK_SIZE
+
+
+class CachedCodeHiliteTestCase(unittest.TestCase):
+    readme = '# Data\n\n```json\n{"name": "test"}\n```\n\n' \
+             '    indented = True\n\n```\nplain\n```\n'
+
+    def setUp(self):
+        highlight_cache.clear()
+
+    def render(self, extension, text=readme):
+        return markdown(text, extensions=[GithubFlavoredMarkdownExtension(),
+                                          extension])
+
+    def test_same_html_as_codehilite(self):
+        for lang in ('json', None):
+            self.assertEqual(
+                CachedCodeHilite('{"name": "test"}', lang=lang).hilite(),
+                CodeHilite('{"name": "test"}', lang=lang).hilite())
+        self.assertIn('codehilite', self.render(CachedCodeHiliteExtension()))
+
+    def test_caches_code_blocks(self):
+        first = self.render(CachedCodeHiliteExtension())
+        self.assertEqual(highlight_cache.misses, 3)
+        self.assertEqual(highlight_cache.hits, 0)
+        self.assertEqual(self.render(CachedCodeHiliteExtension()), first)
+        self.assertEqual(highlight_cache.hits, 3)
+        self.assertEqual(len(highlight_cache), 3)
+
+    def test_language_is_part_of_key(self):
+        self.render(CachedCodeHiliteExtension(), '```json\n1\n```')
+        self.render(CachedCodeHiliteExtension(), '```python\n1\n```')
+        self.assertEqual(highlight_cache.misses, 2)
+
+    def test_does_not_cache_big_blocks(self):
+        code = 'x = 1\n' * (HIGHLIGHT_CACHE_MAX_BLOCK_SIZE // 8)
+        CachedCodeHilite(code, lang='python').hilite()
+        self.assertEqual(len(highlight_cache), 0)
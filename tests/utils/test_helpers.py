@@ -4,7 +4,8 @@ from __future__ import print_function
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
-from app.utils.helpers import text_to_markdown, dp_in_readme
+from app.utils.helpers import text_to_markdown, dp_in_readme, render_readme
+from mock import patch
 import unittest
 import json
 
@@ -42,3 +43,31 @@ class DpInReadmeTestCase(unittest.TestCase):
         self.assertEqual(dp_in_readme(readme_with_variable, dp), dp_expected)
         self.assertEqual(dp_in_readme(readme_without_variable, dp),
                         readme_without_variable)
+
+    def test_skips_readme_without_variables(self):
+        with patch('app.utils.helpers.json.dumps') as dumps:
+            readme = '# Title'
+            self.assertIs(dp_in_readme(readme, {'name': 'test'}), readme)
+            self.assertFalse(dumps.called)
+
+    def test_skips_readme_with_other_variables(self):
+        with patch('app.utils.helpers.json.dumps') as dumps:
+            readme = '# Title {{ name }}'
+            self.assertIs(dp_in_readme(readme, {'name': 'test'}), readme)
+            self.assertFalse(dumps.called)
+
+
+class RenderReadmeTestCase(unittest.TestCase):
+    def test_renders_html_and_summary(self):
+        html, short = render_readme('# Title\n\nFirst *para*\n\nSecond', {})
+        self.assertEqual(html, text_to_markdown('# Title\n\nFirst *para*\n\nSecond'))
+        self.assertEqual(short, 'Title First para Second')
+
+    def test_replaces_dp_variables_in_html_only(self):
+        dp = {'name': 'test'}
+        html, short = render_readme('about {{ dp }}', dp)
+        self.assertIn('<span class="s2">"test"</span>', html)
+        self.assertEqual(short, 'about {{ dp }}')
+
+    def test_handles_missing_readme_and_descriptor(self):
+        self.assertEqual(render_readme(None, None), ('', ''))
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import datetime
+import unittest
+
+from flask import Flask
+
+from app.utils.http import make_etag, is_not_modified, conditional_response, \
+    external_url
+
+
+class ConditionalResponseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['HTTP_CACHE_MAX_AGE'] = 0
+        self.etag = make_etag(1, datetime.datetime(2017, 1, 1))
+        self.last_modified = datetime.datetime(2017, 1, 1, 10, 0, 0, 500)
+
+    def test_make_etag_depends_on_stamps(self):
+        self.assertEqual(make_etag(1, 'a'), make_etag(1, 'a'))
+        self.assertNotEqual(make_etag(1, 'a'), make_etag(1, 'b'))
+
+    def test_not_modified_if_etag_matches(self):
+        headers = {'If-None-Match': '"%s"' % self.etag}
+        with self.app.test_request_context(headers=headers):
+            self.assertTrue(is_not_modified(self.etag))
+        with self.app.test_request_context(headers={'If-None-Match': '"x"'}):
+            self.assertFalse(is_not_modified(self.etag, self.last_modified))
+
+    def test_not_modified_since(self):
+        headers = {'If-Modified-Since': 'Sun, 01 Jan 2017 10:00:00 GMT'}
+        with self.app.test_request_context(headers=headers):
+            self.assertTrue(is_not_modified(self.etag, self.last_modified))
+            self.assertFalse(is_not_modified(
+                self.etag, self.last_modified + datetime.timedelta(seconds=1)))
+            self.assertFalse(is_not_modified(self.etag))
+
+    def test_does_not_build_response_if_not_modified(self):
+        def build_response():
+            raise AssertionError('should not be called')
+
+        headers = {'If-None-Match': '"%s"' % self.etag}
+        with self.app.test_request_context(headers=headers):
+            response = conditional_response(self.etag, self.last_modified,
+                                            build_response)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_etag(), (self.etag, False))
+
+    def test_sets_validators(self):
+        with self.app.test_request_context():
+            response = conditional_response(self.etag, self.last_modified,
+                                            lambda: 'body')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, b'body')
+        self.assertEqual(response.headers['Last-Modified'],
+                         'Sun, 01 Jan 2017 10:00:00 GMT')
+        self.assertEqual(response.headers['Cache-Control'],
+                         'public, max-age=0')
+
+
+class ExternalUrlTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['API_URL'] = 'https://api.example.com'
+        self.app.add_url_rule('/api/package/<publisher>/<path:path>',
+                              'file', lambda publisher, path: '')
+
+    def test_uses_api_url_instead_of_request(self):
+        url = 'https://api.example.com/api/package/core/data/file.csv'
+        with self.app.app_context():
+            self.assertEqual(external_url('file', publisher='core',
+                                          path='data/file.csv'), url)
+        with self.app.test_request_context(base_url='http://localhost'):
+            self.assertEqual(external_url('file', publisher='core',
+                                          path='data/file.csv'), url)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import unittest
+
+from flask import Flask
+
+from app.utils.helpers import text_to_markdown
+from app.utils.rendering import MarkdownRenderer
+
+
+class MarkdownRendererTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.app_context().push()
+
+    def test_renders_inline(self):
+        renderer = MarkdownRenderer()
+        self.assertEqual(renderer.render('# Title'), '<h1>Title</h1>')
+
+    def test_escapes_text_over_max_size(self):
+        renderer = MarkdownRenderer(max_size=5)
+        self.assertEqual(renderer.render('<b>bold</b>'),
+                         '<pre>&lt;b&gt;bold&lt;/b&gt;</pre>')
+
+    def test_renders_many_in_pool(self):
+        renderer = MarkdownRenderer(pool_size=2, max_size=20)
+        try:
+            texts = ['# Title', '*' * 30, '> quote']
+            self.assertEqual(renderer.render_many(texts),
+                             [text_to_markdown('# Title'),
+                              '<pre>{0}</pre>'.format('*' * 30),
+                              text_to_markdown('> quote')])
+        finally:
+            renderer.close()
+
+    def test_escapes_text_on_timeout_and_restarts_pool(self):
+        renderer = MarkdownRenderer(pool_size=1, timeout=0.00001)
+        try:
+            pool = renderer.pool
+            texts = ['# Title\n' * 1000] * 2
+            self.assertEqual(renderer.render_many(texts),
+                             ['<pre>{0}</pre>'.format(text) for text in texts])
+            self.assertIsNot(renderer.pool, pool)
+        finally:
+            renderer.close()
+
+    def test_restart_keeps_pool_until_other_renders_are_done(self):
+        renderer = MarkdownRenderer(pool_size=1)
+        try:
+            pool = renderer._acquire()
+            renderer._restart(pool)
+            self.assertEqual(renderer.render_many(['> quote']),
+                             [text_to_markdown('> quote')])
+            # still usable by the thread rendering with it
+            self.assertEqual(
+                pool.apply_async(text_to_markdown, ('# Title',)).get(5),
+                text_to_markdown('# Title'))
+            renderer._release(pool)
+            with self.assertRaises((AssertionError, ValueError)):
+                pool.apply_async(text_to_markdown, ('# Title',))
+        finally:
+            renderer.close()